@@ -75,11 +75,11 @@ def main():
     try:
         # Initialize Neo4j connection
         neo4j_manager = Neo4jManager()
-        neo4j_manager.create_constraints()
+        neo4j_manager.ensure_constraints()
         logger.info("Neo4j connection established and schema constraints verified")
         
         # Initialize action item processor
-        processor = ActionItemProcessor()
+        processor = ActionItemProcessor(neo4j=neo4j_manager)
         logger.info("Action item processor initialized")
         
         # Start components based on arguments
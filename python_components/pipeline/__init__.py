@@ -3,7 +3,7 @@ ICAP pipeline package.
 """
 from python_components.pipeline.orchestrator import PipelineOrchestrator, PipelineContext, PipelineStep
 from python_components.pipeline.webhook import WebhookHandler
-from python_components.pipeline.queue import MessageQueue, AsyncMessageQueue, Message
+from python_components.pipeline.queue import MessageQueue, AsyncMessageQueue, Message, FsyncPolicy
 from python_components.pipeline.errors import (
     PipelineError, TemporaryError, PermanentError, APIError,
     ResourceNotFoundError, ConfigurationError,
@@ -18,7 +18,7 @@ __all__ = [
     'WebhookHandler',
     
     # Queue
-    'MessageQueue', 'AsyncMessageQueue', 'Message',
+    'MessageQueue', 'AsyncMessageQueue', 'Message', 'FsyncPolicy',
     
     # Errors
     'PipelineError', 'TemporaryError', 'PermanentError', 'APIError',
@@ -6,8 +6,9 @@ import json
 import logging
 import asyncio
 import traceback
+from collections import deque
 from datetime import datetime
-from typing import Dict, Any, List, Optional, Callable, Awaitable, Union
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Union, Deque
 from dataclasses import dataclass, field
 
 from python_components.utils.neo4j_manager import Neo4jManager
@@ -15,6 +16,9 @@ from python_components.processors.action_item_processor import ActionItemProcess
 
 logger = logging.getLogger("icap.pipeline")
 
+# Maximum number of pipeline contexts kept in memory
+PIPELINE_HISTORY_LIMIT = 1000
+
 @dataclass
 class PipelineStep:
     """Represents a step in the processing pipeline."""
@@ -85,9 +89,10 @@ class PipelineOrchestrator:
     def __init__(self):
         """Initialize the pipeline orchestrator."""
         self.neo4j = Neo4jManager()
-        self.processor = ActionItemProcessor()
+        self.processor = ActionItemProcessor(neo4j=self.neo4j)
         self.steps: Dict[str, PipelineStep] = {}
-        self.pipeline_history: List[PipelineContext] = []
+        self.pipeline_history: Deque[PipelineContext] = deque(maxlen=PIPELINE_HISTORY_LIMIT)
+        self.total_pipelines = 0
         self._setup_pipelines()
         logger.info("Pipeline orchestrator initialized")
     
@@ -173,7 +178,8 @@ class PipelineOrchestrator:
                 
                 try:
                     start_time = datetime.now()
-                    result = step.function(current_input)
+                    # Steps block on Neo4j and Claude, so keep them off the event loop
+                    result = await asyncio.to_thread(step.function, current_input)
                     execution_time = (datetime.now() - start_time).total_seconds()
                     step.execution_time = execution_time
                     
@@ -195,7 +201,7 @@ class PipelineOrchestrator:
             
             # Pipeline completed successfully
             context.complete("completed")
-            self.pipeline_history.append(context)
+            self._record_pipeline(context)
             logger.info(f"Email pipeline completed successfully")
             return context
             
@@ -203,7 +209,7 @@ class PipelineOrchestrator:
             context.status = "failed"
             context.error = str(e)
             context.end_time = datetime.now()
-            self.pipeline_history.append(context)
+            self._record_pipeline(context)
             logger.error(f"Email pipeline failed: {str(e)}")
             return context
     
@@ -238,7 +244,8 @@ class PipelineOrchestrator:
                 
                 try:
                     start_time = datetime.now()
-                    result = step.function(current_input)
+                    # Steps block on Neo4j and Claude, so keep them off the event loop
+                    result = await asyncio.to_thread(step.function, current_input)
                     execution_time = (datetime.now() - start_time).total_seconds()
                     step.execution_time = execution_time
                     
@@ -260,7 +267,7 @@ class PipelineOrchestrator:
             
             # Pipeline completed successfully
             context.complete("completed")
-            self.pipeline_history.append(context)
+            self._record_pipeline(context)
             logger.info(f"Slack pipeline completed successfully")
             return context
             
@@ -268,7 +275,7 @@ class PipelineOrchestrator:
             context.status = "failed"
             context.error = str(e)
             context.end_time = datetime.now()
-            self.pipeline_history.append(context)
+            self._record_pipeline(context)
             logger.error(f"Slack pipeline failed: {str(e)}")
             return context
     
@@ -297,11 +304,12 @@ class PipelineOrchestrator:
                 try:
                     start_time = datetime.now()
                     
-                    # Handle the first step that doesn't need input
+                    # Handle the first step that doesn't need input; steps block on
+                    # Neo4j and Claude, so keep them off the event loop
                     if step.input_type == "void":
-                        result = step.function()
+                        result = await asyncio.to_thread(step.function)
                     else:
-                        result = step.function(current_input)
+                        result = await asyncio.to_thread(step.function, current_input)
                         
                     execution_time = (datetime.now() - start_time).total_seconds()
                     step.execution_time = execution_time
@@ -324,7 +332,7 @@ class PipelineOrchestrator:
             
             # Pipeline completed successfully
             context.complete("completed")
-            self.pipeline_history.append(context)
+            self._record_pipeline(context)
             logger.info(f"Summary pipeline completed successfully")
             return context
             
@@ -332,17 +340,37 @@ class PipelineOrchestrator:
             context.status = "failed"
             context.error = str(e)
             context.end_time = datetime.now()
-            self.pipeline_history.append(context)
+            self._record_pipeline(context)
             logger.error(f"Summary pipeline failed: {str(e)}")
             return context
     
+    def _record_pipeline(self, context: PipelineContext) -> None:
+        """Add a finished pipeline to the bounded history and count it."""
+        self.pipeline_history.append(context)
+        self.total_pipelines += 1
+    
     def get_pipeline_history(self) -> List[Dict[str, Any]]:
         """Get the history of pipeline executions."""
         return [context.to_dict() for context in self.pipeline_history]
     
     def clear_history(self) -> None:
         """Clear the pipeline execution history."""
-        self.pipeline_history = []
+        self.pipeline_history.clear()
+    
+    def start(self) -> None:
+        """
+        Prepare the orchestrator for serving pipelines.
+        
+        Ensures the Neo4j schema constraints and starts writing action items in
+        the background. Called from the server and scheduler start-up paths, so
+        constructing an orchestrator does not need a live database.
+        """
+        self.neo4j.ensure_constraints()
+        self.processor.start_background_writes()
+    
+    def close(self) -> None:
+        """Write any buffered action items and stop background work."""
+        self.processor.close()
     
     # Mock functions that will be replaced with actual implementations
     def _mock_retrieve_email(self, query: Dict[str, Any]) -> List[Dict[str, Any]]:
@@ -3,21 +3,55 @@ Message queue system for ICAP pipeline.
 """
 import os
 import time
-import json
-import uuid
+import heapq
+import inspect
+import itertools
+import mmap
 import logging
 import asyncio
 import threading
-from typing import Dict, Any, List, Optional, Callable, Set, Union
+import orjson
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Deque, List, Optional, Callable, Set, Tuple
 from dataclasses import dataclass, asdict, field
 from datetime import datetime, timedelta
-from queue import Queue, PriorityQueue, Empty
+from enum import Enum
+from queue import Empty
+
+from python_components.utils.ids import new_id, new_ids
+from python_components.utils.timestamps import parse_timestamp
 
 logger = logging.getLogger("icap.queue")
 
-@dataclass
+# Most ready messages the process loop takes off the heap per lock acquisition
+DRAIN_BATCH_SIZE = 64
+
+# How often the background committer writes buffered log records, in seconds
+WAL_FLUSH_INTERVAL = 0.01
+
+# Buffered log bytes that wake the committer before the interval elapses
+WAL_BUFFER_BYTES = 64 * 1024
+
+# Log records appended before the queue is snapshotted and the log truncated
+WAL_SNAPSHOT_EVERY = 1000
+
+class FsyncPolicy(Enum):
+    """When enqueued messages are forced to disk."""
+    ALWAYS = "always"      # Write and fsync on every enqueue
+    PERIODIC = "periodic"  # Group-commit with one write and fsync per flush interval
+    NEVER = "never"        # Write per flush interval and leave syncing to the OS
+
+@dataclass(slots=True)
 class Message:
-    """Message to be processed in the pipeline."""
+    """
+    Message to be processed in the pipeline.
+    
+    The (priority, timestamp) ordering key and the scheduled timestamp are
+    cached as floats whenever scheduled_time is assigned, so heap comparisons
+    and is_ready() never touch datetime objects.
+    """
     id: str
     type: str
     data: Dict[str, Any]
@@ -28,10 +62,32 @@ class Message:
     max_retries: int = 3
     scheduled_time: Optional[datetime] = None
     error: Optional[str] = None
+    _scheduled_ts: Optional[float] = field(init=False, repr=False, compare=False)
+    _sort_key: Tuple[int, float] = field(init=False, repr=False, compare=False)
+    
+    def __setattr__(self, name: str, value: Any) -> None:
+        """Set an attribute, refreshing the cached timestamps when scheduled_time changes."""
+        object.__setattr__(self, name, value)
+        # The generated __init__ assigns scheduled_time after priority and created_at
+        if name == "scheduled_time":
+            scheduled_ts = value.timestamp() if value else None
+            object.__setattr__(self, "_scheduled_ts", scheduled_ts)
+            object.__setattr__(self, "_sort_key", (self.priority, scheduled_ts or self.created_at.timestamp()))
+    
+    def reschedule(self, scheduled_time: Optional[datetime]) -> None:
+        """
+        Change when the message should be processed.
+        
+        Args:
+            scheduled_time: New time to process the message (None for immediately)
+        """
+        self.scheduled_time = scheduled_time
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert message to dictionary."""
         result = asdict(self)
+        for cached in ("_scheduled_ts", "_sort_key"):
+            del result[cached]
         result["created_at"] = self.created_at.isoformat()
         if self.scheduled_time:
             result["scheduled_time"] = self.scheduled_time.isoformat()
@@ -39,72 +95,480 @@ class Message:
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'Message':
-        """Create message from dictionary."""
-        if isinstance(data["created_at"], str):
-            data["created_at"] = datetime.fromisoformat(data["created_at"])
-        if "scheduled_time" in data and data["scheduled_time"] and isinstance(data["scheduled_time"], str):
-            data["scheduled_time"] = datetime.fromisoformat(data["scheduled_time"])
+        """Create message from dictionary, accepting ISO 8601 strings or epoch seconds for timestamps."""
+        data["created_at"] = parse_timestamp(data["created_at"])
+        if data.get("scheduled_time"):
+            data["scheduled_time"] = parse_timestamp(data["scheduled_time"])
         return cls(**data)
     
     def is_ready(self) -> bool:
         """Check if the message is ready to be processed."""
-        if self.scheduled_time:
-            return datetime.now() >= self.scheduled_time
-        return True
+        return self._scheduled_ts is None or self._scheduled_ts <= time.time()
     
     def __lt__(self, other: 'Message') -> bool:
         """Compare messages for priority queue ordering."""
-        if self.priority != other.priority:
-            return self.priority < other.priority
+        return self._sort_key < other._sort_key
+
+class _MessageHeap:
+    """
+    Thread-safe priority heap of messages.
+    
+    Entries are (sort_key, sequence, message) tuples built from the message's
+    cached ordering key when it is put, so ordering is decided by C-level tuple
+    comparison rather than Message.__lt__. The sequence keeps ties in insertion
+    order.
+    
+    Messages scheduled for the future wait in a second heap ordered by their
+    scheduled timestamp and are promoted to the ready heap once due, so
+    taking the next ready message never pops and re-pushes future ones.
+    """
+    
+    def __init__(self):
+        self._heap: List[tuple] = []
+        self._scheduled: List[tuple] = []
+        self._sequence = itertools.count()
+        self._not_empty = threading.Condition(threading.Lock())
+    
+    def _push(self, message: Message, now: float) -> None:
+        """Push a message onto the heap matching its schedule. Caller holds the lock."""
+        scheduled_ts = message._scheduled_ts
+        if scheduled_ts is not None and scheduled_ts > now:
+            heapq.heappush(self._scheduled, (scheduled_ts, next(self._sequence), message))
+        else:
+            heapq.heappush(self._heap, (message._sort_key, next(self._sequence), message))
+    
+    def _promote(self, now: float) -> None:
+        """Move scheduled messages that are due onto the ready heap. Caller holds the lock."""
+        while self._scheduled and self._scheduled[0][0] <= now:
+            _, sequence, message = heapq.heappop(self._scheduled)
+            heapq.heappush(self._heap, (message._sort_key, sequence, message))
+    
+    def _wait_ready(self, timeout: Optional[float]) -> bool:
+        """
+        Wait until a message is ready, promoting scheduled ones as they fall due.
         
-        if self.scheduled_time and other.scheduled_time:
-            return self.scheduled_time < other.scheduled_time
+        Caller holds the lock.
         
-        if self.scheduled_time:
-            return self.scheduled_time < datetime.now()
+        Args:
+            timeout: Seconds to wait (None waits forever)
+            
+        Returns:
+            True if a ready message is available
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            now = time.time()
+            self._promote(now)
+            if self._heap:
+                return True
+            
+            # Sleep until the deadline or the next scheduled message, whichever is first
+            wait = None if deadline is None else deadline - time.monotonic()
+            if wait is not None and wait <= 0:
+                return False
+            if self._scheduled:
+                due = self._scheduled[0][0] - now
+                wait = due if wait is None else min(wait, due)
+            self._not_empty.wait(wait)
+    
+    def put(self, message: Message) -> None:
+        """Add a message to the heap."""
+        with self._not_empty:
+            self._push(message, time.time())
+            self._not_empty.notify()
+    
+    def put_many(self, messages: List[Message]) -> None:
+        """Add several messages to the heap under a single lock acquisition."""
+        if not messages:
+            return
+        
+        with self._not_empty:
+            now = time.time()
+            ready = []
+            for message in messages:
+                scheduled_ts = message._scheduled_ts
+                if scheduled_ts is not None and scheduled_ts > now:
+                    heapq.heappush(self._scheduled, (scheduled_ts, next(self._sequence), message))
+                else:
+                    ready.append((message._sort_key, next(self._sequence), message))
+            
+            # Re-heapifying is O(n), so it wins once the batch outgrows the heap
+            if len(ready) > len(self._heap):
+                self._heap.extend(ready)
+                heapq.heapify(self._heap)
+            else:
+                for entry in ready:
+                    heapq.heappush(self._heap, entry)
+            self._not_empty.notify(len(messages))
+    
+    def get(self, timeout: Optional[float] = None) -> Message:
+        """
+        Remove and return the highest priority ready message.
+        
+        Args:
+            timeout: Seconds to wait for a ready message (None waits forever)
+            
+        Returns:
+            The next message
             
-        if other.scheduled_time:
-            return datetime.now() < other.scheduled_time
+        Raises:
+            Empty: If no message became ready within the timeout
+        """
+        with self._not_empty:
+            if not self._wait_ready(timeout):
+                raise Empty
+            return heapq.heappop(self._heap)[-1]
+    
+    def drain_ready(self, limit: int, timeout: float = 0) -> List[Message]:
+        """
+        Remove up to limit messages that are ready, in priority order.
+        
+        Args:
+            limit: Maximum number of messages to remove
+            timeout: Seconds to wait for a message to become ready
             
-        return self.created_at < other.created_at
+        Returns:
+            The removed messages, possibly none
+        """
+        with self._not_empty:
+            if not self._wait_ready(timeout):
+                return []
+            
+            ready: List[Message] = []
+            while self._heap and len(ready) < limit:
+                ready.append(heapq.heappop(self._heap)[-1])
+            return ready
+    
+    def next_scheduled_delay(self) -> Optional[float]:
+        """Return seconds until the earliest scheduled message is due, or None if none are scheduled."""
+        with self._not_empty:
+            if not self._scheduled:
+                return None
+            return max(0.0, self._scheduled[0][0] - time.time())
+    
+    def snapshot(self) -> List[Message]:
+        """Return the queued messages in priority order without removing them."""
+        with self._not_empty:
+            messages = [entry[-1] for entry in self._heap]
+            messages.extend(entry[-1] for entry in self._scheduled)
+        messages.sort(key=lambda message: message._sort_key)
+        return messages
+    
+    def qsize(self) -> int:
+        """Return the number of queued messages, including scheduled ones."""
+        return len(self._heap) + len(self._scheduled)
+    
+    def empty(self) -> bool:
+        """Return True if no messages are queued."""
+        return not self._heap and not self._scheduled
 
-class MessageQueue:
+def _read_snapshot(path: str) -> Dict[str, Any]:
     """
-    Message queue for passing data between components.
+    Parse a snapshot file without copying it into a Python bytes object first.
     
-    Supports:
-    - Message prioritization
-    - Scheduled message delivery
-    - Message persistence (optional)
-    - Retry handling
+    Args:
+        path: Snapshot file to read
+    
+    Returns:
+        Parsed snapshot
+    """
+    with open(path, 'rb') as f:
+        # mmap refuses empty files; let orjson report those as invalid JSON
+        if os.fstat(f.fileno()).st_size == 0:
+            return orjson.loads(b"")
+        
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                return orjson.loads(view)
+
+class _QueueStore:
     """
+    Snapshot file plus write-ahead log backing a message queue.
     
-    def __init__(self, 
-                 persistence_file: Optional[str] = None,
-                 max_messages: int = 1000,
-                 persistence_interval: int = 60):
+    Every enqueued message is appended to a log next to the snapshot file.
+    While the committer thread runs, appends are coalesced into one write (and
+    fsync) per flush interval; otherwise the owning queue commits them itself.
+    The snapshot is rewritten every WAL_SNAPSHOT_EVERY appends and whenever the
+    queue persists, after which the log is truncated. Loading replays the log
+    on top of the snapshot, so messages processed after the last snapshot may
+    be delivered again.
+    """
+    
+    def __init__(self,
+                 persistence_file: str,
+                 fsync_policy: FsyncPolicy,
+                 snapshot_source: Callable[[], Dict[str, Any]]):
         """
-        Initialize the message queue.
+        Initialize the store.
         
         Args:
-            persistence_file: File to persist messages to (optional)
-            max_messages: Maximum number of messages to keep in the queue
-            persistence_interval: Interval in seconds for persisting messages
+            persistence_file: Snapshot file; the log is written next to it
+            fsync_policy: When appended records are forced to disk
+            snapshot_source: Returns the queued, processed and stats state to snapshot
+        """
+        self.persistence_file = persistence_file
+        self.wal_file = f"{persistence_file}.wal"
+        self.fsync_policy = fsync_policy
+        self.committing = False
+        self._snapshot_source = snapshot_source
+        
+        # _lock guards the buffer; _io_lock serializes log writes against
+        # snapshots that truncate the log
+        self._buffer: List[bytes] = []
+        self._buffered = 0
+        self._appends = 0
+        self._fd: Optional[int] = None
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def load(self) -> Tuple[List[Message], List[Message], Dict[str, Any]]:
+        """
+        Read the snapshot and replay the log written after it.
+        
+        Returns:
+            Tuple of queued messages, processed messages and saved stats
+        """
+        queued: List[Message] = []
+        processed: List[Message] = []
+        stats: Dict[str, Any] = {}
+        
+        if os.path.exists(self.persistence_file):
+            try:
+                data = _read_snapshot(self.persistence_file)
+                
+                queued = [Message.from_dict(msg_dict) for msg_dict in data.get("queue", [])]
+                processed = [Message.from_dict(msg_dict) for msg_dict in data.get("processed", [])]
+                stats = data.get("stats", {})
+                
+                logger.info(f"Loaded {len(queued)} queued and {len(processed)} processed messages from persistence file")
+            
+            except Exception as e:
+                logger.error(f"Error loading persisted queue: {str(e)}")
+        
+        if os.path.exists(self.wal_file):
+            known = {message.id for message in queued}
+            known.update(message.id for message in processed)
+            
+            replayed = []
+            for message in self._read_wal():
+                if message.id not in known:
+                    known.add(message.id)
+                    replayed.append(message)
+            
+            queued.extend(replayed)
+            logger.info(f"Replayed {len(replayed)} messages from queue log")
+        
+        return queued, processed, stats
+    
+    def _read_wal(self) -> List[Message]:
+        """Parse the messages recorded in the log."""
+        try:
+            with open(self.wal_file, 'rb') as f:
+                lines = f.read().splitlines()
+        except OSError as e:
+            logger.error(f"Error reading queue log: {str(e)}")
+            return []
+        
+        messages = []
+        for line in lines:
+            try:
+                messages.append(Message.from_dict(orjson.loads(line)))
+            except (orjson.JSONDecodeError, KeyError, TypeError):
+                # A crash mid-write can leave a torn final record
+                logger.warning("Skipping unreadable queue log record")
+        return messages
+    
+    def append(self, messages: List[Message]) -> bool:
+        """
+        Buffer log records for newly enqueued messages.
+        
+        Messages must already be queued, so a snapshot taken after the records
+        are buffered always contains them.
+        
+        Args:
+            messages: Newly enqueued messages
+        
+        Returns:
+            True if the caller must call commit(), False if the committer
+            thread will write the records
         """
-        self.queue = PriorityQueue()
-        self.processed = []
+        # orjson appends the newline itself, saving a concatenation copy per record
+        records = b"".join([orjson.dumps(message, option=orjson.OPT_APPEND_NEWLINE) for message in messages])
+        
+        with self._lock:
+            self._buffer.append(records)
+            self._buffered += len(records)
+            self._appends += len(messages)
+            snapshot_due = self._appends >= WAL_SNAPSHOT_EVERY
+            flush_due = self._buffered >= WAL_BUFFER_BYTES
+        
+        if snapshot_due or self.fsync_policy is FsyncPolicy.ALWAYS or not self.committing:
+            return True
+        
+        if flush_due:
+            self._wakeup.set()
+        return False
+    
+    def commit(self) -> None:
+        """Write the buffered records, or snapshot if enough have built up since the last one."""
+        with self._lock:
+            snapshot_due = self._appends >= WAL_SNAPSHOT_EVERY
+        
+        if snapshot_due:
+            self.persist()
+        else:
+            self.flush()
+    
+    def flush(self) -> None:
+        """Write buffered log records in one call, syncing them unless the policy is NEVER."""
+        with self._io_lock:
+            with self._lock:
+                if not self._buffer:
+                    return
+                records = b"".join(self._buffer)
+                self._buffer = []
+                self._buffered = 0
+            
+            try:
+                self._write(records)
+            except OSError as e:
+                logger.error(f"Error writing queue log: {str(e)}")
+    
+    def _write(self, records: bytes) -> None:
+        """Append raw records to the log file. Caller holds _io_lock."""
+        if self._fd is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.wal_file)), exist_ok=True)
+            self._fd = os.open(self.wal_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        
+        view = memoryview(records)
+        while view:
+            view = view[os.write(self._fd, view):]
+        
+        if self.fsync_policy is not FsyncPolicy.NEVER:
+            os.fsync(self._fd)
+    
+    def start(self) -> None:
+        """Start the group-commit thread, unless every append is synced inline."""
+        if self.fsync_policy is FsyncPolicy.ALWAYS or self.committing:
+            return
+        
+        self.committing = True
+        self._thread = threading.Thread(target=self._commit_loop)
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def stop(self) -> None:
+        """Stop the committer thread once it has written what is buffered."""
+        if self._thread and self._thread.is_alive():
+            self.committing = False
+            self._wakeup.set()
+            self._thread.join(timeout=2.0)
+        self.committing = False
+        self._thread = None
+    
+    def _commit_loop(self) -> None:
+        """Group-commit buffered log records until stopped."""
+        while self.committing:
+            self._wakeup.wait(WAL_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            self.flush()
+        
+        # Commit whatever was appended while shutting down
+        self.flush()
+    
+    def persist(self) -> None:
+        """Snapshot the queue to the persistence file and truncate the log."""
+        with self._io_lock:
+            # Buffered records belong to messages already queued, so the
+            # snapshot covers them; keep them only in case the snapshot fails
+            with self._lock:
+                pending = b"".join(self._buffer)
+                self._buffer = []
+                self._buffered = 0
+                self._appends = 0
+            
+            try:
+                self._write_snapshot()
+                if self._fd is not None:
+                    os.ftruncate(self._fd, 0)
+                elif os.path.exists(self.wal_file):
+                    os.truncate(self.wal_file, 0)
+            
+            except Exception as e:
+                logger.error(f"Error persisting queue to file: {str(e)}")
+                if pending:
+                    try:
+                        self._write(pending)
+                    except OSError as wal_error:
+                        logger.error(f"Error writing queue log: {str(wal_error)}")
+    
+    def _write_snapshot(self) -> None:
+        """Write the owner's queued and processed messages to the snapshot file."""
+        data = self._snapshot_source()
+        
+        # orjson serializes the Message dataclasses and their datetimes natively
+        data["timestamp"] = datetime.now()
+        payload = orjson.dumps(data)
+        
+        # Create directory if it doesn't exist
+        os.makedirs(os.path.dirname(os.path.abspath(self.persistence_file)), exist_ok=True)
+        
+        # Write to a temporary file first, then rename to avoid corruption if the process crashes
+        temp_file = f"{self.persistence_file}.tmp"
+        with open(temp_file, 'wb') as f:
+            f.write(payload)
+            # The log is truncated next, so the snapshot must reach the disk first
+            if self.fsync_policy is not FsyncPolicy.NEVER:
+                f.flush()
+                os.fsync(f.fileno())
+        
+        os.replace(temp_file, self.persistence_file)
+        
+        logger.debug(f"Persisted {len(data['queue'])} queued and {len(data['processed'])} processed messages")
+    
+    def close(self) -> None:
+        """Close the log file descriptor."""
+        with self._io_lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+class _QueueBase(ABC):
+    """
+    State and bookkeeping shared by MessageQueue and AsyncMessageQueue.
+    
+    Subclasses create their own queue before calling __init__ and implement
+    _put, _put_many and _queued_messages on top of it.
+    """
+    
+    def __init__(self,
+                 persistence_file: Optional[str],
+                 max_messages: int,
+                 persistence_interval: int,
+                 fsync_policy: FsyncPolicy,
+                 max_workers: int,
+                 retry_enabled: bool):
+        # Recent processed messages; the oldest drop off once max_messages is reached
+        self.processed: Deque[Message] = deque(maxlen=max_messages)
         self.running = False
-        self.handlers: Dict[str, List[Callable[[Message], Any]]] = {}
+        # Tuples are replaced rather than mutated, so the process loop can iterate
+        # a type's handlers without copying them while new ones are registered
+        self.handlers: Dict[str, Tuple[Callable[[Message], Any], ...]] = {}
         self.max_messages = max_messages
         self.persistence_file = persistence_file
         self.persistence_interval = persistence_interval
+        self.fsync_policy = fsync_policy
+        self.max_workers = max_workers
+        self.retry_enabled = retry_enabled
         self.message_count = 0
         
         # Set for tracking message IDs to avoid duplicates
         self.message_ids: Set[str] = set()
         
         # Statistics
-        self.stats = {
+        self.stats: Dict[str, Any] = {
             "enqueued": 0,
             "processed": 0,
             "retried": 0,
@@ -112,11 +576,242 @@ class MessageQueue:
             "start_time": datetime.now()
         }
         
+        # Handlers may finish on worker threads, so results are recorded under a lock
+        self._results_lock = threading.Lock()
+        
+        self._store: Optional[_QueueStore] = None
+        self.wal_file: Optional[str] = None
+        if persistence_file:
+            self._store = _QueueStore(persistence_file, fsync_policy, self._snapshot_state)
+            self.wal_file = self._store.wal_file
+            
+            # Load persisted messages if available
+            self._restore(*self._store.load())
+    
+    @abstractmethod
+    def _put(self, message: Message) -> None:
+        """Add a message to the underlying queue."""
+    
+    @abstractmethod
+    def _put_many(self, messages: List[Message]) -> None:
+        """Add several messages to the underlying queue."""
+    
+    @abstractmethod
+    def _queued_messages(self) -> List[Message]:
+        """Return the queued messages in priority order."""
+    
+    def _restore(self, queued: List[Message], processed: List[Message], stats: Dict[str, Any]) -> None:
+        """Put loaded messages and stats back in place."""
+        self._put_many(queued)
+        self.message_ids.update(message.id for message in queued)
+        self.message_count += len(queued)
+        
+        self.processed.extend(processed)
+        self.message_ids.update(message.id for message in processed)
+        
+        for key, value in stats.items():
+            if key in self.stats:
+                self.stats[key] = value
+        
+        # Convert start_time from string if needed
+        if isinstance(self.stats["start_time"], str):
+            self.stats["start_time"] = datetime.fromisoformat(self.stats["start_time"])
+    
+    def _snapshot_state(self) -> Dict[str, Any]:
+        """Return the state written to the snapshot file."""
+        with self._results_lock:
+            processed = list(self.processed)
+        
+        return {
+            "queue": self._queued_messages(),
+            "processed": processed,
+            "stats": self.stats
+        }
+    
+    def _add_handler(self, message_type: str, handler: Callable[[Message], Any]) -> None:
+        """Register a handler for a message type."""
+        self.handlers[message_type] = self.handlers.get(message_type, ()) + (handler,)
+        logger.info(f"Registered handler for message type '{message_type}'")
+    
+    def _new_message(self,
+                     message_type: str,
+                     data: Dict[str, Any],
+                     priority: int,
+                     scheduled_time: Optional[datetime]) -> Message:
+        """Create a message with a fresh ID."""
+        return Message(
+            id=new_id(),
+            type=message_type,
+            data=data,
+            priority=priority,
+            scheduled_time=scheduled_time
+        )
+    
+    def _batch_messages(self, messages: List[Dict[str, Any]]) -> List[Message]:
+        """Create messages from enqueue_batch dictionaries, skipping IDs already seen."""
+        # Draw every ID's random bits at once and share one creation time
+        generated = iter(new_ids(len(messages)))
+        ids = [msg_dict.get("id") or next(generated) for msg_dict in messages]
+        created_at = datetime.now()
+        
+        # One set difference instead of a membership check per message
+        fresh = set(ids) - self.message_ids
+        
+        batch = []
+        for message_id, msg_dict in zip(ids, messages):
+            if message_id not in fresh:
+                continue
+            # Only the first occurrence of an ID within the batch is kept
+            fresh.discard(message_id)
+            batch.append(Message(
+                id=message_id,
+                type=msg_dict["type"],
+                data=msg_dict["data"],
+                priority=msg_dict.get("priority", 2),
+                created_at=created_at,
+                scheduled_time=msg_dict.get("scheduled_time")
+            ))
+        
+        if len(batch) < len(messages):
+            logger.info(f"Skipped {len(messages) - len(batch)} duplicate messages in batch")
+        return batch
+    
+    def _record_enqueued(self, messages: List[Message]) -> Optional[_QueueStore]:
+        """
+        Update tracking and statistics for newly enqueued messages and log them.
+        
+        Returns:
+            The store the caller must commit before returning, or None
+        """
+        self.message_ids.update(message.id for message in messages)
+        self.message_count += len(messages)
+        self.stats["enqueued"] += len(messages)
+        
+        if self._store is not None and self._store.append(messages):
+            return self._store
+        return None
+    
+    def _record_unhandled(self, message: Message) -> None:
+        """Record a message that has no handlers for its type."""
+        logger.warning(f"No handlers for message type '{message.type}'")
+        message.error = "No handlers registered"
+        with self._results_lock:
+            self.stats["failed"] += 1
+            self.processed.append(message)
+    
+    def _record_result(self, message: Message, success: bool) -> None:
+        """Update a message and the stats after its handlers ran, requeuing failures for retry."""
+        if not success and not self.retry_enabled:
+            # Fire-and-forget queues count the failure and drop the message
+            with self._results_lock:
+                self.stats["failed"] += 1
+            return
+        
+        with self._results_lock:
+            if success:
+                message.processed = True
+                self.stats["processed"] += 1
+            else:
+                # Retry logic
+                if message.retry_count < message.max_retries:
+                    message.retry_count += 1
+                    self.stats["retried"] += 1
+                    
+                    # Calculate backoff delay
+                    delay = 2 ** message.retry_count  # Exponential backoff
+                    message.reschedule(datetime.now() + timedelta(seconds=delay))
+                    
+                    logger.info(f"Requeuing message {message.id} for retry {message.retry_count}/{message.max_retries} in {delay}s")
+                    self._put(message)
+                else:
+                    # Max retries reached
+                    logger.warning(f"Message {message.id} failed after {message.max_retries} retries")
+                    self.stats["failed"] += 1
+                    message.processed = True
+            
+            # If message is processed (not requeued), add to processed list
+            if message.processed:
+                self.processed.append(message)
+    
+    def _current_stats(self, current_size: int) -> Dict[str, Any]:
+        """Build the statistics reported by get_stats."""
+        uptime = (datetime.now() - self.stats["start_time"]).total_seconds()
+        
+        return {
+            **self.stats,
+            "current_size": current_size,
+            "uptime_seconds": uptime,
+            "processed_messages": len(self.processed),
+            "messages_per_second": self.stats["processed"] / max(1, uptime)
+        }
+    
+    def _close_store(self) -> None:
+        """Stop the committer, take a final snapshot and close the log."""
+        if self._store:
+            self._store.stop()
+            self._store.persist()
+            self._store.close()
+
+class MessageQueue(_QueueBase):
+    """
+    Message queue for passing data between components.
+    
+    Supports:
+    - Message prioritization
+    - Scheduled message delivery
+    - Message persistence (optional)
+    - Retry handling
+    
+    With persistence enabled, every enqueued message is appended to a
+    write-ahead log next to the snapshot file. While the queue is running, a
+    background committer coalesces appends into one write (and fsync) per
+    flush interval. The full snapshot is only rewritten every
+    WAL_SNAPSHOT_EVERY appends, when idle for persistence_interval, and on
+    stop, after which the log is truncated. On startup the snapshot is loaded
+    and the log replayed, so messages processed after the last snapshot may be
+    delivered again.
+    """
+    
+    def __init__(self,
+                 persistence_file: Optional[str] = None,
+                 max_messages: int = 1000,
+                 persistence_interval: int = 60,
+                 fsync_policy: FsyncPolicy = FsyncPolicy.PERIODIC,
+                 max_workers: int = 8,
+                 retry_enabled: bool = True):
+        """
+        Initialize the message queue.
+        
+        Args:
+            persistence_file: File to persist messages to (optional)
+            max_messages: Maximum number of messages to keep in the queue
+            persistence_interval: Interval in seconds for persisting messages
+            fsync_policy: When enqueued messages are forced to disk
+            max_workers: Number of messages whose handlers may run at once
+            retry_enabled: Whether failed messages are retried; when False they
+                are counted as failed and dropped
+        """
+        self.queue = _MessageHeap()
+        self.thread: Optional[threading.Thread] = None
+        
+        # Handlers run on a bounded pool while the queue is started, so a slow
+        # handler does not stall the loop. _slots caps the messages in flight.
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._slots = threading.BoundedSemaphore(max_workers)
+        
         logger.info(f"Message queue initialized")
         
-        # Load persisted messages if available
-        if self.persistence_file and os.path.exists(self.persistence_file):
-            self._load_from_file()
+        super().__init__(persistence_file, max_messages, persistence_interval, fsync_policy, max_workers,
+                         retry_enabled)
+    
+    def _put(self, message: Message) -> None:
+        self.queue.put(message)
+    
+    def _put_many(self, messages: List[Message]) -> None:
+        self.queue.put_many(messages)
+    
+    def _queued_messages(self) -> List[Message]:
+        return self.queue.snapshot()
     
     def register_handler(self, message_type: str, handler: Callable[[Message], Any]) -> None:
         """
@@ -126,15 +821,11 @@ class MessageQueue:
             message_type: Type of message to handle
             handler: Function to handle the message
         """
-        if message_type not in self.handlers:
-            self.handlers[message_type] = []
-        
-        self.handlers[message_type].append(handler)
-        logger.info(f"Registered handler for message type '{message_type}'")
+        self._add_handler(message_type, handler)
     
-    def enqueue(self, 
-               message_type: str, 
-               data: Dict[str, Any], 
+    def enqueue(self,
+               message_type: str,
+               data: Dict[str, Any],
                priority: int = 2,
                scheduled_time: Optional[datetime] = None) -> str:
         """
@@ -145,31 +836,19 @@ class MessageQueue:
             data: Message data
             priority: Message priority (1=high, 2=medium, 3=low)
             scheduled_time: Time to process the message (optional)
-            
+        
         Returns:
             Message ID
         """
-        message_id = str(uuid.uuid4())
-        message = Message(
-            id=message_id,
-            type=message_type,
-            data=data,
-            priority=priority,
-            scheduled_time=scheduled_time
-        )
-        
+        message = self._new_message(message_type, data, priority, scheduled_time)
         self.queue.put(message)
-        self.message_ids.add(message_id)
-        self.message_count += 1
-        self.stats["enqueued"] += 1
-        
-        logger.info(f"Enqueued {message_type} message with ID {message_id}")
+        store = self._record_enqueued([message])
+        if store is not None:
+            store.commit()
         
-        # Periodically persist the queue if a file is configured
-        if self.persistence_file and self.stats["enqueued"] % 10 == 0:
-            self._persist_to_file()
+        logger.info(f"Enqueued {message_type} message with ID {message.id}")
         
-        return message_id
+        return message.id
     
     def enqueue_batch(self, messages: List[Dict[str, Any]]) -> List[str]:
         """
@@ -181,20 +860,18 @@ class MessageQueue:
                 - data: Message data
                 - priority: (optional) Message priority
                 - scheduled_time: (optional) Time to process the message
-                
+                - id: (optional) Message ID; messages whose ID is already
+                  known to the queue are skipped
+        
         Returns:
-            List of message IDs
+            List of IDs of the messages that were enqueued
         """
-        message_ids = []
-        
-        for msg_dict in messages:
-            msg_id = self.enqueue(
-                message_type=msg_dict["type"],
-                data=msg_dict["data"],
-                priority=msg_dict.get("priority", 2),
-                scheduled_time=msg_dict.get("scheduled_time")
-            )
-            message_ids.append(msg_id)
+        batch = self._batch_messages(messages)
+        self.queue.put_many(batch)
+        store = self._record_enqueued(batch)
+        if store is not None:
+            store.commit()
+        message_ids = [message.id for message in batch]
         
         logger.info(f"Enqueued batch of {len(message_ids)} messages")
         return message_ids
@@ -208,6 +885,12 @@ class MessageQueue:
         """
         self.running = True
         
+        if self._store:
+            self._store.start()
+        
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="icap-queue")
+        
         if blocking:
             logger.info("Starting message queue processing (blocking)")
             self._process_loop()
@@ -222,22 +905,19 @@ class MessageQueue:
         logger.info("Stopping message queue processing")
         self.running = False
         
+        # Let the loop notice the flag before finishing the handlers in flight
+        if self.thread and self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2.0)
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        
         # If we have a persistence file, save messages for later
-        if self.persistence_file:
-            self._persist_to_file()
+        self._close_store()
     
     def get_stats(self) -> Dict[str, Any]:
         """Get queue statistics."""
-        current_size = self.queue.qsize()
-        uptime = (datetime.now() - self.stats["start_time"]).total_seconds()
-        
-        return {
-            **self.stats,
-            "current_size": current_size,
-            "uptime_seconds": uptime,
-            "processed_messages": len(self.processed),
-            "messages_per_second": self.stats["processed"] / max(1, uptime)
-        }
+        return self._current_stats(self.queue.qsize())
     
     def _process_loop(self) -> None:
         """Main processing loop for the queue."""
@@ -248,177 +928,129 @@ class MessageQueue:
             
             while self.running:
                 try:
-                    # Get the next message, with a timeout to check running flag
-                    try:
-                        message = self.queue.get(timeout=1)
-                    except Empty:
+                    # Claim a free worker, then as many more as are idle, and take
+                    # at most that many ready messages off the heap in one go
+                    pool = self._pool
+                    limit = DRAIN_BATCH_SIZE
+                    if pool is not None:
+                        if not self._slots.acquire(timeout=1):
+                            continue
+                        limit = 1
+                        while limit < DRAIN_BATCH_SIZE and self._slots.acquire(blocking=False):
+                            limit += 1
+                    
+                    # Wait for messages, with a timeout to check running flag
+                    batch = self.queue.drain_ready(limit, timeout=1)
+                    if pool is not None:
+                        for _ in range(limit - len(batch)):
+                            self._slots.release()
+                    
+                    if not batch:
                         # Check if it's time to persist the queue
-                        if (self.persistence_file and 
+                        if (self.persistence_file and
                             time.time() - persistence_last_time > self.persistence_interval):
                             self._persist_to_file()
                             persistence_last_time = time.time()
                         continue
                     
-                    # If the message is scheduled for the future, put it back and wait
-                    if message.scheduled_time and datetime.now() < message.scheduled_time:
-                        self.queue.put(message)
-                        time.sleep(0.1)  # Small delay to avoid cpu hogging
-                        continue
-                    
-                    # Process the message
-                    handlers = self.handlers.get(message.type, [])
-                    
-                    if not handlers:
-                        logger.warning(f"No handlers for message type '{message.type}'")
-                        self.stats["failed"] += 1
-                        message.error = "No handlers registered"
-                        self.processed.append(message)
-                        continue
-                    
-                    # Call all handlers for this message type
-                    success = True
-                    for handler in handlers:
+                    # Run the handlers on the pool, or inline when the queue was not started
+                    for index, message in enumerate(batch):
+                        if pool is None:
+                            self._dispatch(message, False)
+                            continue
                         try:
-                            handler(message)
-                        except Exception as e:
-                            logger.error(f"Error handling message {message.id}: {str(e)}")
-                            message.error = str(e)
-                            success = False
-                    
-                    # Update message and stats
-                    if success:
-                        message.processed = True
-                        self.stats["processed"] += 1
-                    else:
-                        # Retry logic
-                        if message.retry_count < message.max_retries:
-                            message.retry_count += 1
-                            self.stats["retried"] += 1
-                            
-                            # Calculate backoff delay
-                            delay = 2 ** message.retry_count  # Exponential backoff
-                            message.scheduled_time = datetime.now() + timedelta(seconds=delay)
-                            
-                            logger.info(f"Requeuing message {message.id} for retry {message.retry_count}/{message.max_retries} in {delay}s")
-                            self.queue.put(message)
-                        else:
-                            # Max retries reached
-                            logger.warning(f"Message {message.id} failed after {message.max_retries} retries")
-                            self.stats["failed"] += 1
-                            message.processed = True
-                            self.processed.append(message)
-                    
-                    # If message is processed (not requeued), add to processed list
-                    if message.processed:
-                        self.processed.append(message)
-                        
-                        # Trim processed list if it gets too large
-                        if len(self.processed) > self.max_messages:
-                            self.processed = self.processed[-self.max_messages:]
-                    
-                    # Mark as task_done
-                    self.queue.task_done()
-                    
+                            pool.submit(self._dispatch, message, True)
+                        except RuntimeError:
+                            # The pool shut down underneath us; keep the rest for later
+                            self.queue.put_many(batch[index:])
+                            for _ in batch[index:]:
+                                self._slots.release()
+                            break
+                
                 except Exception as e:
                     logger.error(f"Error in message processing loop: {str(e)}")
                     time.sleep(1)  # Avoid tight loop in case of errors
             
             logger.info("Message processing loop stopped")
-            
+        
         except Exception as e:
             logger.error(f"Fatal error in message processing loop: {str(e)}")
             self.running = False
     
-    def _persist_to_file(self) -> None:
-        """Persist the queue to a file."""
-        if not self.persistence_file:
-            return
-            
-        try:
-            # Convert queue to list for serialization
-            # This is not thread-safe but good enough for our use case
-            queue_list = []
-            while not self.queue.empty():
-                queue_list.append(self.queue.get())
-            
-            # Put all messages back
-            for msg in queue_list:
-                self.queue.put(msg)
-            
-            # Convert messages to dictionaries
-            queue_data = [msg.to_dict() for msg in queue_list]
-            processed_data = [msg.to_dict() for msg in self.processed]
-            
-            data = {
-                "queue": queue_data,
-                "processed": processed_data,
-                "stats": self.stats,
-                "timestamp": datetime.now().isoformat()
-            }
-            
-            # Create directory if it doesn't exist
-            os.makedirs(os.path.dirname(os.path.abspath(self.persistence_file)), exist_ok=True)
-            
-            # Write to a temporary file first, then rename to avoid corruption if the process crashes
-            temp_file = f"{self.persistence_file}.tmp"
-            with open(temp_file, 'w') as f:
-                json.dump(data, f)
-                
-            os.replace(temp_file, self.persistence_file)
-            
-            logger.debug(f"Persisted {len(queue_data)} queued and {len(processed_data)} processed messages")
+    def drain_ready(self, limit: int = DRAIN_BATCH_SIZE) -> List[Message]:
+        """
+        Remove ready messages from the queue without waiting.
+        
+        The caller takes over the messages and is responsible for processing
+        them; they are no longer part of the queue's snapshots.
+        
+        Args:
+            limit: Maximum number of messages to remove
             
-        except Exception as e:
-            logger.error(f"Error persisting queue to file: {str(e)}")
+        Returns:
+            Up to limit ready messages in priority order
+        """
+        return self.queue.drain_ready(limit)
     
-    def _load_from_file(self) -> None:
-        """Load persisted messages from a file."""
-        if not self.persistence_file or not os.path.exists(self.persistence_file):
-            return
-            
+    def _dispatch(self, message: Message, release_slot: bool) -> None:
+        """
+        Call every handler registered for a message and record the outcome.
+        
+        Args:
+            message: Message to process
+            release_slot: Whether to free a worker slot when done
+        """
         try:
-            with open(self.persistence_file, 'r') as f:
-                data = json.load(f)
-            
-            # Load queue messages
-            for msg_dict in data.get("queue", []):
-                message = Message.from_dict(msg_dict)
-                self.queue.put(message)
-                self.message_ids.add(message.id)
-                self.message_count += 1
-            
-            # Load processed messages
-            for msg_dict in data.get("processed", []):
-                message = Message.from_dict(msg_dict)
-                self.processed.append(message)
-                self.message_ids.add(message.id)
-            
-            # Load stats
-            for key, value in data.get("stats", {}).items():
-                if key in self.stats:
-                    self.stats[key] = value
+            handlers = self.handlers.get(message.type, ())
             
-            # Convert start_time from string if needed
-            if isinstance(self.stats["start_time"], str):
-                self.stats["start_time"] = datetime.fromisoformat(self.stats["start_time"])
+            if not handlers:
+                self._record_unhandled(message)
+                return
             
-            logger.info(f"Loaded {self.queue.qsize()} queued and {len(self.processed)} processed messages from persistence file")
+            # Call all handlers for this message type
+            success = True
+            for handler in handlers:
+                try:
+                    handler(message)
+                except Exception as e:
+                    logger.error(f"Error handling message {message.id}: {str(e)}")
+                    message.error = str(e)
+                    success = False
             
+            self._record_result(message, success)
+        
         except Exception as e:
-            logger.error(f"Error loading persisted queue: {str(e)}")
+            logger.error(f"Error dispatching message {message.id}: {str(e)}")
+        finally:
+            if release_slot:
+                self._slots.release()
+    
+    def _persist_to_file(self) -> None:
+        """Snapshot the queue to a file and truncate the write-ahead log."""
+        if self._store:
+            self._store.persist()
 
-class AsyncMessageQueue:
+class AsyncMessageQueue(_QueueBase):
     """
     Async version of the message queue for use with asyncio.
     
-    This is a wrapper around the synchronous MessageQueue that provides
-    async-compatible methods.
+    Messages wait in the same ready/scheduled heap split as MessageQueue and
+    are dispatched by a task on the event loop, so enqueueing and dispatching
+    never hop threads and a message scheduled for the future never holds up
+    ready ones behind it.
+    Coroutine handlers are awaited directly; plain handlers run on a thread
+    pool owned by the queue while it is started. Persistence works as in
+    MessageQueue, with blocking snapshot and log writes done in the loop's
+    default executor.
     """
     
-    def __init__(self, 
+    def __init__(self,
                  persistence_file: Optional[str] = None,
                  max_messages: int = 1000,
-                 persistence_interval: int = 60):
+                 persistence_interval: int = 60,
+                 fsync_policy: FsyncPolicy = FsyncPolicy.PERIODIC,
+                 max_workers: int = 8,
+                 retry_enabled: bool = True):
         """
         Initialize the async message queue.
         
@@ -426,28 +1058,60 @@ class AsyncMessageQueue:
             persistence_file: File to persist messages to (optional)
             max_messages: Maximum number of messages to keep in the queue
             persistence_interval: Interval in seconds for persisting messages
+            fsync_policy: When enqueued messages are forced to disk
+            max_workers: Number of messages whose handlers may run at once
+            retry_enabled: Whether failed messages are retried; when False they
+                are counted as failed and dropped
         """
-        self.queue = MessageQueue(
-            persistence_file=persistence_file,
-            max_messages=max_messages,
-            persistence_interval=persistence_interval
-        )
-        self.loop = asyncio.get_event_loop()
+        self.queue = _MessageHeap()
+        
+        # Set whenever a message is put, so the idle loop wakes without polling
+        self._wakeup = asyncio.Event()
+        
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: Set[asyncio.Task] = set()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        
+        # Handlers per type paired with whether they are coroutine functions,
+        # worked out once at registration rather than on every dispatch
+        self._handler_plans: Dict[str, Tuple[Tuple[Callable[[Message], Any], bool], ...]] = {}
+        self._slots = asyncio.Semaphore(max_workers)
+        
+        super().__init__(persistence_file, max_messages, persistence_interval, fsync_policy, max_workers,
+                         retry_enabled)
         logger.info("Async message queue initialized")
     
+    def _put(self, message: Message) -> None:
+        self.queue.put(message)
+        self._wakeup.set()
+    
+    def _put_many(self, messages: List[Message]) -> None:
+        self.queue.put_many(messages)
+        self._wakeup.set()
+    
+    def _queued_messages(self) -> List[Message]:
+        return self.queue.snapshot()
+    
+    async def _commit_store(self, store: _QueueStore) -> None:
+        """Write buffered log records without blocking the event loop."""
+        await asyncio.get_running_loop().run_in_executor(None, store.commit)
+    
     async def register_handler(self, message_type: str, handler: Callable[[Message], Any]) -> None:
         """
         Register a handler for a message type.
         
         Args:
             message_type: Type of message to handle
-            handler: Function to handle the message
+            handler: Function to handle the message; coroutine functions are awaited
         """
-        await self.loop.run_in_executor(None, self.queue.register_handler, message_type, handler)
+        self._add_handler(message_type, handler)
+        self._handler_plans[message_type] = self._handler_plans.get(message_type, ()) + (
+            (handler, inspect.iscoroutinefunction(handler)),
+        )
     
-    async def enqueue(self, 
-                     message_type: str, 
-                     data: Dict[str, Any], 
+    async def enqueue(self,
+                     message_type: str,
+                     data: Dict[str, Any],
                      priority: int = 2,
                      scheduled_time: Optional[datetime] = None) -> str:
         """
@@ -458,13 +1122,19 @@ class AsyncMessageQueue:
             data: Message data
             priority: Message priority (1=high, 2=medium, 3=low)
             scheduled_time: Time to process the message (optional)
-            
+        
         Returns:
             Message ID
         """
-        return await self.loop.run_in_executor(
-            None, self.queue.enqueue, message_type, data, priority, scheduled_time
-        )
+        message = self._new_message(message_type, data, priority, scheduled_time)
+        self._put(message)
+        store = self._record_enqueued([message])
+        if store is not None:
+            await self._commit_store(store)
+        
+        logger.info(f"Enqueued {message_type} message with ID {message.id}")
+        
+        return message.id
     
     async def enqueue_batch(self, messages: List[Dict[str, Any]]) -> List[str]:
         """
@@ -476,20 +1146,138 @@ class AsyncMessageQueue:
                 - data: Message data
                 - priority: (optional) Message priority
                 - scheduled_time: (optional) Time to process
-                
+                - id: (optional) Message ID; messages whose ID is already
+                  known to the queue are skipped
+        
         Returns:
-            List of message IDs
+            List of IDs of the messages that were enqueued
         """
-        return await self.loop.run_in_executor(None, self.queue.enqueue_batch, messages)
+        batch = self._batch_messages(messages)
+        self._put_many(batch)
+        store = self._record_enqueued(batch)
+        if store is not None:
+            await self._commit_store(store)
+        message_ids = [message.id for message in batch]
+        
+        logger.info(f"Enqueued batch of {len(message_ids)} messages")
+        return message_ids
     
     async def start(self) -> None:
         """Start processing messages in the queue."""
-        await self.loop.run_in_executor(None, self.queue.start, False)
+        if self.running:
+            return
+        
+        self.running = True
+        if self._store:
+            self._store.start()
+        
+        # At most max_workers messages are in flight, so that many threads
+        # cover every sync handler without contending for the default executor
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="icap-async-queue")
+        
+        logger.info("Starting message queue processing (background)")
+        self._task = asyncio.create_task(self._run())
     
     async def stop(self) -> None:
         """Stop processing messages."""
-        await self.loop.run_in_executor(None, self.queue.stop)
+        logger.info("Stopping message queue processing")
+        self.running = False
+        
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        
+        # Let handlers that already started finish
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        
+        loop = asyncio.get_running_loop()
+        if self._executor:
+            await loop.run_in_executor(None, self._executor.shutdown)
+            self._executor = None
+        
+        # If we have a persistence file, save messages for later
+        if self._store:
+            await loop.run_in_executor(None, self._close_store)
     
     async def get_stats(self) -> Dict[str, Any]:
         """Get queue statistics."""
-        return await self.loop.run_in_executor(None, self.queue.get_stats)
\ No newline at end of file
+        return self._current_stats(self.queue.qsize())
+    
+    async def _run(self) -> None:
+        """Main processing loop for the queue."""
+        logger.info("Message processing loop started")
+        loop = asyncio.get_running_loop()
+        persistence_last_time = time.time()
+        
+        holding_slot = False
+        try:
+            while self.running:
+                # Wait for a free worker before taking a message off the queue
+                await self._slots.acquire()
+                holding_slot = True
+                
+                # Scheduled messages are promoted as they fall due, so only ready ones come back
+                batch = self.queue.drain_ready(1)
+                if not batch:
+                    self._slots.release()
+                    holding_slot = False
+                    
+                    # Nothing awaits between the drain and the clear, so no put is missed
+                    self._wakeup.clear()
+                    delay = self.queue.next_scheduled_delay()
+                    timeout = 1 if delay is None else min(1, delay)
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        # Check if it's time to persist the queue
+                        if self._store and time.time() - persistence_last_time > self.persistence_interval:
+                            await loop.run_in_executor(None, self._store.persist)
+                            persistence_last_time = time.time()
+                    continue
+                
+                # The dispatch task releases the slot when it finishes
+                holding_slot = False
+                task = asyncio.create_task(self._dispatch(batch[0]))
+                self._in_flight.add(task)
+                task.add_done_callback(self._in_flight.discard)
+            
+            logger.info("Message processing loop stopped")
+        
+        finally:
+            if holding_slot:
+                self._slots.release()
+    
+    async def _dispatch(self, message: Message) -> None:
+        """Call every handler registered for a message and record the outcome."""
+        try:
+            plan = self._handler_plans.get(message.type, ())
+            
+            if not plan:
+                self._record_unhandled(message)
+                return
+            
+            # Call all handlers for this message type
+            loop = asyncio.get_running_loop()
+            success = True
+            for handler, is_coroutine in plan:
+                try:
+                    if is_coroutine:
+                        await handler(message)
+                    else:
+                        await loop.run_in_executor(self._executor, handler, message)
+                except Exception as e:
+                    logger.error(f"Error handling message {message.id}: {str(e)}")
+                    message.error = str(e)
+                    success = False
+            
+            self._record_result(message, success)
+        
+        except Exception as e:
+            logger.error(f"Error dispatching message {message.id}: {str(e)}")
+        finally:
+            self._slots.release()
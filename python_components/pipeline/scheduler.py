@@ -2,17 +2,18 @@
 Scheduler for ICAP pipeline execution.
 """
 import os
-import time
 import logging
 import threading
 import asyncio
 import datetime
+from queue import SimpleQueue, Empty
 from typing import Dict, Any, List, Optional, Callable, Union, Tuple
 from dataclasses import dataclass, field
 from enum import Enum
 
 from python_components.pipeline.orchestrator import PipelineOrchestrator
 from python_components.pipeline.queue import Message, MessageQueue
+from python_components.utils.timestamps import parse_timestamp
 
 logger = logging.getLogger("icap.scheduler")
 
@@ -24,7 +25,7 @@ class ScheduleType(Enum):
     MONTHLY = "monthly"
     CRON = "cron"
 
-@dataclass
+@dataclass(slots=True)
 class Schedule:
     """Schedule configuration for a task."""
     id: str
@@ -58,117 +59,147 @@ class Schedule:
     runs: int = 0
     failures: int = 0
     
+    # Frozen copy of parameters used to build message data
+    _param_template: Tuple[Tuple[str, Any], ...] = field(
+        default=(), init=False, repr=False, compare=False
+    )
+    
     def __post_init__(self):
-        """Calculate next run time."""
-        self.update_next_run()
+        """Freeze parameters and calculate next run time unless one was given."""
+        self.freeze_parameters()
+        if self.next_run is None:
+            self.update_next_run()
+    
+    def freeze_parameters(self) -> None:
+        """Snapshot the current parameters for message construction."""
+        self._param_template = tuple(self.parameters.items())
+    
+    def _next_interval_run(self, now: datetime.datetime) -> Optional[datetime.datetime]:
+        """Calculate the next run time for an INTERVAL schedule."""
+        if not self.interval_seconds:
+            logger.error(f"Schedule {self.id} is missing interval_seconds")
+            return None
+            
+        if self.last_run:
+            return self.last_run + datetime.timedelta(seconds=self.interval_seconds)
+        return now + datetime.timedelta(seconds=self.interval_seconds)
+    
+    def _next_daily_run(self, now: datetime.datetime) -> Optional[datetime.datetime]:
+        """Calculate the next run time for a DAILY schedule."""
+        if not self.daily_time:
+            logger.error(f"Schedule {self.id} is missing daily_time")
+            return None
+            
+        try:
+            hour, minute = map(int, self.daily_time.split(':'))
+            target_time = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            
+            if target_time <= now:
+                target_time = target_time + datetime.timedelta(days=1)
+                
+            return target_time
+        except ValueError:
+            logger.error(f"Invalid daily_time format for schedule {self.id}: {self.daily_time}")
+            return None
+    
+    def _next_weekly_run(self, now: datetime.datetime) -> Optional[datetime.datetime]:
+        """Calculate the next run time for a WEEKLY schedule."""
+        # Monday is 0, so only a missing day counts as unset
+        if self.weekly_day is None or not self.weekly_time:
+            logger.error(f"Schedule {self.id} is missing weekly_day or weekly_time")
+            return None
+            
+        try:
+            hour, minute = map(int, self.weekly_time.split(':'))
+            # Calculate days to add to get to the next target weekday
+            current_weekday = now.weekday()
+            days_to_add = (self.weekly_day - current_weekday) % 7
+            
+            # Run next week if today's run time has already passed
+            if days_to_add == 0 and (now.hour, now.minute) >= (hour, minute):
+                days_to_add = 7
+                
+            target_time = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            return target_time + datetime.timedelta(days=days_to_add)
+        except ValueError:
+            logger.error(f"Invalid weekly configuration for schedule {self.id}")
+            return None
+    
+    def _next_monthly_run(self, now: datetime.datetime) -> Optional[datetime.datetime]:
+        """Calculate the next run time for a MONTHLY schedule."""
+        if not self.monthly_day or not self.monthly_time:
+            logger.error(f"Schedule {self.id} is missing monthly_day or monthly_time")
+            return None
+            
+        try:
+            hour, minute = map(int, self.monthly_time.split(':'))
+            target_time = now.replace(day=min(self.monthly_day, 28), hour=hour, minute=minute, second=0, microsecond=0)
+            
+            if target_time <= now:
+                # Move to next month
+                if now.month == 12:
+                    target_time = target_time.replace(year=now.year + 1, month=1)
+                else:
+                    target_time = target_time.replace(month=now.month + 1)
+            
+            return target_time
+        except ValueError:
+            logger.error(f"Invalid monthly configuration for schedule {self.id}")
+            return None
+    
+    def _next_cron_run(self, now: datetime.datetime) -> Optional[datetime.datetime]:
+        """Calculate the next run time for a CRON schedule."""
+        if not self.cron_expression:
+            logger.error(f"Schedule {self.id} is missing cron_expression")
+            return None
+            
+        try:
+            from croniter import croniter
+            
+            if croniter.is_valid(self.cron_expression):
+                cron = croniter(self.cron_expression, now)
+                return cron.get_next(datetime.datetime)
+            
+            logger.error(f"Invalid cron expression for schedule {self.id}: {self.cron_expression}")
+            return None
+        except ImportError:
+            logger.error("croniter library not available for cron scheduling")
+            return None
+        except Exception as e:
+            logger.error(f"Error calculating next run for cron schedule {self.id}: {str(e)}")
+            return None
+    
+    # Next-run calculation for each schedule type
+    _NEXT_RUN_HANDLERS = {
+        ScheduleType.INTERVAL: _next_interval_run,
+        ScheduleType.DAILY: _next_daily_run,
+        ScheduleType.WEEKLY: _next_weekly_run,
+        ScheduleType.MONTHLY: _next_monthly_run,
+        ScheduleType.CRON: _next_cron_run,
+    }
+    
+    # Type-specific fields included by to_dict
+    _TO_DICT_FIELDS = {
+        ScheduleType.INTERVAL: ("interval_seconds",),
+        ScheduleType.DAILY: ("daily_time",),
+        ScheduleType.WEEKLY: ("weekly_day", "weekly_time"),
+        ScheduleType.MONTHLY: ("monthly_day", "monthly_time"),
+        ScheduleType.CRON: ("cron_expression",),
+    }
     
     def update_next_run(self):
         """Update the next run time based on the schedule type."""
-        now = datetime.datetime.now()
+        handler = self._NEXT_RUN_HANDLERS.get(self.type)
         
-        if not self.enabled:
+        if not self.enabled or handler is None:
             self.next_run = None
             return
         
-        if self.type == ScheduleType.INTERVAL:
-            if not self.interval_seconds:
-                logger.error(f"Schedule {self.id} is missing interval_seconds")
-                self.next_run = None
-                return
-                
-            if self.last_run:
-                self.next_run = self.last_run + datetime.timedelta(seconds=self.interval_seconds)
-            else:
-                self.next_run = now + datetime.timedelta(seconds=self.interval_seconds)
-                
-        elif self.type == ScheduleType.DAILY:
-            if not self.daily_time:
-                logger.error(f"Schedule {self.id} is missing daily_time")
-                self.next_run = None
-                return
-                
-            try:
-                hour, minute = map(int, self.daily_time.split(':'))
-                target_time = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
-                
-                if target_time <= now:
-                    target_time = target_time + datetime.timedelta(days=1)
-                    
-                self.next_run = target_time
-            except ValueError:
-                logger.error(f"Invalid daily_time format for schedule {self.id}: {self.daily_time}")
-                self.next_run = None
-                
-        elif self.type == ScheduleType.WEEKLY:
-            if not self.weekly_day or not self.weekly_time:
-                logger.error(f"Schedule {self.id} is missing weekly_day or weekly_time")
-                self.next_run = None
-                return
-                
-            try:
-                hour, minute = map(int, self.weekly_time.split(':'))
-                # Calculate days to add to get to the next target weekday
-                current_weekday = now.weekday()
-                days_to_add = (self.weekly_day - current_weekday) % 7
-                
-                if days_to_add == 0 and now.hour > hour or (now.hour == hour and now.minute >= minute):
-                    days_to_add = 7
-                    
-                target_time = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
-                target_time = target_time + datetime.timedelta(days=days_to_add)
-                
-                self.next_run = target_time
-            except ValueError:
-                logger.error(f"Invalid weekly configuration for schedule {self.id}")
-                self.next_run = None
-                
-        elif self.type == ScheduleType.MONTHLY:
-            if not self.monthly_day or not self.monthly_time:
-                logger.error(f"Schedule {self.id} is missing monthly_day or monthly_time")
-                self.next_run = None
-                return
-                
-            try:
-                hour, minute = map(int, self.monthly_time.split(':'))
-                target_time = now.replace(day=min(self.monthly_day, 28), hour=hour, minute=minute, second=0, microsecond=0)
-                
-                if target_time <= now:
-                    # Move to next month
-                    if now.month == 12:
-                        target_time = target_time.replace(year=now.year + 1, month=1)
-                    else:
-                        target_time = target_time.replace(month=now.month + 1)
-                
-                self.next_run = target_time
-            except ValueError:
-                logger.error(f"Invalid monthly configuration for schedule {self.id}")
-                self.next_run = None
-                
-        elif self.type == ScheduleType.CRON:
-            if not self.cron_expression:
-                logger.error(f"Schedule {self.id} is missing cron_expression")
-                self.next_run = None
-                return
-                
-            try:
-                from croniter import croniter
-                
-                if croniter.is_valid(self.cron_expression):
-                    cron = croniter(self.cron_expression, now)
-                    self.next_run = cron.get_next(datetime.datetime)
-                else:
-                    logger.error(f"Invalid cron expression for schedule {self.id}: {self.cron_expression}")
-                    self.next_run = None
-            except ImportError:
-                logger.error("croniter library not available for cron scheduling")
-                self.next_run = None
-            except Exception as e:
-                logger.error(f"Error calculating next run for cron schedule {self.id}: {str(e)}")
-                self.next_run = None
+        self.next_run = handler(self, datetime.datetime.now())
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert the schedule to a dictionary."""
-        result = {
+        result: Dict[str, Any] = {
             "id": self.id,
             "name": self.name,
             "type": self.type.value,
@@ -181,40 +212,30 @@ class Schedule:
         }
         
         # Add type-specific fields
-        if self.type == ScheduleType.INTERVAL:
-            result["interval_seconds"] = self.interval_seconds
-        elif self.type == ScheduleType.DAILY:
-            result["daily_time"] = self.daily_time
-        elif self.type == ScheduleType.WEEKLY:
-            result["weekly_day"] = self.weekly_day
-            result["weekly_time"] = self.weekly_time
-        elif self.type == ScheduleType.MONTHLY:
-            result["monthly_day"] = self.monthly_day
-            result["monthly_time"] = self.monthly_time
-        elif self.type == ScheduleType.CRON:
-            result["cron_expression"] = self.cron_expression
-        
-        # Add runtime stats
+        for name in self._TO_DICT_FIELDS.get(self.type, ()):
+            result[name] = getattr(self, name)
+        
+        # Add runtime stats as epoch seconds
         if self.last_run:
-            result["last_run"] = self.last_run.isoformat()
+            result["last_run"] = self.last_run.timestamp()
         if self.next_run:
-            result["next_run"] = self.next_run.isoformat()
+            result["next_run"] = self.next_run.timestamp()
             
         return result
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'Schedule':
-        """Create a schedule from a dictionary."""
+        """Create a schedule from a dictionary, accepting epoch seconds or ISO 8601 strings for timestamps."""
         schedule_type = ScheduleType(data.get("type", "interval"))
         
-        # Convert ISO timestamps to datetime objects
-        last_run = None
+        # Convert timestamps to datetime objects
+        last_run: Optional[datetime.datetime] = None
         if data.get("last_run"):
-            last_run = datetime.datetime.fromisoformat(data["last_run"])
+            last_run = parse_timestamp(data["last_run"])
             
-        next_run = None
+        next_run: Optional[datetime.datetime] = None
         if data.get("next_run"):
-            next_run = datetime.datetime.fromisoformat(data["next_run"])
+            next_run = parse_timestamp(data["next_run"])
             
         return cls(
             id=data["id"],
@@ -256,6 +277,15 @@ class PipelineScheduler:
         self.thread = None
         self.lock = threading.RLock()
         
+        # Set by stop() so the scheduler loop exits without finishing its poll wait
+        self._wake = threading.Event()
+        
+        # Hand-off between the scheduler/run_now callers and the message queue.
+        # SimpleQueue is C-implemented, so producers never contend on a
+        # Python-level lock; a single drain thread feeds the message queue.
+        self._outbox: SimpleQueue = SimpleQueue()
+        self._outbox_thread: Optional[threading.Thread] = None
+        
         # Load default schedules
         self._load_default_schedules()
         
@@ -375,6 +405,9 @@ class PipelineScheduler:
                 if hasattr(schedule, key):
                     setattr(schedule, key, value)
             
+            if "parameters" in updates:
+                schedule.freeze_parameters()
+            
             # Update next run time
             schedule.update_next_run()
             
@@ -432,7 +465,12 @@ class PipelineScheduler:
         Args:
             blocking: Whether to block the current thread
         """
+        if self.running:
+            logger.warning("Scheduler is already running")
+            return
+        
         self.running = True
+        self.orchestrator.start()
         
         # Start the queue if it's not already running
         if not getattr(self.queue, 'running', False):
@@ -443,6 +481,11 @@ class PipelineScheduler:
         self.queue.register_handler("process_slack", self._handle_process_slack)
         self.queue.register_handler("generate_daily_summary", self._handle_generate_daily_summary)
         
+        # Start draining scheduled tasks into the message queue
+        self._outbox_thread = threading.Thread(target=self._drain_outbox)
+        self._outbox_thread.daemon = True
+        self._outbox_thread.start()
+        
         if blocking:
             logger.info("Starting scheduler (blocking)")
             self._scheduler_loop()
@@ -456,10 +499,28 @@ class PipelineScheduler:
         """Stop the scheduler."""
         logger.info("Stopping scheduler")
         self.running = False
+        self._wake.set()
         
         # Wait for the thread to finish if it's running
         if self.thread and self.thread.is_alive():
             self.thread.join(timeout=2.0)
+        
+        # Flush any pending tasks and stop the outbox drain thread
+        if self._outbox_thread and self._outbox_thread.is_alive():
+            self._outbox.put(None)
+            self._outbox_thread.join(timeout=2.0)
+        
+        # Tasks handed over after the sentinel are enqueued here; later ones go
+        # straight to the queue, as _enqueue_task checks the thread under the lock
+        with self.lock:
+            self._outbox_thread = None
+            while True:
+                try:
+                    item = self._outbox.get_nowait()
+                except Empty:
+                    break
+                if item is not None:
+                    self._enqueue_outbox_item(*item)
     
     def run_now(self, schedule_id: str) -> bool:
         """
@@ -498,33 +559,39 @@ class PipelineScheduler:
         
         try:
             while self.running:
+                # Collect due schedules and advance them while holding the lock,
+                # but enqueue outside it so add_schedule/get_schedules aren't
+                # blocked behind the queue
                 with self.lock:
                     now = datetime.datetime.now()
+                    due = [
+                        schedule for schedule in self.schedules.values()
+                        if schedule.enabled and schedule.next_run and schedule.next_run <= now
+                    ]
+                    
+                    # Update schedule stats
+                    for schedule in due:
+                        schedule.last_run = now
+                        schedule.runs += 1
+                        schedule.update_next_run()
+                
+                for schedule in due:
+                    logger.info("Executing schedule %s: %s", schedule.id, schedule.name)
                     
-                    # Check for schedules that need to run
-                    for schedule in self.schedules.values():
-                        if schedule.enabled and schedule.next_run and schedule.next_run <= now:
-                            logger.info(f"Executing schedule {schedule.id}: {schedule.name}")
-                            
-                            try:
-                                # Enqueue the task
-                                self._enqueue_task(schedule)
-                                
-                                # Update schedule stats
-                                schedule.last_run = now
-                                schedule.runs += 1
-                                schedule.update_next_run()
-                                
-                            except Exception as e:
-                                logger.error(f"Error executing schedule {schedule.id}: {str(e)}")
-                                schedule.failures += 1
-                                schedule.update_next_run()
+                    try:
+                        # Enqueue the task
+                        self._enqueue_task(schedule)
+                    except Exception as e:
+                        logger.error("Error executing schedule %s: %s", schedule.id, e)
+                        with self.lock:
+                            schedule.failures += 1
                 
-                # Sleep for a short time before checking again
-                time.sleep(1)
+                # Wait a short time before checking again, waking early on stop()
+                self._wake.wait(timeout=1)
+                self._wake.clear()
         
         except Exception as e:
-            logger.error(f"Error in scheduler loop: {str(e)}")
+            logger.error("Error in scheduler loop: %s", e)
             self.running = False
     
     def _enqueue_task(self, schedule: Schedule) -> None:
@@ -537,20 +604,59 @@ class PipelineScheduler:
         # Map schedule target to message type
         message_type = schedule.target
         
-        # Create message data from schedule parameters
-        message_data = dict(schedule.parameters)
+        # Create message data from the frozen parameters plus schedule metadata
+        message_data = dict(
+            schedule._param_template,
+            schedule_id=schedule.id,
+            schedule_name=schedule.name,
+            schedule_run_time=datetime.datetime.now().isoformat()
+        )
         
-        # Add schedule metadata
-        message_data["schedule_id"] = schedule.id
-        message_data["schedule_name"] = schedule.name
-        message_data["schedule_run_time"] = datetime.datetime.now().isoformat()
+        task: Dict[str, Any] = {
+            "message_type": message_type,
+            "data": message_data,
+            "priority": 1  # High priority
+        }
         
-        # Add to queue with high priority (1)
-        self.queue.enqueue(
-            message_type=message_type,
-            data=message_data,
-            priority=1
-        )
+        # Hand off to the drain thread when it's running, otherwise enqueue directly
+        with self.lock:
+            if self._outbox_thread and self._outbox_thread.is_alive():
+                self._outbox.put((schedule, task))
+                return
+        self.queue.enqueue(**task)
+    
+    def _drain_outbox(self) -> None:
+        """Move scheduled tasks from the outbox into the message queue."""
+        logger.info("Scheduler outbox drain started")
+        
+        while True:
+            try:
+                item = self._outbox.get(timeout=1)
+            except Empty:
+                continue
+            
+            # None is the shutdown sentinel put by stop()
+            if item is None:
+                break
+            
+            self._enqueue_outbox_item(*item)
+        
+        logger.info("Scheduler outbox drain stopped")
+    
+    def _enqueue_outbox_item(self, schedule: Schedule, task: Dict[str, Any]) -> None:
+        """
+        Enqueue a task taken from the outbox, counting a failure against its schedule.
+        
+        Args:
+            schedule: The schedule the task was created for
+            task: Keyword arguments for MessageQueue.enqueue
+        """
+        try:
+            self.queue.enqueue(**task)
+        except Exception as e:
+            logger.error("Error enqueueing schedule %s: %s", schedule.id, e)
+            with self.lock:
+                schedule.failures += 1
     
     def _handle_process_email(self, message: Message) -> None:
         """
@@ -559,7 +665,7 @@ class PipelineScheduler:
         Args:
             message: The message to handle
         """
-        logger.info(f"Handling process_email message: {message.id}")
+        logger.info("Handling process_email message: %s", message.id)
         
         # Extract query parameters from message data
         query = {
@@ -576,13 +682,13 @@ class PipelineScheduler:
             
             # Check result
             if context.status == "completed":
-                logger.info(f"Email processing completed successfully: {context.id}")
+                logger.info("Email processing completed successfully: %s", context.id)
             else:
-                logger.error(f"Email processing failed: {context.error}")
+                logger.error("Email processing failed: %s", context.error)
                 raise RuntimeError(f"Email processing failed: {context.error}")
                 
         except Exception as e:
-            logger.error(f"Error in process_email handler: {str(e)}")
+            logger.error("Error in process_email handler: %s", e)
             raise
         finally:
             loop.close()
@@ -594,7 +700,7 @@ class PipelineScheduler:
         Args:
             message: The message to handle
         """
-        logger.info(f"Handling process_slack message: {message.id}")
+        logger.info("Handling process_slack message: %s", message.id)
         
         # Extract query parameters from message data
         query = {
@@ -612,13 +718,13 @@ class PipelineScheduler:
             
             # Check result
             if context.status == "completed":
-                logger.info(f"Slack processing completed successfully: {context.id}")
+                logger.info("Slack processing completed successfully: %s", context.id)
             else:
-                logger.error(f"Slack processing failed: {context.error}")
+                logger.error("Slack processing failed: %s", context.error)
                 raise RuntimeError(f"Slack processing failed: {context.error}")
                 
         except Exception as e:
-            logger.error(f"Error in process_slack handler: {str(e)}")
+            logger.error("Error in process_slack handler: %s", e)
             raise
         finally:
             loop.close()
@@ -630,7 +736,7 @@ class PipelineScheduler:
         Args:
             message: The message to handle
         """
-        logger.info(f"Handling generate_daily_summary message: {message.id}")
+        logger.info("Handling generate_daily_summary message: %s", message.id)
         
         # Run the summary generation pipeline
         loop = asyncio.new_event_loop()
@@ -641,13 +747,13 @@ class PipelineScheduler:
             
             # Check result
             if context.status == "completed":
-                logger.info(f"Summary generation completed successfully: {context.id}")
+                logger.info("Summary generation completed successfully: %s", context.id)
             else:
-                logger.error(f"Summary generation failed: {context.error}")
+                logger.error("Summary generation failed: %s", context.error)
                 raise RuntimeError(f"Summary generation failed: {context.error}")
                 
         except Exception as e:
-            logger.error(f"Error in generate_daily_summary handler: {str(e)}")
+            logger.error("Error in generate_daily_summary handler: %s", e)
             raise
         finally:
             loop.close()
\ No newline at end of file
@@ -2,19 +2,57 @@
 Webhook endpoints for ICAP pipeline triggers.
 """
 import os
+import hmac
 import json
 import logging
 import asyncio
-from typing import Dict, Any, Optional, Callable, Awaitable
+import orjson
+from typing import Dict, Any, Optional, Callable, Awaitable, Set
 from datetime import datetime
 from aiohttp import web
 from python_components.pipeline.orchestrator import PipelineOrchestrator
 
 logger = logging.getLogger("icap.webhook")
 
+def _json_response(data: Dict[str, Any], status: int = 200) -> web.Response:
+    """
+    Build a JSON response serialized with orjson.
+    
+    Args:
+        data: The response payload
+        status: HTTP status code
+        
+    Returns:
+        HTTP response
+    """
+    return web.Response(
+        body=orjson.dumps(data),
+        status=status,
+        content_type="application/json"
+    )
+
+async def _read_json(request: web.Request) -> Any:
+    """
+    Parse the request body as JSON straight from the raw bytes.
+    
+    Args:
+        request: The HTTP request
+        
+    Returns:
+        The decoded JSON body
+    """
+    return orjson.loads(await request.read())
+
 class WebhookHandler:
     """Handler for webhook requests that trigger pipeline processing."""
     
+    # Pipeline webhooks: (path, log name, response message, background method, body required)
+    _WEBHOOKS = (
+        ("/webhook/email", "email", "Email processing started", "_process_email_webhook", True),
+        ("/webhook/slack", "Slack", "Slack processing started", "_process_slack_webhook", True),
+        ("/webhook/summary", "summary", "Summary generation started", "_process_summary_webhook", False),
+    )
+    
     def __init__(self, host: str = "0.0.0.0", port: int = 8080):
         """
         Initialize the webhook handler.
@@ -26,22 +64,34 @@ class WebhookHandler:
         self.host = host
         self.port = port
         self.app = web.Application()
+        self._expected_token = os.getenv("WEBHOOK_TOKEN", "").encode()
+        self._expected_auth = b"Bearer " + self._expected_token
+        
+        # Background pipeline runs, capped so bursts of webhooks can't pile up
+        self._background_tasks: Set[asyncio.Task] = set()
+        self._pipeline_semaphore = asyncio.Semaphore(int(os.getenv("PIPELINE_CONCURRENCY", "4")))
         self.orchestrator = PipelineOrchestrator()
+        self.app.on_cleanup.append(self._close_orchestrator)
         self._setup_routes()
         logger.info(f"Webhook handler initialized on {host}:{port}")
     
     def _setup_routes(self) -> None:
         """Set up the webhook routes."""
         self.app.add_routes([
-            web.post('/webhook/email', self.handle_email_webhook),
-            web.post('/webhook/slack', self.handle_slack_webhook),
-            web.post('/webhook/summary', self.handle_summary_webhook),
-            web.get('/health', self.health_check)
+            web.post(path, self._make_webhook_handler(name, message, getattr(self, process), body_required))
+            for path, name, message, process, body_required in self._WEBHOOKS
+        ])
+        self.app.add_routes([
+            web.get('/health', self.health_check),
+            web.get('/metrics', self.metrics)
         ])
     
     async def start(self) -> None:
         """Start the webhook server."""
-        self.runner = web.AppRunner(self.app)
+        await asyncio.to_thread(self.orchestrator.start)
+        
+        # Handlers log what they receive, so skip aiohttp's per-request access log
+        self.runner = web.AppRunner(self.app, access_log=None)
         await self.runner.setup()
         self.site = web.TCPSite(self.runner, self.host, self.port)
         await self.site.start()
@@ -54,99 +104,98 @@ class WebhookHandler:
             await self.runner.cleanup()
             logger.info("Webhook server stopped")
     
-    async def handle_email_webhook(self, request: web.Request) -> web.Response:
+    def _spawn(self, coro: Awaitable[None]) -> asyncio.Task:
         """
-        Handle webhook requests for email processing.
+        Run a pipeline coroutine in the background with bounded concurrency.
         
         Args:
-            request: The HTTP request
+            coro: The pipeline coroutine to run
             
         Returns:
-            HTTP response
+            The background task
         """
-        try:
-            # Validate the webhook token for security
-            if not self._validate_webhook_token(request):
-                return web.json_response(
-                    {"error": "Invalid webhook token"}, 
-                    status=401
-                )
-            
-            # Parse the request body
-            body = await request.json()
-            logger.info(f"Received email webhook: {body}")
-            
-            # Start the email processing pipeline
-            asyncio.create_task(self._process_email_webhook(body))
-            
-            return web.json_response({
-                "status": "processing",
-                "message": "Email processing started",
-                "timestamp": datetime.now().isoformat()
-            })
-            
-        except json.JSONDecodeError:
-            logger.error("Invalid JSON in webhook request")
-            return web.json_response(
-                {"error": "Invalid JSON"}, 
-                status=400
-            )
-            
-        except Exception as e:
-            logger.error(f"Error handling email webhook: {str(e)}")
-            return web.json_response(
-                {"error": str(e)}, 
-                status=500
-            )
+        task = asyncio.create_task(self._run_limited(coro))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._on_background_task_done)
+        return task
     
-    async def handle_slack_webhook(self, request: web.Request) -> web.Response:
+    async def _run_limited(self, coro: Awaitable[None]) -> None:
+        """Await a coroutine once a pipeline slot is free."""
+        async with self._pipeline_semaphore:
+            await coro
+    
+    def _on_background_task_done(self, task: asyncio.Task) -> None:
+        """Drop the reference to a finished task and log any unhandled error."""
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Background pipeline task failed: %s", task.exception())
+    
+    async def _close_orchestrator(self, app: web.Application) -> None:
+        """Write any buffered action items on application cleanup."""
+        await asyncio.to_thread(self.orchestrator.close)
+    
+    def _make_webhook_handler(self, name: str, message: str,
+                              process: Callable[[Dict[str, Any]], Awaitable[None]],
+                              body_required: bool) -> Callable[[web.Request], Awaitable[web.Response]]:
         """
-        Handle webhook requests for Slack processing.
+        Build a handler for a webhook that starts a pipeline in the background.
         
         Args:
-            request: The HTTP request
+            name: Name of the webhook used in log messages
+            message: Message returned when processing starts
+            process: Coroutine function that runs the pipeline for a request body
+            body_required: Whether a missing or invalid JSON body is an error
             
         Returns:
-            HTTP response
+            The request handler
         """
-        try:
-            # Validate the webhook token for security
-            if not self._validate_webhook_token(request):
-                return web.json_response(
-                    {"error": "Invalid webhook token"}, 
-                    status=401
+        async def handler(request: web.Request) -> web.Response:
+            try:
+                # Parse the request body once and use it for validation as well
+                try:
+                    body = await _read_json(request)
+                except json.JSONDecodeError:
+                    if body_required:
+                        raise
+                    body = {}
+                
+                # Validate the webhook token for security
+                if not self._validate_webhook_token(request, body):
+                    return _json_response(
+                        {"error": "Invalid webhook token"}, 
+                        status=401
+                    )
+                
+                logger.info(f"Received {name} webhook: {body}")
+                
+                # Start the pipeline in the background
+                self._spawn(process(body))
+                
+                return _json_response({
+                    "status": "processing",
+                    "message": message,
+                    "timestamp": datetime.now().isoformat()
+                })
+                
+            except json.JSONDecodeError:
+                logger.error("Invalid JSON in webhook request")
+                return _json_response(
+                    {"error": "Invalid JSON"}, 
+                    status=400
                 )
-            
-            # Parse the request body
-            body = await request.json()
-            logger.info(f"Received Slack webhook: {body}")
-            
-            # Start the Slack processing pipeline
-            asyncio.create_task(self._process_slack_webhook(body))
-            
-            return web.json_response({
-                "status": "processing",
-                "message": "Slack processing started",
-                "timestamp": datetime.now().isoformat()
-            })
-            
-        except json.JSONDecodeError:
-            logger.error("Invalid JSON in webhook request")
-            return web.json_response(
-                {"error": "Invalid JSON"}, 
-                status=400
-            )
-            
-        except Exception as e:
-            logger.error(f"Error handling Slack webhook: {str(e)}")
-            return web.json_response(
-                {"error": str(e)}, 
-                status=500
-            )
+                
+            except Exception as e:
+                logger.error(f"Error handling {name} webhook: {str(e)}")
+                return _json_response(
+                    {"error": str(e)}, 
+                    status=500
+                )
+        
+        return handler
     
-    async def handle_summary_webhook(self, request: web.Request) -> web.Response:
+    async def health_check(self, request: web.Request) -> web.Response:
         """
-        Handle webhook requests for summary generation.
+        Health check endpoint.
         
         Args:
             request: The HTTP request
@@ -154,41 +203,16 @@ class WebhookHandler:
         Returns:
             HTTP response
         """
-        try:
-            # Validate the webhook token for security
-            if not self._validate_webhook_token(request):
-                return web.json_response(
-                    {"error": "Invalid webhook token"}, 
-                    status=401
-                )
-            
-            # Parse the request body (may be empty)
-            try:
-                body = await request.json()
-            except:
-                body = {}
-                
-            logger.info(f"Received summary webhook: {body}")
-            
-            # Start the summary generation pipeline
-            asyncio.create_task(self._process_summary_webhook(body))
-            
-            return web.json_response({
-                "status": "processing",
-                "message": "Summary generation started",
-                "timestamp": datetime.now().isoformat()
-            })
-            
-        except Exception as e:
-            logger.error(f"Error handling summary webhook: {str(e)}")
-            return web.json_response(
-                {"error": str(e)}, 
-                status=500
-            )
+        return _json_response({
+            "status": "healthy",
+            "timestamp": datetime.now().isoformat(),
+            "pipeline_history_count": len(self.orchestrator.pipeline_history),
+            "total_pipelines": self.orchestrator.total_pipelines
+        })
     
-    async def health_check(self, request: web.Request) -> web.Response:
+    async def metrics(self, request: web.Request) -> web.Response:
         """
-        Health check endpoint.
+        Metrics endpoint with pipeline counters.
         
         Args:
             request: The HTTP request
@@ -196,10 +220,10 @@ class WebhookHandler:
         Returns:
             HTTP response
         """
-        return web.json_response({
-            "status": "healthy",
-            "timestamp": datetime.now().isoformat(),
-            "pipeline_history_count": len(self.orchestrator.pipeline_history)
+        return _json_response({
+            "total_pipelines": self.orchestrator.total_pipelines,
+            "pipeline_history_count": len(self.orchestrator.pipeline_history),
+            "background_tasks": len(self._background_tasks)
         })
     
     async def _process_email_webhook(self, body: Dict[str, Any]) -> None:
@@ -269,46 +293,46 @@ class WebhookHandler:
         except Exception as e:
             logger.error(f"Error in _process_summary_webhook: {str(e)}")
     
-    def _validate_webhook_token(self, request: web.Request) -> bool:
+    def _validate_webhook_token(self, request: web.Request,
+                                body: Optional[Dict[str, Any]] = None) -> bool:
         """
         Validate the webhook token in the request.
         
         Args:
             request: The HTTP request
+            body: The already parsed request body, if any
             
         Returns:
             True if the token is valid, False otherwise
         """
-        # Get the expected token from environment
-        expected_token = os.getenv("WEBHOOK_TOKEN")
-        if not expected_token:
+        # The expected token is read from the environment once at startup
+        if not self._expected_token:
             logger.warning("WEBHOOK_TOKEN not set in environment")
             return False
         
-        # Get the token from the request
-        token = None
-        
-        # Check the Authorization header
+        # Check the Authorization header against the full expected value
         auth_header = request.headers.get("Authorization")
         if auth_header:
-            if auth_header.startswith("Bearer "):
-                token = auth_header[7:]
+            return hmac.compare_digest(
+                auth_header.encode("utf-8", "surrogateescape"),
+                self._expected_auth
+            )
         
-        # If no token in header, check the query string
-        if not token:
-            token = request.query.get("token")
+        # If no header, check the query string
+        token = request.query.get("token")
         
-        # If still no token, check the body
-        if not token and request.body_exists:
-            try:
-                body = request.json()
-                token = body.get("token")
-            except:
-                pass
+        # If still no token, check the parsed body
+        if not token and isinstance(body, dict):
+            token = body.get("token")
         
         # Validate the token
         if not token:
             logger.warning("No token found in request")
             return False
         
-        return token == expected_token
\ No newline at end of file
+        # A JSON body can carry any type, which would fail to encode
+        if not isinstance(token, str):
+            logger.warning("Webhook token is not a string")
+            return False
+        
+        return hmac.compare_digest(token.encode("utf-8", "surrogatepass"), self._expected_token)
\ No newline at end of file
@@ -3,26 +3,359 @@ Action item processor for ICAP.
 """
 import os
 import json
+import time
+import atexit
+import hashlib
 import logging
-import uuid
-from datetime import datetime
-from typing import Dict, Any, List, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, SimpleQueue
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+from cachetools import TTLCache
 
 from python_components.utils.neo4j_manager import Neo4jManager
 from python_components.utils.claude_processor import ClaudeProcessor
+from python_components.utils.ids import new_ids
 
 logger = logging.getLogger("icap.processor")
 
+# Sort order for action item priorities (unknown priorities sort last)
+_PRIORITY_ORDER = {"high": 0, "medium": 1, "low": 2}
+
+# Far future date used to sort items without a due date last
+_NO_DUE_DATE = "9999-12-31"
+
+# Size and lifetime (seconds) of the cache of already processed messages
+PROCESSED_CACHE_SIZE = 10000
+PROCESSED_CACHE_TTL = 3600
+
+# Maximum rows and seconds buffered before background Neo4j writes are flushed
+WRITE_BATCH_SIZE = 200
+WRITE_BATCH_INTERVAL = 0.05
+
+# Maximum rows written at once when the background writer has fallen behind
+WRITE_BACKLOG_SIZE = 5000
+
+# Source-specific fields copied into daily summary items
+_SOURCE_FIELDS = {
+    "email": ("subject", "sender"),
+    "slack": ("channel_id",)
+}
+
+def _content_key(source: str, source_id: str, content: str) -> Tuple[str, str, bytes]:
+    """
+    Build the cache key identifying a message by source, ID and content.
+    
+    Args:
+        source: Source of the message (email/slack)
+        source_id: ID of the message in its source
+        content: The content sent to Claude for extraction
+        
+    Returns:
+        Cache key for the message
+    """
+    return (source, source_id, hashlib.blake2b(content.encode(), digest_size=16).digest())
+
+def _email_content(email_data: Dict[str, Any]) -> str:
+    """
+    Build the content sent to Claude for an email.
+    
+    Args:
+        email_data: Dictionary containing email data
+        
+    Returns:
+        Subject, sender and body combined for analysis
+    """
+    subject = email_data.get("subject") or "No Subject"
+    sender = email_data.get("from") or "Unknown"
+    body = email_data.get("body") or ""
+    return f"Subject: {subject}\n\nFrom: {sender}\n\n{body}"
+
+def _slack_content(message_data: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+    """
+    Build the content sent to Claude for a Slack message.
+    
+    Args:
+        message_data: Dictionary containing Slack message data
+        
+    Returns:
+        Tuple of the content for analysis and the sender identifier, if any
+    """
+    user = message_data.get("user")
+    sender_info = ""
+    sender_identifier = None
+    
+    # Add sender information if available, preferring email to identify the person
+    if user:
+        if isinstance(user, dict):
+            sender_info = f"From: {user.get('name', 'Unknown')}"
+            if user.get("email"):
+                sender_info += f" ({user['email']})"
+            sender_identifier = user.get("email") or user.get("name") or str(user)
+        else:
+            sender_info = f"From: {user}"
+            sender_identifier = str(user)
+    
+    channel_id = message_data.get("channelId") or "Unknown"
+    text = message_data.get("text") or ""
+    content = f"{sender_info}\n\nChannel: {channel_id}\n\n{text}"
+    return content, sender_identifier
+
+def _action_item_rows(items: List[Dict[str, Any]], source: str, source_id: str,
+                      source_fields: Dict[str, Any], sender_identifier: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    Build the bulk-write rows for the action items extracted from one message.
+    
+    Args:
+        items: Enhanced action items extracted from the message
+        source: Source of the message (email/slack)
+        source_id: ID of the message in its source
+        source_fields: Source-specific properties stored on every action item
+        sender_identifier: Person linked to every action item as sender, if any
+        
+    Returns:
+        Rows for Neo4jManager.create_action_items_bulk
+    """
+    # Items from the same message share one creation timestamp and sender link
+    created_at = datetime.now().isoformat()
+    sender_link = [(sender_identifier, "SENT_BY")] if sender_identifier else []
+    
+    return [
+        {
+            "action_item": {
+                "id": item_id,
+                "content": item.get("content", ""),
+                "source": source,
+                "source_id": source_id,
+                "created_at": created_at,
+                "due_date": item.get("due_date"),
+                "priority": item.get("priority", "medium"),
+                "status": "pending",
+                **source_fields,
+                **({"dependencies": item["dependencies"]} if "dependencies" in item else {})
+            },
+            "people": ([(item["assignee"], "ASSIGNED_TO")] if item.get("assignee") else []) + sender_link,
+            "projects": [item["project"]] if item.get("project") else []
+        }
+        for item, item_id in zip(items, new_ids(len(items)))
+    ]
+
 class ActionItemProcessor:
     """Processor for action items from various sources."""
     
-    def __init__(self):
-        """Initialize the processor with required components."""
-        self.neo4j = Neo4jManager()
-        self.claude = ClaudeProcessor()
+    def __init__(self, neo4j: Optional[Neo4jManager] = None, claude: Optional[ClaudeProcessor] = None):
+        """
+        Initialize the processor with required components.
+        
+        Args:
+            neo4j: Shared Neo4j manager, so its driver connection pool is reused
+            claude: Shared Claude processor, so its API client and caches are reused
+        """
+        self.neo4j = neo4j or Neo4jManager()
+        self.claude = claude or ClaudeProcessor()
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("CLAUDE_CONCURRENCY", "4")),
+            thread_name_prefix="icap-claude"
+        )
+        
+        # Results of recently processed messages, so retried webhooks are skipped
+        self._processed = TTLCache(maxsize=PROCESSED_CACHE_SIZE, ttl=PROCESSED_CACHE_TTL)
+        self._processed_lock = threading.Lock()
+        
+        # Action item rows waiting to be written by the background writer, if started
+        self._writes: SimpleQueue = SimpleQueue()
+        self._writer_thread: Optional[threading.Thread] = None
+        
+        # Messages whose action items the background writer failed to store
+        self.failed_writes = 0
         logger.info("Action item processor initialized")
     
-    def process_email(self, email_data: Dict[str, Any]) -> List[str]:
+    def start_background_writes(self) -> None:
+        """
+        Write action items to Neo4j from a background thread.
+        
+        Processing then returns as soon as the action item IDs are known, and rows
+        from concurrently processed messages are combined into bulk writes.
+        """
+        if self._writer_thread and self._writer_thread.is_alive():
+            return
+        
+        self._writer_thread = threading.Thread(target=self._drain_writes, name="icap-neo4j-writer")
+        self._writer_thread.daemon = True
+        self._writer_thread.start()
+        
+        # Write any buffered rows before the interpreter exits
+        atexit.register(self.close)
+    
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        Wait until all action items queued so far are written to Neo4j.
+        
+        Args:
+            timeout: Maximum number of seconds to wait
+            
+        Returns:
+            True if the queued writes completed, False on timeout
+        """
+        if not (self._writer_thread and self._writer_thread.is_alive()):
+            return True
+        
+        flushed = threading.Event()
+        self._writes.put(flushed)
+        return flushed.wait(timeout)
+    
+    def close(self) -> None:
+        """Write any queued action items and stop the background writer and Claude workers."""
+        if self._writer_thread and self._writer_thread.is_alive():
+            self._writes.put(None)
+            self._writer_thread.join(timeout=10.0)
+        self._writer_thread = None
+        self._executor.shutdown(wait=False)
+    
+    def _store_rows(self, cache_key: Tuple[str, str, bytes], rows: List[Dict[str, Any]]) -> List[str]:
+        """
+        Store the action item rows of one message, handing them to the background writer when it's running.
+        
+        The message is only remembered as processed once its rows are written, so
+        a retry of a message whose write failed is processed again.
+        
+        Args:
+            cache_key: Key identifying the message the rows were extracted from
+            rows: Rows for Neo4jManager.create_action_items_bulk
+            
+        Returns:
+            List of action item IDs in the rows
+        """
+        if self._writer_thread and self._writer_thread.is_alive():
+            self._writes.put((cache_key, rows))
+        else:
+            self.neo4j.create_action_items_bulk(rows)
+            self._remember_processed(cache_key, rows)
+        return [row["action_item"]["id"] for row in rows]
+    
+    def _drain_writes(self) -> None:
+        """Write queued action item rows to Neo4j in bulk."""
+        logger.info("Neo4j background writer started")
+        
+        running = True
+        while running:
+            try:
+                item = self._writes.get(timeout=1)
+            except Empty:
+                continue
+            
+            # Collect rows until the batch is full or the interval is over, then take
+            # whatever else is already waiting, stopping at a flush event or the None
+            # shutdown sentinel; a backlog is then written in one sharded pass
+            rows = []
+            messages = []
+            flushed = None
+            deadline = time.monotonic() + WRITE_BATCH_INTERVAL
+            while True:
+                if item is None:
+                    running = False
+                    break
+                if isinstance(item, threading.Event):
+                    flushed = item
+                    break
+                
+                messages.append(item)
+                rows.extend(item[1])
+                if len(rows) >= WRITE_BACKLOG_SIZE:
+                    break
+                remaining = deadline - time.monotonic()
+                try:
+                    if len(rows) >= WRITE_BATCH_SIZE or remaining <= 0:
+                        item = self._writes.get_nowait()
+                    else:
+                        item = self._writes.get(timeout=remaining)
+                except Empty:
+                    break
+            
+            if rows:
+                try:
+                    self.neo4j.create_action_items_sharded(rows)
+                except Exception as e:
+                    logger.warning("Failed to write %d action items to Neo4j, writing per message: %s",
+                                   len(rows), e)
+                    self._write_messages(messages)
+                else:
+                    for cache_key, message_rows in messages:
+                        self._remember_processed(cache_key, message_rows)
+            if flushed is not None:
+                flushed.set()
+        
+        logger.info("Neo4j background writer stopped")
+    
+    def _write_messages(self, messages: List[Tuple[Tuple[str, str, bytes], List[Dict[str, Any]]]]) -> None:
+        """
+        Write the rows of each message separately, so one bad message doesn't lose the others.
+        
+        Messages whose write fails are counted in failed_writes and not remembered,
+        so their retries are processed again.
+        
+        Args:
+            messages: (cache key, rows) pairs taken off the write queue
+        """
+        for cache_key, message_rows in messages:
+            try:
+                self.neo4j.create_action_items_bulk(message_rows)
+            except Exception as e:
+                self.failed_writes += 1
+                logger.error("Failed to write %d action items of %s message %s to Neo4j: %s",
+                             len(message_rows), cache_key[0], cache_key[1], e)
+            else:
+                self._remember_processed(cache_key, message_rows)
+    
+    def _get_processed(self, key: Tuple[str, str, bytes]) -> Optional[List[str]]:
+        """Return the action item IDs stored for an already processed message."""
+        with self._processed_lock:
+            action_item_ids = self._processed.get(key)
+        return list(action_item_ids) if action_item_ids is not None else None
+    
+    def _remember_processed(self, key: Tuple[str, str, bytes], rows: List[Dict[str, Any]]) -> None:
+        """Remember the action item IDs written for a processed message."""
+        action_item_ids = [row["action_item"]["id"] for row in rows]
+        with self._processed_lock:
+            self._processed[key] = action_item_ids
+    
+    def _enhance_items(self, action_items: List[Dict[str, Any]], content: str) -> List[Dict[str, Any]]:
+        """
+        Enhance action items with context analysis, calling Claude concurrently.
+        
+        Args:
+            action_items: Action items extracted from the content
+            content: The source content the items were extracted from
+            
+        Returns:
+            Action items in their original order, enhanced where needed
+        """
+        # Only perform deeper analysis for items with missing fields
+        pending = [
+            index for index, item in enumerate(action_items)
+            if not item.get("assignee") or not item.get("due_date") or item.get("priority") == "medium"
+        ]
+        if not pending:
+            return list(action_items)
+        
+        enhanced_items = list(action_items)
+        if len(pending) == 1:
+            enhanced_items[pending[0]] = self.claude.analyze_action_item_context(action_items[pending[0]], content)
+            return enhanced_items
+        
+        # Each analysis is a separate API round trip, so issue them in parallel
+        results = self._executor.map(
+            lambda index: self.claude.analyze_action_item_context(action_items[index], content),
+            pending
+        )
+        for index, enhanced_item in zip(pending, results):
+            enhanced_items[index] = enhanced_item
+        return enhanced_items
+    
+    def process_email(self, email_data: Dict[str, Any],
+                      action_items: Optional[List[Dict[str, Any]]] = None) -> List[str]:
         """
         Process email data to extract and store action items.
         
@@ -33,76 +366,53 @@ class ActionItemProcessor:
                 - from: Sender
                 - body: Email body text
                 - date: Email date
+            action_items: Action items already extracted for this email, e.g. by
+                process_batch; extracted with Claude when not given
                 
         Returns:
             List of action item IDs that were created
         """
-        logger.info(f"Processing email: {email_data.get('subject', 'No Subject')}")
+        # Look up the email fields once; they are reused for every action item
+        subject = email_data.get("subject") or "No Subject"
+        sender = email_data.get("from") or ""
+        source_id = email_data.get("id", "")
+        
+        logger.info("Processing email: %s", subject)
         
         # Combine subject and body for analysis
-        content = f"Subject: {email_data.get('subject', 'No Subject')}\n\nFrom: {email_data.get('from', 'Unknown')}\n\n{email_data.get('body', '')}"
+        content = _email_content(email_data)
+        
+        # Skip emails that were already processed, e.g. on webhook retries
+        cache_key = _content_key("email", source_id, content)
+        cached_ids = self._get_processed(cache_key)
+        if cached_ids is not None:
+            logger.info("Email already processed, skipping")
+            return cached_ids
         
         # Extract action items using Claude
-        action_items = self.claude.extract_action_items(content, 'email')
+        if action_items is None:
+            action_items = self.claude.extract_action_items(content, 'email')
         
         if not action_items:
+            # Not remembered, as extraction failures also return no items; the
+            # Claude processor caches genuinely empty results itself
             logger.info("No action items found in email")
             return []
             
         # Add context for any items that could benefit from deeper analysis
-        enhanced_items = []
-        for item in action_items:
-            # Only perform deeper analysis for items with missing fields
-            if not item.get("assignee") or not item.get("due_date") or item.get("priority") == "medium":
-                # Try to enhance with context analysis
-                enhanced_item = self.claude.analyze_action_item_context(item, content)
-                enhanced_items.append(enhanced_item)
-            else:
-                enhanced_items.append(item)
+        enhanced_items = self._enhance_items(action_items, content)
         
-        # Store action items in Neo4j
-        action_item_ids = []
-        for item in enhanced_items:
-            # Generate unique ID
-            item_id = str(uuid.uuid4())
-            
-            # Create action item in Neo4j
-            neo4j_item = {
-                "id": item_id,
-                "content": item.get("content", ""),
-                "source": "email",
-                "source_id": email_data.get("id", ""),
-                "created_at": datetime.now().isoformat(),
-                "due_date": item.get("due_date"),
-                "priority": item.get("priority", "medium"),
-                "status": "pending",
-                "sender": email_data.get("from", ""),
-                "subject": email_data.get("subject", "No Subject")
-            }
-            
-            # Add any dependencies if they exist
-            if "dependencies" in item:
-                neo4j_item["dependencies"] = item.get("dependencies")
-                
-            self.neo4j.create_action_item(neo4j_item)
-            action_item_ids.append(item_id)
-            
-            # Link to people
-            if "assignee" in item and item["assignee"]:
-                self.neo4j.link_action_to_person(item_id, item["assignee"], "ASSIGNED_TO")
-                
-            # Add sender as a person too and create SENT_BY relationship
-            if email_data.get("from"):
-                self.neo4j.link_action_to_person(item_id, email_data["from"], "SENT_BY")
-            
-            # Link to projects
-            if "project" in item and item["project"]:
-                self.neo4j.link_action_to_project(item_id, item["project"])
+        # Build all action items and their links, then store them in one round trip
+        rows = _action_item_rows(
+            enhanced_items, "email", source_id, {"sender": sender, "subject": subject}, sender
+        )
+        action_item_ids = self._store_rows(cache_key, rows)
         
-        logger.info(f"Processed {len(action_item_ids)} action items from email")
+        logger.info("Processed %d action items from email", len(action_item_ids))
         return action_item_ids
     
-    def process_slack_message(self, message_data: Dict[str, Any]) -> List[str]:
+    def process_slack_message(self, message_data: Dict[str, Any],
+                              action_items: Optional[List[Dict[str, Any]]] = None) -> List[str]:
         """
         Process Slack message data to extract and store action items.
         
@@ -113,91 +423,142 @@ class ActionItemProcessor:
                 - user: User who sent the message
                 - channelId: Channel ID
                 - timestamp: Message timestamp
+            action_items: Action items already extracted for this message, e.g. by
+                process_batch; extracted with Claude when not given
                 
         Returns:
             List of action item IDs that were created
         """
-        logger.info(f"Processing Slack message from channel: {message_data.get('channelId', 'Unknown')}")
-        
-        # Prepare message with context
-        msg_text = message_data.get("text", "")
-        sender_info = ""
-        
-        # Add sender information if available
-        if message_data.get("user"):
-            if isinstance(message_data["user"], dict):
-                sender_info = f"From: {message_data['user'].get('name', 'Unknown')}"
-                if message_data["user"].get("email"):
-                    sender_info += f" ({message_data['user']['email']})"
-            else:
-                sender_info = f"From: {message_data['user']}"
-                
-        # Combine sender info and message
-        content = f"{sender_info}\n\nChannel: {message_data.get('channelId', 'Unknown')}\n\n{msg_text}"
+        # Look up the message fields once; they are reused for every action item
+        channel_id = message_data.get("channelId", "")
+        source_id = message_data.get("id", "")
+        timestamp = message_data.get("timestamp", "")
+        
+        logger.info("Processing Slack message from channel: %s", channel_id or "Unknown")
+        
+        # Combine sender info and message, identifying the sender by email if possible
+        content, sender_identifier = _slack_content(message_data)
+        
+        # Skip messages that were already processed, e.g. on webhook retries
+        cache_key = _content_key("slack", source_id, content)
+        cached_ids = self._get_processed(cache_key)
+        if cached_ids is not None:
+            logger.info("Slack message already processed, skipping")
+            return cached_ids
         
         # Extract action items using Claude
-        action_items = self.claude.extract_action_items(content, 'slack')
+        if action_items is None:
+            action_items = self.claude.extract_action_items(content, 'slack')
         
         if not action_items:
+            # Not remembered, as extraction failures also return no items; the
+            # Claude processor caches genuinely empty results itself
             logger.info("No action items found in Slack message")
             return []
             
         # Add context for any items that could benefit from deeper analysis
-        enhanced_items = []
-        for item in action_items:
-            # Only perform deeper analysis for items with missing fields
-            if not item.get("assignee") or not item.get("due_date") or item.get("priority") == "medium":
-                # Try to enhance with context analysis
-                enhanced_item = self.claude.analyze_action_item_context(item, content)
-                enhanced_items.append(enhanced_item)
-            else:
-                enhanced_items.append(item)
+        enhanced_items = self._enhance_items(action_items, content)
         
-        # Store action items in Neo4j
-        action_item_ids = []
-        for item in enhanced_items:
-            # Generate unique ID
-            item_id = str(uuid.uuid4())
-            
-            # Create action item in Neo4j
-            neo4j_item = {
-                "id": item_id,
-                "content": item.get("content", ""),
-                "source": "slack",
-                "source_id": message_data.get("id", ""),
-                "created_at": datetime.now().isoformat(),
-                "due_date": item.get("due_date"),
-                "priority": item.get("priority", "medium"),
-                "status": "pending",
-                "channel_id": message_data.get("channelId", ""),
-                "timestamp": message_data.get("timestamp", "")
-            }
+        # Build all action items and their links, then store them in one round trip
+        rows = _action_item_rows(
+            enhanced_items, "slack", source_id, {"channel_id": channel_id, "timestamp": timestamp}, sender_identifier
+        )
+        action_item_ids = self._store_rows(cache_key, rows)
+        
+        logger.info("Processed %d action items from Slack message", len(action_item_ids))
+        return action_item_ids
+    
+    def _unprocessed_contents(self, messages: List[Dict[str, Any]], content_type: str) -> Dict[int, str]:
+        """
+        Build the Claude content of each message that was not processed already.
+        
+        Args:
+            messages: List of email or Slack message dictionaries
+            content_type: Type of the messages ('email' or 'slack')
             
-            # Add any dependencies if they exist
-            if "dependencies" in item:
-                neo4j_item["dependencies"] = item.get("dependencies")
-                
-            self.neo4j.create_action_item(neo4j_item)
-            action_item_ids.append(item_id)
+        Returns:
+            Mapping of message position to content for analysis
+        """
+        build_content: Callable[[Dict[str, Any]], str]
+        if content_type == "email":
+            build_content = _email_content
+        elif content_type == "slack":
+            build_content = lambda data: _slack_content(data)[0]
+        else:
+            raise ValueError(f"Unsupported content type: {content_type}")
+        
+        contents = {}
+        for index, message in enumerate(messages):
+            content = build_content(message)
+            if self._get_processed(_content_key(content_type, message.get("id", ""), content)) is None:
+                contents[index] = content
+        return contents
+    
+    def _store_extracted(self, messages: List[Dict[str, Any]], content_type: str,
+                         extracted: Dict[int, List[Dict[str, Any]]]) -> List[List[str]]:
+        """
+        Store the action items extracted for each message, in input order.
+        
+        Args:
+            messages: List of email or Slack message dictionaries
+            content_type: Type of the messages ('email' or 'slack')
+            extracted: Mapping of message position to extracted action items
             
-            # Link to people
-            if "assignee" in item and item["assignee"]:
-                self.neo4j.link_action_to_person(item_id, item["assignee"], "ASSIGNED_TO")
+        Returns:
+            List of created action item IDs for each message
+        """
+        process = self.process_email if content_type == "email" else self.process_slack_message
+        
+        # Messages without extracted items are extracted individually
+        return [process(message, extracted.get(index)) for index, message in enumerate(messages)]
+    
+    def process_batch(self, messages: List[Dict[str, Any]], content_type: str) -> List[List[str]]:
+        """
+        Process many emails or Slack messages, extracting their action items in one Claude batch.
+        
+        Args:
+            messages: List of email or Slack message dictionaries
+            content_type: Type of the messages ('email' or 'slack')
             
-            # Link message sender as person if available
-            if isinstance(message_data.get("user"), dict) and message_data["user"].get("email"):
-                self.neo4j.link_action_to_person(item_id, message_data["user"]["email"], "SENT_BY")
-            elif isinstance(message_data.get("user"), dict) and message_data["user"].get("name"):
-                self.neo4j.link_action_to_person(item_id, message_data["user"]["name"], "SENT_BY")
-            elif message_data.get("user"):
-                self.neo4j.link_action_to_person(item_id, str(message_data["user"]), "SENT_BY")
+        Returns:
+            List of created action item IDs for each message, in input order
+        """
+        contents = self._unprocessed_contents(messages, content_type)
+        logger.info("Processing batch of %d %s messages", len(messages), content_type)
+        
+        # Batch custom IDs are restricted to [a-zA-Z0-9_-], so refer to messages by position
+        results = self.claude.extract_action_items_batch({
+            f"msg-{index}": (content, content_type) for index, content in contents.items()
+        })
+        extracted = {
+            index: results[f"msg-{index}"] for index in contents if f"msg-{index}" in results
+        }
+        return self._store_extracted(messages, content_type, extracted)
+    
+    def process_messages(self, messages: List[Dict[str, Any]], content_type: str) -> List[List[str]]:
+        """
+        Process many emails or Slack messages, extracting their action items concurrently.
+        
+        Unlike process_batch this returns as soon as the individual Claude calls do,
+        so it suits small batches that cannot wait for the Message Batches API.
+        
+        Args:
+            messages: List of email or Slack message dictionaries
+            content_type: Type of the messages ('email' or 'slack')
             
-            # Link to projects
-            if "project" in item and item["project"]:
-                self.neo4j.link_action_to_project(item_id, item["project"])
+        Returns:
+            List of created action item IDs for each message, in input order
+        """
+        contents = self._unprocessed_contents(messages, content_type)
+        logger.info("Processing %d %s messages concurrently", len(messages), content_type)
         
-        logger.info(f"Processed {len(action_item_ids)} action items from Slack message")
-        return action_item_ids
+        # Each extraction is a separate API round trip, so issue them in parallel
+        results = self._executor.map(
+            lambda content: self.claude.extract_action_items(content, content_type),
+            contents.values()
+        )
+        extracted = dict(zip(contents, results))
+        return self._store_extracted(messages, content_type, extracted)
     
     def generate_daily_summary(self) -> Dict[str, Any]:
         """
@@ -208,33 +569,23 @@ class ActionItemProcessor:
         """
         logger.info("Generating daily summary")
         
-        # Get pending action items
-        pending_items = self.neo4j.get_action_items_by_status("pending")
+        # Include action items still waiting for the background writer
+        if not self.flush():
+            logger.warning("Timed out waiting for queued action items before the daily summary")
         
-        # Transform Neo4j objects to summary format
-        summary_items = []
-        for item in pending_items:
-            # Get related projects for this item
-            project = item.get("project")
-            if not project:
-                # Try to query Neo4j for linked projects
-                try:
-                    projects = self.neo4j.get_projects_for_action_item(item["id"])
-                    if projects:
-                        project = projects[0]  # Take first project if multiple
-                except:
-                    project = "Unknown"
+        # Get pending action items with their linked projects and assignees in one query
+        pending_rows = self.neo4j.get_pending_summary()
+        
+        # Transform Neo4j objects to summary format, building the sort keys alongside
+        # so no intermediate list of summary items is needed; the index keeps the
+        # sort stable and stops ties from comparing dicts
+        decorated = []
+        for index, row in enumerate(pending_rows):
+            item = row["item"]
             
-            # Get assignee for this item
-            assignee = item.get("assignee")
-            if not assignee:
-                # Try to query Neo4j for assigned people
-                try:
-                    people = self.neo4j.get_people_for_action_item(item["id"], "ASSIGNED_TO")
-                    if people:
-                        assignee = people[0]  # Take first person if multiple
-                except:
-                    assignee = "Unknown"
+            # Fall back to the first linked project and assigned person
+            project = item.get("project") or (row["projects"][0] if row["projects"] else None)
+            assignee = item.get("assignee") or (row["assignees"][0] if row["assignees"] else None)
             
             # Create summary item
             summary_item = {
@@ -249,64 +600,80 @@ class ActionItemProcessor:
             }
             
             # Add source-specific fields
-            if item["source"] == "email":
-                summary_item["subject"] = item.get("subject", "")
-                summary_item["sender"] = item.get("sender", "")
-            elif item["source"] == "slack":
-                summary_item["channel_id"] = item.get("channel_id", "")
+            for key in _SOURCE_FIELDS.get(item["source"], ()):
+                summary_item[key] = item.get(key, "")
             
             # Add dependencies if available
             if "dependencies" in item:
                 summary_item["dependencies"] = item["dependencies"]
-                
-            summary_items.append(summary_item)
-        
-        # Sort items by priority (high first) and then by due date
-        def sort_key(item):
-            priority_order = {"high": 0, "medium": 1, "low": 2}
-            due_date = item.get("due_date") or "9999-12-31"  # Far future for items without due date
-            return (priority_order.get(item.get("priority"), 3), due_date)
             
-        sorted_items = sorted(summary_items, key=sort_key)
+            # Sort by priority (high first) and then by due date
+            decorated.append((
+                _PRIORITY_ORDER.get(summary_item["priority"], 3),
+                summary_item["due_date"] or _NO_DUE_DATE,
+                index,
+                summary_item
+            ))
+        
+        decorated.sort()
+        sorted_items = [entry[3] for entry in decorated]
         
-        # Group items by project
-        items_by_project = {}
+        # Release the raw rows before grouping; only the summary items are kept
+        del decorated, pending_rows
+        
+        # Date boundaries for due date categorization
+        today = date.today()
+        date_str = today.isoformat()
+        tomorrow = (today + timedelta(days=1)).isoformat()
+        this_week_end = (today + timedelta(days=6 - today.weekday())).isoformat()
+        
+        # Group items by project, priority and due date in a single pass
+        items_by_project: Dict[str, List[Dict[str, Any]]] = {}
+        items_by_priority: Dict[str, List[Dict[str, Any]]] = {"high": [], "medium": [], "low": []}
+        items_by_due_date: Dict[str, List[Dict[str, Any]]] = {
+            "overdue": [],
+            "today": [],
+            "tomorrow": [],
+            "this_week": [],
+            "future": [],
+            "no_date": []
+        }
         for item in sorted_items:
             project = item.get("project") or "Unassigned"
             if project not in items_by_project:
                 items_by_project[project] = []
             items_by_project[project].append(item)
+            
+            priority_bucket = items_by_priority.get(item["priority"])
+            if priority_bucket is not None:
+                priority_bucket.append(item)
+            
+            # "tomorrow" overlaps with "this_week" and "future"
+            due_date = item.get("due_date")
+            if not due_date:
+                items_by_due_date["no_date"].append(item)
+            elif due_date < date_str:
+                items_by_due_date["overdue"].append(item)
+            elif due_date == date_str:
+                items_by_due_date["today"].append(item)
+            else:
+                if due_date == tomorrow:
+                    items_by_due_date["tomorrow"].append(item)
+                if due_date <= this_week_end:
+                    items_by_due_date["this_week"].append(item)
+                else:
+                    items_by_due_date["future"].append(item)
         
         # Create summary with additional metadata
-        today = datetime.now()
-        date_str = today.strftime("%Y-%m-%d")
-        
         summary = {
             "date": date_str,
-            "total_items": len(summary_items),
+            "total_items": len(sorted_items),
             "projects": list(items_by_project.keys()),
             "items_by_project": items_by_project,
-            "items_by_priority": {
-                "high": [i for i in sorted_items if i.get("priority") == "high"],
-                "medium": [i for i in sorted_items if i.get("priority") == "medium"],
-                "low": [i for i in sorted_items if i.get("priority") == "low"]
-            },
-            "action_items": sorted_items
-        }
-        
-        # Add due date categorization
-        today_date = today.date()
-        tomorrow = (today.date().replace(day=today.day + 1)).isoformat()
-        this_week_end = (today.date().replace(day=today.day + (6 - today.weekday()))).isoformat()
-        
-        summary["items_by_due_date"] = {
-            "overdue": [i for i in sorted_items if i.get("due_date") and i.get("due_date") < date_str],
-            "today": [i for i in sorted_items if i.get("due_date") == date_str],
-            "tomorrow": [i for i in sorted_items if i.get("due_date") == tomorrow],
-            "this_week": [i for i in sorted_items if i.get("due_date") and date_str < i.get("due_date") <= this_week_end],
-            "future": [i for i in sorted_items if i.get("due_date") and i.get("due_date") > this_week_end],
-            "no_date": [i for i in sorted_items if not i.get("due_date")]
+            "items_by_priority": items_by_priority,
+            "action_items": sorted_items,
+            "items_by_due_date": items_by_due_date
         }
         
-        logger.info(f"Generated summary with {len(summary_items)} action items across {len(items_by_project)} projects")
+        logger.info("Generated summary with %d action items across %d projects", len(sorted_items), len(items_by_project))
         return summary
\ No newline at end of file
@@ -4,36 +4,43 @@ Tests for the Action Item Processor module.
 import pytest
 import os
 import json
+from datetime import date
 from unittest.mock import patch, MagicMock
 from python_components.processors.action_item_processor import ActionItemProcessor
 
 @pytest.fixture
 def mock_neo4j():
     """Create a mock Neo4j manager."""
-    with patch('python_components.utils.neo4j_manager.Neo4jManager') as mock:
-        manager_instance = MagicMock()
-        mock.return_value = manager_instance
-        yield manager_instance
+    return MagicMock()
 
 @pytest.fixture
 def mock_claude():
     """Create a mock Claude processor."""
-    with patch('python_components.utils.claude_processor.ClaudeProcessor') as mock:
-        processor_instance = MagicMock()
-        mock.return_value = processor_instance
-        yield processor_instance
+    return MagicMock()
 
 @pytest.fixture
 def processor(mock_neo4j, mock_claude):
     """Create an ActionItemProcessor instance with mocked dependencies."""
-    processor = ActionItemProcessor()
-    return processor
+    # The processor imports both classes by name, so inject the mocks directly
+    processor = ActionItemProcessor(neo4j=mock_neo4j, claude=mock_claude)
+    yield processor
+    processor.close()
 
 def test_init(processor, mock_neo4j, mock_claude):
     """Test ActionItemProcessor initialization."""
     assert processor.neo4j == mock_neo4j
     assert processor.claude == mock_claude
 
+def test_init_with_shared_components(mock_neo4j, mock_claude):
+    """Test that shared components are used instead of creating new ones."""
+    neo4j = MagicMock()
+    claude = MagicMock()
+    
+    processor = ActionItemProcessor(neo4j=neo4j, claude=claude)
+    
+    assert processor.neo4j is neo4j
+    assert processor.claude is claude
+
 def test_process_email_no_items(processor, mock_claude):
     """Test processing an email with no action items."""
     # Configure mock to return empty list
@@ -89,9 +96,6 @@ def test_process_email_with_items(processor, mock_claude, mock_neo4j):
     
     mock_claude.analyze_action_item_context.side_effect = mock_analyze
     
-    # Configure Neo4j to return an ID for created items
-    mock_neo4j.create_action_item.return_value = "test-action-id"
-    
     # Call the method
     result = processor.process_email({
         "id": "test-email-id",
@@ -103,12 +107,163 @@ def test_process_email_with_items(processor, mock_claude, mock_neo4j):
     # Verify result has two IDs
     assert len(result) == 2
     
-    # Verify Neo4j was called correctly
-    assert mock_neo4j.create_action_item.call_count == 2
+    # Verify Neo4j was called once for the whole batch
+    mock_neo4j.create_action_items_bulk.assert_called_once()
+    rows = mock_neo4j.create_action_items_bulk.call_args[0][0]
+    assert [row["action_item"]["id"] for row in rows] == result
+    assert rows[0]["action_item"]["created_at"] == rows[1]["action_item"]["created_at"]
+    
+    # Verify links were included
+    assert sum(len(row["people"]) for row in rows) == 4  # 2 assignees + 2 senders
+    assert sum(len(row["projects"]) for row in rows) == 1  # 1 project
+
+def test_process_email_enhances_items_in_order(processor, mock_claude, mock_neo4j):
+    """Test that concurrent context analysis keeps the original item order."""
+    # Configure mock to return several items that all need enhancement
+    mock_claude.extract_action_items.return_value = [
+        {"content": f"Task {i}", "assignee": None, "due_date": None, "priority": "medium"}
+        for i in range(5)
+    ]
+    
+    def mock_analyze(item, content):
+        return dict(item, assignee=f"{item['content']} owner")
+    
+    mock_claude.analyze_action_item_context.side_effect = mock_analyze
+    
+    # Call the method
+    processor.process_email({
+        "id": "test-email-id",
+        "subject": "Test Email",
+        "body": "Several tasks."
+    })
+    
+    # Verify every item was analyzed and stored in order
+    assert mock_claude.analyze_action_item_context.call_count == 5
+    rows = mock_neo4j.create_action_items_bulk.call_args[0][0]
+    assert [row["action_item"]["content"] for row in rows] == [f"Task {i}" for i in range(5)]
+    assert [row["people"][0][0] for row in rows] == [f"Task {i} owner" for i in range(5)]
+
+def test_process_email_skips_duplicates(processor, mock_claude, mock_neo4j):
+    """Test that a replayed email is not extracted or stored again."""
+    mock_claude.extract_action_items.return_value = [
+        {"content": "Review document", "assignee": "john@example.com", "due_date": "2023-05-15", "priority": "high"}
+    ]
+    email = {
+        "id": "test-email-id",
+        "subject": "Test Email",
+        "from": "test@example.com",
+        "body": "Please review the document."
+    }
+    
+    # Process the same email twice
+    first = processor.process_email(email)
+    second = processor.process_email(dict(email))
+    
+    # Verify the second call reused the first result
+    assert second == first
+    mock_claude.extract_action_items.assert_called_once()
+    mock_neo4j.create_action_items_bulk.assert_called_once()
+    
+    # Verify changed content is processed again
+    processor.process_email(dict(email, body="Please review the updated document."))
+    assert mock_claude.extract_action_items.call_count == 2
+
+def test_process_email_retries_empty_results(processor, mock_claude):
+    """Test that an email without extracted items is extracted again when replayed."""
+    mock_claude.extract_action_items.return_value = []
+    email = {"id": "test-email-id", "subject": "Test Email", "body": "Hello"}
+    
+    # A failed extraction must not stop the email from being retried
+    processor.process_email(email)
+    processor.process_email(email)
+    assert mock_claude.extract_action_items.call_count == 2
+
+def test_process_email_background_writes(processor, mock_claude, mock_neo4j):
+    """Test that background writes combine rows from several emails."""
+    mock_claude.extract_action_items.side_effect = lambda content, content_type: [
+        {"content": f"Task from {content.splitlines()[0]}", "assignee": "john@example.com", "due_date": "2023-05-15", "priority": "high"}
+    ]
+    
+    processor.start_background_writes()
+    try:
+        first = processor.process_email({"id": "email-1", "subject": "First", "body": "Task one"})
+        second = processor.process_email({"id": "email-2", "subject": "Second", "body": "Task two"})
+        
+        # Verify the IDs are returned before the rows are written
+        assert len(first) == 1 and len(second) == 1
+        assert processor.flush()
+    finally:
+        processor.close()
+    
+    # Verify every row was written, in order
+    written = [
+        row["action_item"]["id"]
+        for call in mock_neo4j.create_action_items_sharded.call_args_list
+        for row in call[0][0]
+    ]
+    assert written == first + second
+    
+    # Verify writes are synchronous again once the writer is closed
+    mock_neo4j.create_action_items_bulk.assert_not_called()
+    processor.process_email({"id": "email-3", "subject": "Third", "body": "Task three"})
+    assert len(mock_neo4j.create_action_items_bulk.call_args[0][0]) == 1
+
+def test_process_email_failed_background_write_is_retried(processor, mock_claude, mock_neo4j):
+    """Test that an email whose rows failed to write is processed again when replayed."""
+    mock_claude.extract_action_items.return_value = [
+        {"content": "Review document", "assignee": "john@example.com", "due_date": "2023-05-15", "priority": "high"}
+    ]
+    mock_neo4j.create_action_items_sharded.side_effect = [RuntimeError("Neo4j unavailable"), None]
+    mock_neo4j.create_action_items_bulk.side_effect = RuntimeError("Neo4j unavailable")
+    email = {"id": "test-email-id", "subject": "Test Email", "body": "Please review the document."}
+    
+    processor.start_background_writes()
+    try:
+        processor.process_email(email)
+        assert processor.flush()
+        
+        # Verify the replayed email is extracted and written again
+        retried = processor.process_email(email)
+        assert processor.flush()
+        assert processor.process_email(email) == retried
+    finally:
+        processor.close()
     
-    # Verify links were created
-    assert mock_neo4j.link_action_to_person.call_count == 4  # 2 assignees + 2 senders
-    assert mock_neo4j.link_action_to_project.call_count == 1  # 1 project
+    assert mock_claude.extract_action_items.call_count == 2
+    assert mock_neo4j.create_action_items_sharded.call_count == 2
+    assert processor.failed_writes == 1
+
+def test_process_email_failed_batch_written_per_message(processor, mock_claude, mock_neo4j):
+    """Test that a failed batch write falls back to writing each email on its own."""
+    mock_claude.extract_action_items.side_effect = lambda content, content_type: [
+        {"content": f"Task from {content.splitlines()[0]}", "assignee": "john@example.com", "due_date": "2023-05-15", "priority": "high"}
+    ]
+    
+    def write_bulk(rows):
+        if rows[0]["action_item"]["source_id"] == "email-1":
+            raise RuntimeError("Bad row")
+    
+    mock_neo4j.create_action_items_sharded.side_effect = RuntimeError("Bad row")
+    mock_neo4j.create_action_items_bulk.side_effect = write_bulk
+    bad_email = {"id": "email-1", "subject": "First", "body": "Task one"}
+    good_email = {"id": "email-2", "subject": "Second", "body": "Task two"}
+    
+    processor.start_background_writes()
+    try:
+        first = processor.process_email(bad_email)
+        second = processor.process_email(good_email)
+        assert processor.flush()
+        
+        # Verify the good email was written and only the bad one is counted as failed
+        written = [call[0][0][0]["action_item"]["id"] for call in mock_neo4j.create_action_items_bulk.call_args_list]
+        assert written == first + second
+        assert processor.failed_writes == 1
+        
+        # Verify only the email whose own write failed is processed again
+        assert processor.process_email(good_email) == second
+        assert processor.process_email(bad_email) != first
+    finally:
+        processor.close()
 
 def test_process_slack_message(processor, mock_claude, mock_neo4j):
     """Test processing a Slack message."""
@@ -126,9 +281,6 @@ def test_process_slack_message(processor, mock_claude, mock_neo4j):
     # No need for context analysis in this test
     mock_claude.analyze_action_item_context.return_value = mock_claude.extract_action_items.return_value[0]
     
-    # Configure Neo4j to return an ID for created items
-    mock_neo4j.create_action_item.return_value = "test-action-id"
-    
     # Call the method
     result = processor.process_slack_message({
         "id": "test-message-id",
@@ -152,19 +304,87 @@ def test_process_slack_message(processor, mock_claude, mock_neo4j):
     assert call_args[1] == "slack"  # Content type
     
     # Verify Neo4j was called correctly
-    mock_neo4j.create_action_item.assert_called_once()
-    neo4j_item = mock_neo4j.create_action_item.call_args[0][0]
+    mock_neo4j.create_action_items_bulk.assert_called_once()
+    rows = mock_neo4j.create_action_items_bulk.call_args[0][0]
+    neo4j_item = rows[0]["action_item"]
     assert neo4j_item["source"] == "slack"
     assert neo4j_item["channel_id"] == "test-channel"
     
-    # Verify links were created
-    assert mock_neo4j.link_action_to_person.call_count == 2  # assignee + sender
-    assert mock_neo4j.link_action_to_project.call_count == 1  # project
+    # Verify links were included
+    assert rows[0]["people"] == [("@david", "ASSIGNED_TO"), ("john@example.com", "SENT_BY")]
+    assert rows[0]["projects"] == ["Deployment"]
+
+def test_process_batch(processor, mock_claude, mock_neo4j):
+    """Test processing several emails with one batch extraction."""
+    emails = [
+        {"id": "email-1", "subject": "First", "from": "a@example.com", "body": "Please review the document."},
+        {"id": "email-2", "subject": "Second", "from": "b@example.com", "body": "Nothing to do here."},
+        {"id": "email-3", "subject": "Third", "from": "c@example.com", "body": "Please send the report."}
+    ]
+    
+    # The first email was processed already, the third failed in the batch
+    mock_claude.extract_action_items.return_value = [
+        {"content": "Send report", "assignee": "bob@example.com", "due_date": "2023-05-15", "priority": "high"}
+    ]
+    first_ids = processor.process_email(emails[0])
+    mock_claude.extract_action_items.reset_mock()
+    mock_neo4j.create_action_items_bulk.reset_mock()
+    mock_claude.extract_action_items_batch.return_value = {"msg-1": []}
+    
+    # Call the method
+    result = processor.process_batch(emails, "email")
+    
+    # Verify only unprocessed emails were submitted, referenced by position
+    contents = mock_claude.extract_action_items_batch.call_args[0][0]
+    assert list(contents) == ["msg-1", "msg-2"]
+    assert "Second" in contents["msg-1"][0]
+    assert contents["msg-1"][1] == "email"
+    
+    # Verify the failed email was extracted individually
+    mock_claude.extract_action_items.assert_called_once()
+    assert "Third" in mock_claude.extract_action_items.call_args[0][0]
+    
+    # Verify results are returned in input order
+    assert len(result) == 3
+    assert result[0] == first_ids
+    assert result[1] == []
+    assert len(result[2]) == 1
+    mock_neo4j.create_action_items_bulk.assert_called_once()
+
+def test_process_batch_unsupported_type(processor):
+    """Test that an unknown content type is rejected."""
+    with pytest.raises(ValueError):
+        processor.process_batch([], "sms")
+
+def test_process_messages(processor, mock_claude, mock_neo4j):
+    """Test processing several Slack messages with concurrent extraction."""
+    messages = [
+        {"id": "message-1", "text": "Please deploy the app.", "user": "alice", "channelId": "deploys"},
+        {"id": "message-2", "text": "Thanks everyone!", "user": "bob", "channelId": "general"}
+    ]
+    mock_claude.extract_action_items.side_effect = lambda content, content_type: (
+        [{"content": "Deploy app", "assignee": "alice", "due_date": "2023-05-15", "priority": "high"}]
+        if "deploy" in content else []
+    )
+    
+    # Call the method
+    result = processor.process_messages(messages, "slack")
+    
+    # Verify each message was extracted exactly once
+    assert mock_claude.extract_action_items.call_count == 2
+    assert all(call[0][1] == "slack" for call in mock_claude.extract_action_items.call_args_list)
+    mock_claude.extract_action_items_batch.assert_not_called()
+    
+    # Verify results are returned in input order
+    assert len(result[0]) == 1
+    assert result[1] == []
+    rows = mock_neo4j.create_action_items_bulk.call_args[0][0]
+    assert rows[0]["action_item"]["channel_id"] == "deploys"
 
 def test_generate_daily_summary(processor, mock_neo4j):
     """Test generating a daily summary."""
-    # Configure Neo4j to return action items
-    mock_neo4j.get_action_items_by_status.return_value = [
+    # Configure Neo4j to return action items with their projects and assignees
+    items = [
         {
             "id": "item1",
             "content": "High priority task",
@@ -202,31 +422,26 @@ def test_generate_daily_summary(processor, mock_neo4j):
         }
     ]
     
-    # Configure project lookup
-    def mock_get_projects(item_id):
-        if item_id == "item1":
-            return ["Project A"]
-        elif item_id == "item2":
-            return ["Project B"]
-        return []
-    
-    mock_neo4j.get_projects_for_action_item.side_effect = mock_get_projects
-    
-    # Configure assignee lookup
-    def mock_get_people(item_id, rel_type):
-        if item_id == "item1":
-            return ["john@example.com"]
-        elif item_id == "item2":
-            return ["sarah@example.com"]
-        return []
-    
-    mock_neo4j.get_people_for_action_item.side_effect = mock_get_people
+    links = {
+        "item1": (["Project A"], ["john@example.com"]),
+        "item2": (["Project B"], ["sarah@example.com"])
+    }
+    mock_neo4j.get_pending_summary.return_value = [
+        {
+            "item": item,
+            "projects": links.get(item["id"], ([], []))[0],
+            "assignees": links.get(item["id"], ([], []))[1]
+        }
+        for item in items
+    ]
     
     # Call the method
     result = processor.generate_daily_summary()
     
-    # Verify Neo4j was called to get pending items
-    mock_neo4j.get_action_items_by_status.assert_called_once_with("pending")
+    # Verify Neo4j was queried once for pending items and their links
+    mock_neo4j.get_pending_summary.assert_called_once_with()
+    mock_neo4j.get_projects_for_action_item.assert_not_called()
+    mock_neo4j.get_people_for_action_item.assert_not_called()
     
     # Verify the summary structure
     assert "date" in result
@@ -251,4 +466,44 @@ def test_generate_daily_summary(processor, mock_neo4j):
             assert item["assignee"] == "john@example.com"
         elif item["id"] == "item2":
             assert item["project"] == "Project B"
-            assert item["assignee"] == "sarah@example.com"
\ No newline at end of file
+            assert item["assignee"] == "sarah@example.com"
+
+def test_generate_daily_summary_due_dates_at_month_end(processor, mock_neo4j):
+    """Test due date categorization when tomorrow is in the next month."""
+    def make_item(item_id, due_date):
+        return {
+            "id": item_id,
+            "content": "Task",
+            "source": "slack",
+            "created_at": "2023-05-01T10:00:00Z",
+            "due_date": due_date,
+            "priority": "medium",
+            "project": "Project A",
+            "assignee": "john@example.com",
+            "channel_id": "general"
+        }
+    
+    mock_neo4j.get_pending_summary.return_value = [
+        {"item": make_item(item_id, due_date), "projects": [], "assignees": []}
+        for item_id, due_date in [
+            ("overdue", "2023-05-30"),
+            ("today", "2023-05-31"),
+            ("tomorrow", "2023-06-01"),
+            ("future", "2023-06-10"),
+            ("no_date", None)
+        ]
+    ]
+    
+    # Wednesday 31 May 2023, so the week ends on Sunday 4 June
+    with patch('python_components.processors.action_item_processor.date') as mock_date:
+        mock_date.today.return_value = date(2023, 5, 31)
+        result = processor.generate_daily_summary()
+    
+    by_due_date = {k: [i["id"] for i in v] for k, v in result["items_by_due_date"].items()}
+    assert result["date"] == "2023-05-31"
+    assert by_due_date["overdue"] == ["overdue"]
+    assert by_due_date["today"] == ["today"]
+    assert by_due_date["tomorrow"] == ["tomorrow"]
+    assert by_due_date["this_week"] == ["tomorrow"]
+    assert by_due_date["future"] == ["future"]
+    assert by_due_date["no_date"] == ["no_date"]
@@ -4,8 +4,9 @@ Tests for the Claude processor module.
 import pytest
 import os
 import json
+import httpx
 from unittest.mock import patch, MagicMock
-from python_components.utils.claude_processor import ClaudeProcessor
+from python_components.utils.claude_processor import ClaudeProcessor, _shared_http_client
 
 @pytest.fixture
 def mock_env_vars():
@@ -33,7 +34,15 @@ def test_init(claude_processor, mock_anthropic):
     """Test ClaudeProcessor initialization."""
     assert claude_processor.api_key == "test-api-key"
     assert claude_processor.model == "test-model"
-    mock_anthropic[0].assert_called_once_with(api_key="test-api-key")
+    mock_anthropic[0].assert_called_once_with(api_key="test-api-key", http_client=_shared_http_client())
+
+def test_init_shares_http_client(mock_env_vars, mock_anthropic):
+    """Test that Claude processors reuse one pooled HTTP client."""
+    ClaudeProcessor()
+    ClaudeProcessor()
+    
+    first, second = mock_anthropic[0].call_args_list
+    assert first[1]["http_client"] is second[1]["http_client"]
 
 def test_init_missing_api_key():
     """Test ClaudeProcessor initialization with missing API key."""
@@ -254,18 +263,108 @@ def test_extract_action_items_success(claude_processor, mock_anthropic):
     assert len(call_kwargs["messages"]) == 1
     assert call_kwargs["messages"][0]["role"] == "user"
 
+def test_extract_action_items_cached(claude_processor, mock_anthropic):
+    """Test that identical content is only sent to Claude once."""
+    mock_content = MagicMock()
+    mock_content.text = '[{"content": "Review document", "assignee": "John", "priority": "high"}]'
+    mock_response = MagicMock()
+    mock_response.content = [mock_content]
+    mock_anthropic[1].messages.create.return_value = mock_response
+    
+    # Content differing only in case and whitespace is a cache hit
+    first = claude_processor.extract_action_items("Please review this document.", "email")
+    second = claude_processor.extract_action_items("  please  review this\ndocument. ", "email")
+    assert second == first
+    mock_anthropic[1].messages.create.assert_called_once()
+    
+    # Cached items are copies, so callers can modify them
+    second[0]["priority"] = "low"
+    assert claude_processor.extract_action_items("Please review this document.", "email")[0]["priority"] == "high"
+    
+    # The same content from another source is extracted separately
+    claude_processor.extract_action_items("Please review this document.", "slack")
+    assert mock_anthropic[1].messages.create.call_count == 2
+
 def test_extract_action_items_api_error(claude_processor, mock_anthropic):
     """Test extraction with API error."""
     import anthropic
     
     # Configure mock to raise an error
-    mock_anthropic[1].messages.create.side_effect = anthropic.APIError("API Error")
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    mock_anthropic[1].messages.create.side_effect = anthropic.APIError("API Error", request, body=None)
     
     # Call the method
     result = claude_processor.extract_action_items("Please review this document by tomorrow.", "email")
     
     # Verify the result is an empty list on error
     assert result == []
+    
+    # Verify failures are not cached
+    claude_processor.extract_action_items("Please review this document by tomorrow.", "email")
+    assert mock_anthropic[1].messages.create.call_count == 2
+
+def test_extract_action_items_batch(claude_processor, mock_anthropic):
+    """Test extracting action items for many messages in one batch."""
+    batches = mock_anthropic[1].beta.messages.batches
+    
+    # The batch is still in progress when submitted
+    submitted = MagicMock(id="batch-1", processing_status="in_progress")
+    ended = MagicMock(id="batch-1", processing_status="ended")
+    batches.create.return_value = submitted
+    batches.retrieve.return_value = ended
+    
+    succeeded = MagicMock(custom_id="msg-0")
+    succeeded.result.type = "succeeded"
+    succeeded.result.message.content = [MagicMock(text='[{"content": "Deploy app", "assignee": "@david", "priority": "urgent"}]')]
+    errored = MagicMock(custom_id="msg-1")
+    errored.result.type = "errored"
+    batches.results.return_value = [succeeded, errored]
+    
+    # Call the method
+    result = claude_processor.extract_action_items_batch({
+        "msg-0": ("Deploy the app", "slack"),
+        "msg-1": ("Review the document", "email")
+    }, poll_interval=0)
+    
+    # Verify one request per message with the regular extraction parameters
+    requests = batches.create.call_args[1]["requests"]
+    assert [request["custom_id"] for request in requests] == ["msg-0", "msg-1"]
+    assert requests[0]["params"]["model"] == "test-model"
+    assert requests[0]["params"]["temperature"] == 0.0
+    assert requests[0]["params"]["max_tokens"] == 4000
+    assert "Deploy the app" in requests[0]["params"]["messages"][0]["content"]
+    batches.retrieve.assert_called_once_with("batch-1")
+    
+    # Verify only succeeded requests are returned, post-processed per content type
+    assert list(result) == ["msg-0"]
+    assert result["msg-0"][0]["assignee"] == "david"
+    assert result["msg-0"][0]["priority"] == "high"
+    mock_anthropic[1].messages.create.assert_not_called()
+
+def test_extract_action_items_batch_error(claude_processor, mock_anthropic):
+    """Test batch extraction with API error."""
+    import anthropic
+    
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages/batches")
+    mock_anthropic[1].beta.messages.batches.create.side_effect = anthropic.APIError("API Error", request, body=None)
+    
+    # Verify no results are returned so callers fall back to single extraction
+    assert claude_processor.extract_action_items_batch({"msg-0": ("Content", "email")}) == {}
+    assert claude_processor.extract_action_items_batch({}) == {}
+
+def test_extract_action_items_batch_timeout(claude_processor, mock_anthropic):
+    """Test that a batch that does not end in time is cancelled."""
+    batches = mock_anthropic[1].beta.messages.batches
+    batches.create.return_value = MagicMock(id="batch-1", processing_status="in_progress")
+    batches.retrieve.return_value = MagicMock(id="batch-1", processing_status="in_progress")
+    
+    result = claude_processor.extract_action_items_batch({"msg-0": ("Content", "email")},
+                                                         poll_interval=0, timeout=0)
+    
+    # Verify the batch is cancelled and no results are returned
+    assert result == {}
+    batches.cancel.assert_called_once_with("batch-1")
+    batches.results.assert_not_called()
 
 def test_analyze_action_item_context(claude_processor, mock_anthropic):
     """Test analyzing action item context."""
@@ -4,12 +4,41 @@ Tests for the error handling and retry logic.
 import pytest
 import time
 import asyncio
+import logging
 from unittest.mock import patch, MagicMock, call
 from python_components.pipeline.errors import (
     PipelineError, TemporaryError, PermanentError, ResourceNotFoundError,
     ConfigurationError, APIError, with_retry, with_async_retry,
     create_error_report, log_error
 )
+from python_components.pipeline.errors import logger as errors_logger
+
+class _CaptureHandler(logging.Handler):
+    """Logging handler that records the level of each emitted record."""
+    
+    def __init__(self):
+        super().__init__()
+        self.levels = []
+    
+    def emit(self, record):
+        self.levels.append(record.levelno)
+
+async def _no_async_sleep(delay, result=None):
+    """Replacement for asyncio.sleep that returns immediately."""
+    return result
+
+@pytest.fixture
+def make_retried():
+    """Build a mock function and its with_retry-decorated wrapper."""
+    def _make(side_effect, **kwargs):
+        mock_func = MagicMock(side_effect=side_effect)
+        return mock_func, with_retry(**kwargs)(mock_func)
+    return _make
+
+@pytest.fixture
+def fast_traceback(monkeypatch):
+    """Replace traceback formatting in the errors module with a fixed string."""
+    monkeypatch.setattr('python_components.pipeline.errors.traceback.format_exc', lambda *args, **kwargs: "fake\n")
 
 def test_pipeline_error_init():
     """Test PipelineError initialization."""
@@ -71,127 +100,61 @@ def test_api_error_should_retry():
     error = APIError("Client Error", status_code=400)
     assert error.should_retry() is False
 
-def test_with_retry_success():
-    """Test the with_retry decorator with successful execution."""
-    # Create a test function
-    mock_func = MagicMock()
-    mock_func.return_value = "success"
-    
-    # Apply the decorator
-    decorated = with_retry()(mock_func)
-    
-    # Call the decorated function
-    result = decorated()
-    
-    # Verify the result
-    assert result == "success"
-    mock_func.assert_called_once()
-
-def test_with_retry_temporary_error():
-    """Test the with_retry decorator with temporary errors."""
-    # Create a test function that fails twice then succeeds
-    mock_func = MagicMock()
-    mock_func.side_effect = [
-        TemporaryError("Temporary error 1"),
-        TemporaryError("Temporary error 2"),
-        "success"
-    ]
-    
-    # Mock sleep to avoid delays in tests
-    with patch('time.sleep') as mock_sleep:
-        # Apply the decorator
-        decorated = with_retry(max_attempts=3, base_delay=0.1)(mock_func)
-        
-        # Call the decorated function
-        result = decorated()
-        
-        # Verify the result
-        assert result == "success"
-        assert mock_func.call_count == 3
-        assert mock_sleep.call_count == 2
-
-def test_with_retry_permanent_error():
-    """Test the with_retry decorator with permanent errors."""
-    # Create a test function that fails with a permanent error
-    mock_func = MagicMock()
-    mock_func.side_effect = PermanentError("Permanent error")
-    
-    # Apply the decorator
-    decorated = with_retry()(mock_func)
-    
-    # Call the decorated function
-    with pytest.raises(PermanentError, match="Permanent error"):
-        decorated()
-    
-    # Verify the function was called only once
-    mock_func.assert_called_once()
-
-def test_with_retry_max_attempts():
-    """Test the with_retry decorator with maximum attempts reached."""
-    # Create a test function that always fails with a temporary error
-    mock_func = MagicMock()
-    mock_func.side_effect = TemporaryError("Always fails")
-    
-    # Mock sleep to avoid delays in tests
-    with patch('time.sleep'):
-        # Apply the decorator
-        decorated = with_retry(max_attempts=3)(mock_func)
-        
+@pytest.mark.parametrize("side_effect,kwargs,expected,calls,sleeps,raises", [
+    # Succeeds straight away
+    (["success"], {}, "success", 1, 0, None),
+    # Temporary errors are retried until the call succeeds
+    (
+        [TemporaryError("Temporary error 1"), TemporaryError("Temporary error 2"), "success"],
+        {"max_attempts": 3, "base_delay": 0.1}, "success", 3, 2, None
+    ),
+    # Permanent errors are raised without retrying
+    ([PermanentError("Permanent error")], {}, None, 1, 0, PermanentError),
+    # The last temporary error is raised once the attempts run out
+    ([TemporaryError("Always fails")] * 3, {"max_attempts": 3}, None, 3, 2, TemporaryError),
+    # Custom exceptions can be made retryable
+    ([ValueError("Custom error"), "success"], {"retryable_exceptions": [ValueError]}, "success", 2, 1, None),
+], ids=["success", "temporary_error", "permanent_error", "max_attempts", "custom_exceptions"])
+def test_with_retry(make_retried, side_effect, kwargs, expected, calls, sleeps, raises):
+    """Test the with_retry decorator's retry decisions."""
+    mock_func, decorated = make_retried(side_effect, **kwargs)
+    
+    # Record sleeps instead of waiting
+    sleep_times = []
+    with patch('time.sleep', new=sleep_times.append):
         # Call the decorated function
-        with pytest.raises(TemporaryError, match="Always fails"):
-            decorated()
-        
-        # Verify the function was called the maximum number of times
-        assert mock_func.call_count == 3
+        if raises:
+            with pytest.raises(raises):
+                decorated()
+        else:
+            assert decorated() == expected
+    
+    # Verify the number of attempts and waits between them
+    assert mock_func.call_count == calls
+    assert len(sleep_times) == sleeps
 
-def test_with_retry_custom_exceptions():
-    """Test the with_retry decorator with custom retryable exceptions."""
-    # Create a test function that fails with a custom exception then succeeds
-    mock_func = MagicMock()
-    mock_func.side_effect = [
-        ValueError("Custom error"),
-        "success"
-    ]
-    
-    # Mock sleep to avoid delays in tests
-    with patch('time.sleep'):
-        # Apply the decorator with custom retryable exceptions
-        decorated = with_retry(retryable_exceptions=[ValueError])(mock_func)
-        
-        # Call the decorated function
-        result = decorated()
-        
-        # Verify the result
-        assert result == "success"
-        assert mock_func.call_count == 2
-
-def test_with_retry_exponential_backoff():
+@pytest.mark.timing
+def test_with_retry_exponential_backoff(make_retried):
     """Test that with_retry applies exponential backoff."""
-    # Create a test function that fails multiple times
-    mock_func = MagicMock()
-    mock_func.side_effect = [
-        TemporaryError("Error 1"),
-        TemporaryError("Error 2"),
-        TemporaryError("Error 3"),
-        "success"
-    ]
-    
-    # Mock sleep to capture delay values
+    # Create a test function that fails multiple times, decorated with
+    # specific backoff parameters and no jitter for predictable testing
+    mock_func, decorated = make_retried(
+        [
+            TemporaryError("Error 1"),
+            TemporaryError("Error 2"),
+            TemporaryError("Error 3"),
+            "success"
+        ],
+        max_attempts=4,
+        base_delay=1.0,
+        backoff_factor=2.0,
+        jitter=0.0
+    )
+    
+    # Record sleeps to capture delay values
     sleep_times = []
     
-    def mock_sleep_func(seconds):
-        sleep_times.append(seconds)
-    
-    with patch('time.sleep', side_effect=mock_sleep_func):
-        # Apply the decorator with specific backoff parameters
-        # Remove jitter for predictable testing
-        decorated = with_retry(
-            max_attempts=4, 
-            base_delay=1.0, 
-            backoff_factor=2.0,
-            jitter=0.0
-        )(mock_func)
-        
+    with patch('time.sleep', new=sleep_times.append):
         # Call the decorated function
         result = decorated()
         
@@ -221,8 +184,8 @@ async def test_with_async_retry():
         "async success"
     ]
     
-    # Mock asyncio.sleep to avoid delays in tests
-    with patch('asyncio.sleep', return_value=None):
+    # Skip asyncio.sleep to avoid delays in tests
+    with patch('asyncio.sleep', new=_no_async_sleep):
         # Call the function with retry
         result = await with_async_retry(
             mock_async, 
@@ -235,7 +198,7 @@ async def test_with_async_retry():
         assert result == "async success"
         assert mock_func.call_count == 3
 
-def test_create_error_report():
+def test_create_error_report(fast_traceback):
     """Test creating an error report."""
     # Create a test error
     original = ValueError("Original error")
@@ -250,7 +213,7 @@ def test_create_error_report():
     # Verify the report
     assert report["error_type"] == "APIError"
     assert report["error_message"] == "API Error"
-    assert "traceback" in report
+    assert report["traceback"] == "fake\n"
     assert report["original_error"]["type"] == "ValueError"
     assert report["original_error"]["message"] == "Original error"
     assert report["status_code"] == 429
@@ -264,14 +227,21 @@ def test_log_error():
     temporary_error = TemporaryError("Temporary error")
     regular_error = Exception("Regular error")
     
-    # Mock the logger
-    with patch('python_components.pipeline.errors.logger') as mock_logger:
+    # Capture the records emitted by the real logger, leaving out the
+    # tracebacks logged at DEBUG level
+    handler = _CaptureHandler()
+    previous_level = errors_logger.level
+    errors_logger.addHandler(handler)
+    errors_logger.setLevel(logging.INFO)
+    try:
         # Log the errors
         log_error(permanent_error)
         log_error(temporary_error)
         log_error(regular_error)
-        
-        # Verify logging levels were correct
-        assert mock_logger.log.call_args_list[0][0][0] == 40  # ERROR for PermanentError
-        assert mock_logger.log.call_args_list[1][0][0] == 30  # WARNING for TemporaryError
-        assert mock_logger.log.call_args_list[2][0][0] == 40  # ERROR for other exceptions
\ No newline at end of file
+    finally:
+        errors_logger.removeHandler(handler)
+        errors_logger.setLevel(previous_level)
+    
+    # Verify logging levels were correct: ERROR for PermanentError,
+    # WARNING for TemporaryError and ERROR for other exceptions
+    assert handler.levels == [logging.ERROR, logging.WARNING, logging.ERROR]
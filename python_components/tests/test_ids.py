@@ -0,0 +1,29 @@
+"""
+Tests for the ID generation module.
+"""
+import uuid
+from unittest.mock import patch
+from python_components.utils.ids import new_id, new_ids
+
+def test_new_ids():
+    """Test batch generation of action item IDs."""
+    ids = new_ids(50)
+    
+    assert len(ids) == 50
+    assert len(set(ids)) == 50
+    assert all(uuid.UUID(item_id).version == 7 for item_id in ids)
+    assert all(uuid.UUID(item_id).variant == uuid.RFC_4122 for item_id in ids)
+    assert new_ids(0) == []
+
+def test_new_ids_sort_in_creation_order():
+    """Test that IDs sort by creation time and by position within a batch."""
+    with patch("python_components.utils.ids.time.time_ns", return_value=1_700_000_000_000_000_000):
+        first = new_ids(5000)
+    with patch("python_components.utils.ids.time.time_ns", return_value=1_700_000_000_001_000_000):
+        later = new_id()
+    
+    assert sorted(first) == first
+    assert later > first[4095]
+    
+    # The timestamp is stored in the first 48 bits
+    assert uuid.UUID(first[0]).int >> 80 == 1_700_000_000_000
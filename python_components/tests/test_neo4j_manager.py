@@ -4,9 +4,38 @@ Tests for the Neo4j manager module.
 import pytest
 import os
 from unittest.mock import patch, MagicMock
-from python_components.utils.neo4j_manager import Neo4jManager
+from python_components.utils.neo4j_manager import Neo4jManager, SHARDED_WRITE_MIN_ROWS
 
-@pytest.fixture
+class _FakeResult:
+    """Minimal stand-in for a Neo4j result."""
+    
+    def __init__(self, records):
+        self._records = records
+    
+    def __iter__(self):
+        return iter(self._records)
+    
+    def single(self):
+        return self._records[0] if self._records else None
+
+class _FakeSession:
+    """Minimal stand-in for a Neo4j session that records its queries."""
+    
+    def __init__(self, result):
+        self._result = result
+        self.run_calls = []
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return False
+    
+    def run(self, *args, **kwargs):
+        self.run_calls.append((args, kwargs))
+        return self._result
+
+@pytest.fixture(scope="module")
 def mock_env_vars():
     """Set up mock environment variables for testing."""
     os.environ["NEO4J_URI"] = "bolt://localhost:7687"
@@ -18,7 +47,7 @@ def mock_env_vars():
     del os.environ["NEO4J_USER"]
     del os.environ["NEO4J_PASSWORD"]
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def mock_driver():
     """Create a mock Neo4j driver."""
     with patch('neo4j.GraphDatabase.driver') as mock:
@@ -29,6 +58,8 @@ def mock_driver():
 @pytest.fixture
 def neo4j_manager(mock_env_vars, mock_driver):
     """Create a Neo4jManager instance with mocked dependencies."""
+    # The driver patch is shared by the module, so forget calls from earlier tests
+    mock_driver.reset_mock()
     manager = Neo4jManager()
     return manager
 
@@ -52,18 +83,25 @@ def test_get_session(neo4j_manager):
     neo4j_manager.driver.session.assert_called_once()
     assert session == neo4j_manager.driver.session.return_value
 
+def test_ensure_constraints(neo4j_manager):
+    """Test that constraints are only created once per database."""
+    neo4j_manager.create_constraints = MagicMock()
+    
+    with patch.object(Neo4jManager, "_constraints_ensured", set()):
+        neo4j_manager.ensure_constraints()
+        neo4j_manager.ensure_constraints()
+        neo4j_manager.create_constraints.assert_called_once()
+        
+        # Another database gets its own constraints
+        neo4j_manager.uri = "bolt://other:7687"
+        neo4j_manager.ensure_constraints()
+        assert neo4j_manager.create_constraints.call_count == 2
+
 def test_create_action_item(neo4j_manager):
     """Test creating an action item in Neo4j."""
-    # Create a mock session
-    mock_session = MagicMock()
-    neo4j_manager.get_session = MagicMock(return_value=mock_session)
-    
-    # Create a mock result
-    mock_result = MagicMock()
-    mock_record = MagicMock()
-    mock_record.__getitem__.return_value = "test-id"
-    mock_result.single.return_value = mock_record
-    mock_session.__enter__.return_value.run.return_value = mock_result
+    # Create a session returning the created ID
+    fake_session = _FakeSession(_FakeResult([{"id": "test-id"}]))
+    neo4j_manager.get_session = lambda: fake_session
     
     # Test data
     action_item = {
@@ -82,7 +120,10 @@ def test_create_action_item(neo4j_manager):
     
     # Verify the result
     assert result == "test-id"
-    mock_session.__enter__.return_value.run.assert_called_once()
+    assert len(fake_session.run_calls) == 1
+    query, params = fake_session.run_calls[0][0]
+    assert "CREATE (a:ActionItem {" in query
+    assert params["id"] == "test-id"
 
 def test_link_action_to_person(neo4j_manager):
     """Test linking an action item to a person in Neo4j."""
@@ -103,16 +144,12 @@ def test_link_action_to_person(neo4j_manager):
 
 def test_get_action_items_by_status(neo4j_manager):
     """Test getting action items by status from Neo4j."""
-    # Create a mock session
-    mock_session = MagicMock()
-    neo4j_manager.get_session = MagicMock(return_value=mock_session)
-    
-    # Create mock results
-    mock_record1 = MagicMock()
-    mock_record1.__getitem__.return_value = {"id": "1", "content": "Task 1"}
-    mock_record2 = MagicMock()
-    mock_record2.__getitem__.return_value = {"id": "2", "content": "Task 2"}
-    mock_session.__enter__.return_value.run.return_value = [mock_record1, mock_record2]
+    # Create a session returning two records
+    fake_session = _FakeSession(_FakeResult([
+        {"a": {"id": "1", "content": "Task 1"}},
+        {"a": {"id": "2", "content": "Task 2"}}
+    ]))
+    neo4j_manager.get_session = lambda: fake_session
     
     # Call the method
     result = neo4j_manager.get_action_items_by_status("pending")
@@ -121,11 +158,176 @@ def test_get_action_items_by_status(neo4j_manager):
     assert len(result) == 2
     assert result[0] == {"id": "1", "content": "Task 1"}
     assert result[1] == {"id": "2", "content": "Task 2"}
-    mock_session.__enter__.return_value.run.assert_called_once_with(
-        """
-                MATCH (a:ActionItem {status: $status})
-                RETURN a
-                ORDER BY a.priority, a.created_at
-            """,
-        {"status": "pending"}
-    )
\ No newline at end of file
+    assert len(fake_session.run_calls) == 1
+    query, params = fake_session.run_calls[0][0]
+    assert "MATCH (a:ActionItem {status: $status})" in query
+    assert params == {"status": "pending"}
+
+def test_get_pending_summary(neo4j_manager):
+    """Test getting pending action items with their links in one query."""
+    # Create a session returning plain dict records
+    fake_session = _FakeSession(_FakeResult([
+        {"a": {"id": "1", "content": "Task 1", "dependencies": '["Approval"]'}, "projects": ["Docs"], "assignees": ["john@example.com"]},
+        {"a": {"id": "2", "content": "Task 2"}, "projects": [], "assignees": []}
+    ]))
+    neo4j_manager.get_session = lambda: fake_session
+    
+    # Call the method
+    result = neo4j_manager.get_pending_summary()
+    
+    # Verify the result
+    assert result == [
+        {"item": {"id": "1", "content": "Task 1", "dependencies": ["Approval"]}, "projects": ["Docs"], "assignees": ["john@example.com"]},
+        {"item": {"id": "2", "content": "Task 2"}, "projects": [], "assignees": []}
+    ]
+    
+    # Verify a single query was run
+    assert len(fake_session.run_calls) == 1
+    query, params = fake_session.run_calls[0][0]
+    assert "OPTIONAL MATCH (a)-[:BELONGS_TO]->(p:Project)" in query
+    assert "OPTIONAL MATCH (a)-[:ASSIGNED_TO]->(person:Person)" in query
+    assert params == {"status": "pending"}
+
+def _sharded_session(fail_source_id=None):
+    """Create a mock session whose transactions echo back the IDs of their rows."""
+    mock_session = MagicMock()
+    session = mock_session.__enter__.return_value
+    tx = MagicMock()
+    
+    def run(query, params):
+        if "rows" not in params:
+            return MagicMock()
+        if any(row["props"]["source_id"] == fail_source_id for row in params["rows"]):
+            raise RuntimeError("Neo4j unavailable")
+        return [{"id": row["props"]["id"]} for row in params["rows"]]
+    
+    tx.run.side_effect = run
+    session.execute_write.side_effect = lambda work, *args: work(tx, *args)
+    return mock_session, tx
+
+def test_create_action_items_sharded(neo4j_manager):
+    """Test writing a large batch of action items in parallel shards."""
+    # Create a mock session
+    mock_session, tx = _sharded_session()
+    neo4j_manager.get_session = MagicMock(return_value=mock_session)
+    
+    items = [
+        {
+            "action_item": {"id": f"id-{index}", "source_id": f"message-{index % 10}"},
+            "people": [(f"person-{index % 10}@example.com", "ASSIGNED_TO")],
+            "projects": [f"Project {index % 5}"]
+        }
+        for index in range(SHARDED_WRITE_MIN_ROWS)
+    ]
+    
+    # Call the method
+    result = neo4j_manager.create_action_items_sharded(items, shards=4)
+    
+    # Verify every item was written once, each shard in its own write transaction
+    assert sorted(result) == sorted(f"id-{index}" for index in range(SHARDED_WRITE_MIN_ROWS))
+    assert 1 < tx.run.call_count <= 4
+    assert mock_session.__enter__.return_value.execute_write.call_count == tx.run.call_count
+    
+    # Verify links are merged with the nodes, and shards share no message, person or project
+    placements = {}
+    for shard, call in enumerate(tx.run.call_args_list):
+        query, params = call[0]
+        assert "MERGE (p:Person {email: key})" in query
+        for row in params["rows"]:
+            for key in (row["props"]["source_id"], *row["projects"], *row["ASSIGNED_TO_email"]):
+                assert placements.setdefault(key, shard) == shard
+    assert len(placements) == 25
+
+def test_create_action_items_sharded_shared_person(neo4j_manager):
+    """Test that items linked to the same person are written in one shard."""
+    mock_session, tx = _sharded_session()
+    neo4j_manager.get_session = MagicMock(return_value=mock_session)
+    
+    items = [
+        {
+            "action_item": {"id": f"id-{index}", "source_id": f"message-{index % 10}"},
+            "people": [("john@example.com", "ASSIGNED_TO")],
+            "projects": []
+        }
+        for index in range(SHARDED_WRITE_MIN_ROWS)
+    ]
+    
+    assert len(neo4j_manager.create_action_items_sharded(items, shards=4)) == SHARDED_WRITE_MIN_ROWS
+    assert tx.run.call_count == 1
+
+def test_create_action_items_sharded_failure(neo4j_manager):
+    """Test that a failed shard removes the items the other shards wrote."""
+    mock_session, tx = _sharded_session(fail_source_id="message-3")
+    neo4j_manager.get_session = MagicMock(return_value=mock_session)
+    
+    items = [
+        {
+            "action_item": {"id": f"id-{index}", "source_id": f"message-{index % 10}"},
+            "people": [],
+            "projects": []
+        }
+        for index in range(SHARDED_WRITE_MIN_ROWS)
+    ]
+    
+    with pytest.raises(RuntimeError, match="Neo4j unavailable"):
+        neo4j_manager.create_action_items_sharded(items, shards=4)
+    
+    # Verify the written items were deleted, leaving out the failed shard
+    delete_calls = [call for call in tx.run.call_args_list if "DETACH DELETE" in call[0][0]]
+    assert len(delete_calls) == 1
+    deleted = delete_calls[0][0][1]["ids"]
+    assert deleted
+    assert len(deleted) < SHARDED_WRITE_MIN_ROWS
+    assert "id-3" not in deleted
+
+def test_create_action_items_sharded_small_batch(neo4j_manager):
+    """Test that small batches are written with a single bulk query."""
+    neo4j_manager.create_action_items_bulk = MagicMock(return_value=["id-1"])
+    items = [{"action_item": {"id": "id-1"}, "people": [], "projects": []}]
+    
+    assert neo4j_manager.create_action_items_sharded(items, shards=4) == ["id-1"]
+    neo4j_manager.create_action_items_bulk.assert_called_once_with(items)
+
+def test_create_action_items_bulk(neo4j_manager):
+    """Test creating several action items with their links in one query."""
+    # Create a mock session
+    mock_session = MagicMock()
+    neo4j_manager.get_session = MagicMock(return_value=mock_session)
+    mock_session.__enter__.return_value.run.return_value = [{"id": "id-1"}, {"id": "id-2"}]
+    
+    items = [
+        {
+            "action_item": {"id": "id-1", "content": "First", "dependencies": ["x"]},
+            "people": [("john@example.com", "ASSIGNED_TO"), ("Jane", "SENT_BY")],
+            "projects": ["Docs"]
+        },
+        {
+            "action_item": {"id": "id-2", "content": "Second"},
+            "people": [],
+            "projects": []
+        }
+    ]
+    
+    # Call the method
+    result = neo4j_manager.create_action_items_bulk(items)
+    
+    # Verify a single round trip was made
+    assert result == ["id-1", "id-2"]
+    mock_session.__enter__.return_value.run.assert_called_once()
+    query, params = mock_session.__enter__.return_value.run.call_args[0]
+    assert "UNWIND $rows AS row" in query
+    assert "MERGE (a:ActionItem {id: row.props.id})" in query
+    assert "MERGE (p:Person {email: key})" in query
+    assert "MERGE (a)-[:SENT_BY]->(p)" in query
+    
+    rows = params["rows"]
+    assert rows[0]["props"]["dependencies"] == '["x"]'
+    assert rows[0]["ASSIGNED_TO_email"] == ["john@example.com"]
+    assert rows[0]["SENT_BY_name"] == ["Jane"]
+    assert rows[0]["projects"] == ["Docs"]
+    assert rows[1]["projects"] == []
+    
+    # No query for an empty batch
+    mock_session.reset_mock()
+    assert neo4j_manager.create_action_items_bulk([]) == []
+    mock_session.__enter__.return_value.run.assert_not_called()
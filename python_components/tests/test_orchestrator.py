@@ -4,32 +4,100 @@ Tests for the pipeline orchestrator.
 import pytest
 import asyncio
 from datetime import datetime
-from unittest.mock import patch, MagicMock
+from unittest.mock import MagicMock
+from python_components.pipeline import orchestrator as orchestrator_module
 from python_components.pipeline.orchestrator import (
     PipelineStep, PipelineContext, PipelineOrchestrator
 )
 
-@pytest.fixture
+# Keep the module's tests on one xdist worker; the async tests share a module-scoped event loop
+pytestmark = pytest.mark.xdist_group("orchestrator")
+
+# Payloads returned by the mocked retrieval and summary steps
+_TEST_EMAIL = {
+    "id": "email123",
+    "subject": "Test Subject",
+    "from": "test@example.com",
+    "body": "Test body with action items",
+    "date": "2023-05-01T10:30:00Z"
+}
+
+_TEST_MESSAGE = {
+    "id": "slack123",
+    "text": "Test message with action items",
+    "user": {"name": "User", "email": "user@example.com"},
+    "channelId": "C12345",
+    "timestamp": "1620000000.000000"
+}
+
+_TEST_SUMMARY = {
+    "date": "2023-05-01",
+    "total_items": 5,
+    "projects": ["Project A", "Project B"],
+    "action_items": [{"id": "item1"}, {"id": "item2"}]
+}
+
+# Fixed clock reading used in place of datetime.now() inside the orchestrator
+_FROZEN_NOW = datetime(2024, 1, 1)
+
+class _FrozenDatetime(datetime):
+    """datetime whose now() always returns _FROZEN_NOW."""
+    
+    @classmethod
+    def now(cls, tz=None):
+        return _FROZEN_NOW
+
+@pytest.fixture(autouse=True)
+def _freeze_time(monkeypatch):
+    """Freeze the orchestrator's clock so timestamps are deterministic."""
+    monkeypatch.setattr(orchestrator_module, "datetime", _FrozenDatetime)
+
+def _recording_stub(result):
+    """Create a plain function that records its arguments and returns result."""
+    calls = []
+    
+    def stub(*args):
+        calls.append(args)
+        return result
+    
+    stub.calls = calls
+    return stub
+
+@pytest.fixture(scope="module")
 def mock_neo4j():
     """Create a mock Neo4j manager."""
-    with patch('python_components.utils.neo4j_manager.Neo4jManager') as mock:
-        manager_instance = MagicMock()
-        mock.return_value = manager_instance
+    manager_instance = MagicMock()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        # The orchestrator imports the class by name, so replace it where it is looked up
+        monkeypatch.setattr(orchestrator_module, "Neo4jManager", lambda *args, **kwargs: manager_instance)
         yield manager_instance
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def mock_processor():
     """Create a mock action item processor."""
-    with patch('python_components.processors.action_item_processor.ActionItemProcessor') as mock:
-        processor_instance = MagicMock()
-        mock.return_value = processor_instance
+    processor_instance = MagicMock()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(orchestrator_module, "ActionItemProcessor", lambda *args, **kwargs: processor_instance)
         yield processor_instance
 
 @pytest.fixture
-def orchestrator(mock_neo4j, mock_processor):
+def make_orchestrator(mock_neo4j, mock_processor, monkeypatch):
+    """Build a PipelineOrchestrator, replacing any of its mock steps with stubs."""
+    # The mocks are shared across the module, so clear what earlier tests configured
+    mock_neo4j.reset_mock(return_value=True, side_effect=True)
+    mock_processor.reset_mock(return_value=True, side_effect=True)
+    
+    def _make_orchestrator(**steps):
+        # Steps are bound while the pipelines are built, so install stubs first
+        for name, stub in steps.items():
+            monkeypatch.setattr(PipelineOrchestrator, name, staticmethod(stub))
+        return PipelineOrchestrator()
+    return _make_orchestrator
+
+@pytest.fixture
+def orchestrator(make_orchestrator):
     """Create a PipelineOrchestrator instance with mocked dependencies."""
-    orchestrator = PipelineOrchestrator()
-    return orchestrator
+    return make_orchestrator()
 
 def test_pipeline_step_init():
     """Test PipelineStep initialization."""
@@ -85,14 +153,14 @@ def test_pipeline_context_methods():
     # Test complete
     context.complete("success")
     assert context.status == "success"
-    assert context.end_time is not None
+    assert context.end_time == _FROZEN_NOW
     
     # Test to_dict
     result_dict = context.to_dict()
     assert result_dict["pipeline_id"] == "test-pipeline"
     assert result_dict["status"] == "success"
     assert "start_time" in result_dict
-    assert "end_time" in result_dict
+    assert result_dict["end_time"] == _FROZEN_NOW.isoformat()
     assert "metadata" in result_dict
     assert "result_summary" in result_dict
 
@@ -100,50 +168,59 @@ def test_orchestrator_init(orchestrator, mock_neo4j, mock_processor):
     """Test PipelineOrchestrator initialization."""
     assert orchestrator.neo4j == mock_neo4j
     assert orchestrator.processor == mock_processor
+    
+    # Constructing an orchestrator must not touch the database
+    mock_neo4j.ensure_constraints.assert_not_called()
+    mock_processor.start_background_writes.assert_not_called()
     assert hasattr(orchestrator, "email_pipeline")
     assert hasattr(orchestrator, "slack_pipeline")
     assert hasattr(orchestrator, "summary_pipeline")
     assert len(orchestrator.pipeline_history) == 0
 
-@pytest.mark.asyncio
-async def test_process_email(orchestrator, mock_processor):
-    """Test processing an email."""
-    # Mock the processor.process_email method to return a test value
-    mock_processor.process_email.return_value = ["item1", "item2"]
-    
-    # Mock the _mock_retrieve_email method to return test data
-    test_email = {
-        "id": "email123",
-        "subject": "Test Subject",
-        "from": "test@example.com",
-        "body": "Test body with action items",
-        "date": "2023-05-01T10:30:00Z"
-    }
-    orchestrator._mock_retrieve_email = MagicMock(return_value=[test_email])
+@pytest.mark.parametrize(
+    "source_type, query, process_attr, retrieve_attr, payload, result_keys",
+    [
+        ("email", {"maxResults": 10, "filter": "isRead eq false"}, "process_email",
+         "_mock_retrieve_email", _TEST_EMAIL, ("retrieve_email", "process_email")),
+        ("slack", {"maxResults": 10, "channels": ["C12345"]}, "process_slack_message",
+         "_mock_retrieve_slack", _TEST_MESSAGE, ("retrieve_slack_messages", "process_slack_message")),
+    ],
+    ids=["email", "slack"],
+)
+@pytest.mark.asyncio(scope="module")
+async def test_process_source(make_orchestrator, mock_processor, source_type, query, process_attr,
+                              retrieve_attr, payload, result_keys):
+    """Test processing an email or Slack query through its pipeline."""
+    # Mock the retrieval step to return test data
+    retrieve = _recording_stub([payload])
+    orchestrator = make_orchestrator(**{retrieve_attr: retrieve})
     
-    # Process an email query
-    email_query = {"maxResults": 10, "filter": "isRead eq false"}
-    context = await orchestrator.process_email(email_query)
+    # Mock the processor method to return a test value
+    getattr(mock_processor, process_attr).return_value = ["item1", "item2"]
+    
+    # Process the query
+    context = await getattr(orchestrator, f"process_{source_type}")(query)
     
     # Verify the result
     assert context.status == "completed"
-    assert context.source_type == "email"
+    assert context.source_type == source_type
     assert context.error is None
     assert context.end_time is not None
     
     # Verify the pipeline steps were called
-    orchestrator._mock_retrieve_email.assert_called_once_with(email_query)
-    mock_processor.process_email.assert_called_once_with([test_email])
+    assert retrieve.calls == [(query,)]
+    getattr(mock_processor, process_attr).assert_called_once_with([payload])
     
     # Verify the results were stored
-    assert context.get_result("retrieve_email") == [test_email]
-    assert context.get_result("process_email") == ["item1", "item2"]
+    retrieve_key, process_key = result_keys
+    assert context.get_result(retrieve_key) == [payload]
+    assert context.get_result(process_key) == ["item1", "item2"]
     
     # Verify the history was updated
     assert len(orchestrator.pipeline_history) == 1
     assert orchestrator.pipeline_history[0] == context
 
-@pytest.mark.asyncio
+@pytest.mark.asyncio(scope="module")
 async def test_process_email_failure(orchestrator, mock_processor):
     """Test processing an email with a failure."""
     # Mock the processor.process_email method to raise an exception
@@ -164,54 +241,15 @@ async def test_process_email_failure(orchestrator, mock_processor):
     assert len(orchestrator.pipeline_history) == 1
     assert orchestrator.pipeline_history[0] == context
 
-@pytest.mark.asyncio
-async def test_process_slack(orchestrator, mock_processor):
-    """Test processing a Slack message."""
-    # Mock the processor.process_slack_message method to return a test value
-    mock_processor.process_slack_message.return_value = ["item1", "item2"]
-    
-    # Mock the _mock_retrieve_slack method to return test data
-    test_message = {
-        "id": "slack123",
-        "text": "Test message with action items",
-        "user": {"name": "User", "email": "user@example.com"},
-        "channelId": "C12345",
-        "timestamp": "1620000000.000000"
-    }
-    orchestrator._mock_retrieve_slack = MagicMock(return_value=[test_message])
-    
-    # Process a Slack query
-    slack_query = {"maxResults": 10, "channels": ["C12345"]}
-    context = await orchestrator.process_slack(slack_query)
-    
-    # Verify the result
-    assert context.status == "completed"
-    assert context.source_type == "slack"
-    assert context.error is None
-    assert context.end_time is not None
-    
-    # Verify the pipeline steps were called
-    orchestrator._mock_retrieve_slack.assert_called_once_with(slack_query)
-    mock_processor.process_slack_message.assert_called_once_with([test_message])
-    
-    # Verify the results were stored
-    assert context.get_result("retrieve_slack_messages") == [test_message]
-    assert context.get_result("process_slack_message") == ["item1", "item2"]
-
-@pytest.mark.asyncio
-async def test_generate_daily_summary(orchestrator, mock_processor):
+@pytest.mark.asyncio(scope="module")
+async def test_generate_daily_summary(make_orchestrator, mock_processor):
     """Test generating a daily summary."""
-    # Mock the processor.generate_daily_summary method to return a test value
-    test_summary = {
-        "date": "2023-05-01",
-        "total_items": 5,
-        "projects": ["Project A", "Project B"],
-        "action_items": [{"id": "item1"}, {"id": "item2"}]
-    }
-    mock_processor.generate_daily_summary.return_value = test_summary
-    
     # Mock the _mock_send_summary method
-    orchestrator._mock_send_summary = MagicMock(return_value={"status": "sent"})
+    send_summary = _recording_stub({"status": "sent"})
+    orchestrator = make_orchestrator(_mock_send_summary=send_summary)
+    
+    # Mock the processor.generate_daily_summary method to return a test value
+    mock_processor.generate_daily_summary.return_value = _TEST_SUMMARY
     
     # Generate a summary
     context = await orchestrator.generate_daily_summary()
@@ -224,10 +262,10 @@ async def test_generate_daily_summary(orchestrator, mock_processor):
     
     # Verify the pipeline steps were called
     mock_processor.generate_daily_summary.assert_called_once()
-    orchestrator._mock_send_summary.assert_called_once_with(test_summary)
+    assert send_summary.calls == [(_TEST_SUMMARY,)]
     
     # Verify the results were stored
-    assert context.get_result("generate_summary") == test_summary
+    assert context.get_result("generate_summary") == _TEST_SUMMARY
     assert context.get_result("send_summary_email") == {"status": "sent"}
 
 def test_get_pipeline_history(orchestrator):
@@ -264,4 +302,18 @@ def test_clear_history(orchestrator):
     orchestrator.clear_history()
     
     # Verify the result
-    assert len(orchestrator.pipeline_history) == 0
\ No newline at end of file
+    assert len(orchestrator.pipeline_history) == 0
+
+
+def test_pipeline_history_is_bounded(orchestrator):
+    """Test that old contexts drop out of the history while the total keeps counting."""
+    limit = orchestrator.pipeline_history.maxlen
+    
+    # Record more pipelines than the history keeps
+    for i in range(limit + 5):
+        orchestrator._record_pipeline(PipelineContext(pipeline_id=f"pipeline{i}"))
+    
+    # Verify the result
+    assert len(orchestrator.pipeline_history) == limit
+    assert orchestrator.pipeline_history[0].pipeline_id == "pipeline5"
+    assert orchestrator.total_pipelines == limit + 5
@@ -2,14 +2,17 @@
 Tests for the queue module.
 """
 import os
-import json
 import time
+import orjson
 import asyncio
 import tempfile
+import itertools
+import threading
 import pytest
 from datetime import datetime, timedelta
 from unittest.mock import patch, MagicMock, call
-from python_components.pipeline.queue import Message, MessageQueue, AsyncMessageQueue
+from queue import Empty
+from python_components.pipeline.queue import Message, MessageQueue, AsyncMessageQueue, FsyncPolicy
 
 def test_message_init():
     """Test Message initialization."""
@@ -114,6 +117,11 @@ def test_message_from_dict():
     assert message.max_retries == 5
     assert message.scheduled_time.isoformat() == scheduled_str
     assert message.error == "Test error"
+    
+    # Timestamps may also be given as epoch seconds
+    message = Message.from_dict({**message_dict, "created_at": now.timestamp(), "scheduled_time": scheduled.timestamp()})
+    assert message.created_at == now
+    assert message.scheduled_time == scheduled
 
 def test_message_is_ready():
     """Test message is_ready method."""
@@ -133,6 +141,11 @@ def test_message_is_ready():
     # Test with past scheduled time
     message.scheduled_time = now - timedelta(minutes=5)
     assert message.is_ready() is True
+    
+    # Clearing the scheduled time falls back to ordering by creation time
+    message.scheduled_time = None
+    assert message.is_ready() is True
+    assert message._sort_key == (2, message.created_at.timestamp())
 
 def test_message_comparison():
     """Test message comparison for priority queue."""
@@ -197,6 +210,11 @@ def test_message_comparison():
     
     # Compare by scheduled time
     assert scheduled_earlier < scheduled_later
+    
+    # Rescheduling updates the ordering
+    scheduled_later.reschedule(now + timedelta(minutes=1))
+    assert scheduled_later < scheduled_earlier
+    assert scheduled_later.scheduled_time == now + timedelta(minutes=1)
 
 def test_queue_init():
     """Test MessageQueue initialization."""
@@ -205,6 +223,9 @@ def test_queue_init():
     assert queue.persistence_file is None
     assert queue.max_messages == 1000
     assert queue.persistence_interval == 60
+    assert queue.fsync_policy is FsyncPolicy.PERIODIC
+    assert queue.wal_file is None
+    assert queue.retry_enabled is True
     assert queue.running is False
     assert queue.message_count == 0
     
@@ -231,11 +252,15 @@ def test_register_handler():
     assert queue.handlers["test-type"][0] is handler
     
     # Register a second handler for the same type
+    registered = queue.handlers["test-type"]
     handler2 = MagicMock()
     queue.register_handler("test-type", handler2)
     
     assert len(queue.handlers["test-type"]) == 2
     assert queue.handlers["test-type"][1] is handler2
+    
+    # The handlers seen before registering are left untouched
+    assert registered == (handler,)
 
 def test_enqueue():
     """Test enqueuing messages."""
@@ -295,6 +320,66 @@ def test_enqueue_batch():
     message2 = queue.queue.get()
     assert message2.type == "type2"
     assert message2.priority == 3
+    
+    # The batch shares one creation time and gets time-sortable IDs in order
+    assert message1.created_at == message2.created_at
+    assert message_ids == sorted(message_ids)
+
+def test_enqueue_batch_skips_known_ids():
+    """Test that enqueue_batch drops messages whose ID is already queued."""
+    queue = MessageQueue()
+    
+    first_ids = queue.enqueue_batch([{"id": "msg-1", "type": "test-type", "data": {}}])
+    message_ids = queue.enqueue_batch([
+        {"id": "msg-1", "type": "test-type", "data": {}},
+        {"id": "msg-2", "type": "test-type", "data": {}},
+        {"id": "msg-2", "type": "test-type", "data": {}},
+        {"type": "test-type", "data": {}}
+    ])
+    
+    assert first_ids == ["msg-1"]
+    assert len(message_ids) == 2
+    assert message_ids[0] == "msg-2"
+    assert queue.queue.qsize() == 3
+    assert queue.message_ids == {"msg-1", "msg-2", message_ids[1]}
+
+def test_enqueue_batch_heap_order():
+    """Test that batches merge into the heap in priority and time order."""
+    queue = MessageQueue()
+    later = datetime.now() + timedelta(minutes=5)
+    
+    # A batch larger than the heap is re-heapified, a smaller one pushed entry by entry
+    queue.enqueue("existing", {}, priority=2)
+    queue.enqueue_batch([
+        {"type": "scheduled", "data": {}, "priority": 1, "scheduled_time": later},
+        {"type": "urgent", "data": {}, "priority": 1},
+        {"type": "low", "data": {}, "priority": 3}
+    ])
+    queue.enqueue_batch([{"type": "medium", "data": {}, "priority": 2}])
+    
+    # Snapshots list every message by priority, then time, then insertion order
+    assert [message.type for message in queue.queue.snapshot()] == ["urgent", "scheduled", "existing", "medium", "low"]
+    
+    # Only ready messages come out; the scheduled one waits for its time
+    order = [queue.queue.get().type for _ in range(4)]
+    assert order == ["urgent", "existing", "medium", "low"]
+    assert queue.queue.qsize() == 1
+    
+    # A heap with nothing ready times out instead of blocking
+    with pytest.raises(Empty):
+        queue.queue.get(timeout=0.01)
+
+def test_scheduled_messages_become_ready():
+    """Test that scheduled messages are handed out once their time arrives."""
+    queue = MessageQueue()
+    queue.enqueue("soon", {}, priority=1, scheduled_time=datetime.now() + timedelta(seconds=0.05))
+    queue.enqueue("later", {}, priority=1, scheduled_time=datetime.now() + timedelta(minutes=5))
+    
+    assert queue.drain_ready() == []
+    
+    # A waiting get wakes up when the next scheduled message falls due
+    assert queue.queue.get(timeout=2).type == "soon"
+    assert queue.queue.qsize() == 1
 
 def test_start_and_stop():
     """Test starting and stopping the queue."""
@@ -315,6 +400,47 @@ def test_start_and_stop():
         # Verify process_loop wasn't called directly
         mock_process_loop.assert_not_called()
 
+def test_handlers_run_on_worker_pool():
+    """Test that a blocked handler does not stop other messages being handled."""
+    queue = MessageQueue(max_workers=2)
+    
+    # Both handlers must be running at the same time to get past the barrier
+    barrier = threading.Barrier(2, timeout=5)
+    queue.register_handler("test-type", lambda message: barrier.wait())
+    queue.enqueue_batch([
+        {"type": "test-type", "data": {"key": "value1"}},
+        {"type": "test-type", "data": {"key": "value2"}}
+    ])
+    
+    queue.start(blocking=False)
+    try:
+        deadline = time.time() + 5
+        while queue.stats["processed"] < 2 and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        queue.stop()
+    
+    # Verify both messages were handled and the pool was shut down
+    assert queue.stats["processed"] == 2
+    assert queue.stats["retried"] == 0
+    assert queue._pool is None
+
+def test_processed_history_is_bounded():
+    """Test that only the most recent max_messages processed messages are kept."""
+    queue = MessageQueue(max_messages=3)
+    queue.register_handler("test-type", MagicMock())
+    
+    message_ids = queue.enqueue_batch([{"type": "test-type", "data": {"n": n}} for n in range(5)])
+    for message in queue.drain_ready(5):
+        queue._dispatch(message, False)
+    
+    assert [message.id for message in queue.processed] == message_ids[-3:]
+    
+    # A message that exhausts its retries is recorded once
+    failing = Message(id="failing", type="test-type", data={}, retry_count=3)
+    queue._record_result(failing, False)
+    assert [message.id for message in queue.processed].count("failing") == 1
+
 def test_persistence():
     """Test queue persistence to file."""
     # Create a temporary file for testing
@@ -326,16 +452,24 @@ def test_persistence():
         queue = MessageQueue(persistence_file=temp_file)
         
         # Add some messages
-        queue.enqueue("test-type", {"key": "value1"})
+        first_id = queue.enqueue("test-type", {"key": "value1"})
         queue.enqueue("test-type", {"key": "value2"})
         
-        # Manually persist
+        # Without the committer running, each enqueue is written to the log straight away
+        with open(queue.wal_file, 'rb') as f:
+            assert len(f.read().splitlines()) == 2
+        
+        # Manually persist, which also truncates the log
         queue._persist_to_file()
+        assert os.path.getsize(queue.wal_file) == 0
+        
+        # The snapshot is renamed into place, so no temporary file is left behind
+        assert os.path.exists(temp_file + ".tmp") is False
         
         # Verify the file exists and has content
         assert os.path.exists(temp_file)
-        with open(temp_file, 'r') as f:
-            data = json.load(f)
+        with open(temp_file, 'rb') as f:
+            data = orjson.loads(f.read())
             
         assert "queue" in data
         assert "processed" in data
@@ -343,17 +477,60 @@ def test_persistence():
         assert "timestamp" in data
         assert len(data["queue"]) == 2
         
+        # Datetimes are written as ISO 8601 strings
+        persisted = next(msg for msg in data["queue"] if msg["id"] == first_id)
+        assert datetime.fromisoformat(persisted["created_at"])
+        assert data["stats"]["start_time"] == queue.stats["start_time"].isoformat()
+        
         # Create a new queue to test loading
         new_queue = MessageQueue(persistence_file=temp_file)
         assert new_queue.queue.qsize() == 2
         assert new_queue.message_count == 2
+        assert first_id in new_queue.message_ids
         
     finally:
         # Clean up
-        try:
-            os.unlink(temp_file)
-        except:
-            pass
+        for path in (temp_file, f"{temp_file}.wal"):
+            try:
+                os.unlink(path)
+            except:
+                pass
+
+def test_wal_replay(tmp_path):
+    """Test that messages logged after the last snapshot are recovered."""
+    persistence_file = str(tmp_path / "queue.json")
+    queue = MessageQueue(persistence_file=persistence_file, fsync_policy=FsyncPolicy.ALWAYS)
+    message_ids = queue.enqueue_batch([
+        {"type": "type1", "data": {"key": "value1"}},
+        {"type": "type2", "data": {"key": "value2"}}
+    ])
+    
+    # Simulate a crash that tore the last record
+    with open(queue.wal_file, 'ab') as f:
+        f.write(b'{"id": "torn"')
+    
+    # Verify a new queue rebuilds the messages from the log alone
+    new_queue = MessageQueue(persistence_file=persistence_file)
+    assert not os.path.exists(persistence_file)
+    assert new_queue.queue.qsize() == 2
+    assert new_queue.message_ids == set(message_ids)
+    assert new_queue.queue.get().data == {"key": "value1"}
+
+def test_wal_group_commit(tmp_path):
+    """Test that the committer coalesces enqueues into few fsyncs."""
+    persistence_file = str(tmp_path / "queue.json")
+    queue = MessageQueue(persistence_file=persistence_file)
+    
+    with patch.object(queue, '_process_loop'), patch('os.fsync') as mock_fsync:
+        queue.start(blocking=False)
+        for index in range(50):
+            queue.enqueue("test-type", {"index": index})
+        queue.stop()
+    
+    # Verify far fewer syncs than enqueues and that stop snapshotted everything
+    assert 0 < mock_fsync.call_count < 50
+    assert os.path.getsize(queue.wal_file) == 0
+    assert MessageQueue(persistence_file=persistence_file).queue.qsize() == 50
 
 @pytest.mark.asyncio
 async def test_async_message_queue():
@@ -390,7 +567,7 @@ async def test_async_message_queue():
     
     # Start and stop the queue
     await async_queue.start()
-    assert async_queue.queue.running is True
+    assert async_queue.running is True
     
     # Get stats
     stats = await async_queue.get_stats()
@@ -399,15 +576,91 @@ async def test_async_message_queue():
     
     # Stop the queue
     await async_queue.stop()
-    assert async_queue.queue.running is False
+    assert async_queue.running is False
+
+@pytest.mark.asyncio
+async def test_async_queue_dispatch():
+    """Test that the async queue awaits coroutine handlers and runs sync ones."""
+    async_queue = AsyncMessageQueue(max_workers=2)
+    
+    done = asyncio.Event()
+    received = []
+    
+    async def async_handler(message):
+        received.append(message.data["key"])
+        done.set()
+    
+    sync_threads = []
+    sync_handler = MagicMock(side_effect=lambda message: sync_threads.append(threading.current_thread().name))
+    await async_queue.register_handler("async-type", async_handler)
+    await async_queue.register_handler("sync-type", sync_handler)
+    
+    # Whether a handler is a coroutine function is decided once, at registration
+    assert async_queue._handler_plans["async-type"] == ((async_handler, True),)
+    assert async_queue._handler_plans["sync-type"] == ((sync_handler, False),)
+    
+    await async_queue.enqueue("sync-type", {"key": "sync"}, priority=1)
+    await async_queue.enqueue("async-type", {"key": "async"}, priority=2)
+    
+    await async_queue.start()
+    await asyncio.wait_for(done.wait(), timeout=2)
+    await async_queue.stop()
+    
+    assert received == ["async"]
+    sync_handler.assert_called_once()
+    
+    # Sync handlers run on the queue's own pool, which is shut down on stop
+    assert sync_threads[0].startswith("icap-async-queue")
+    assert async_queue._executor is None
+    
+    stats = await async_queue.get_stats()
+    assert stats["processed"] == 2
+    assert stats["current_size"] == 0
+
+@pytest.mark.asyncio
+async def test_async_queue_scheduled_message_does_not_block_ready():
+    """Test that a future message ahead in priority does not hold up ready ones."""
+    async_queue = AsyncMessageQueue()
+    
+    handled = asyncio.Event()
+    
+    async def handler(message):
+        handled.set()
+    
+    await async_queue.register_handler("later-type", handler)
+    await async_queue.register_handler("ready-type", handler)
+    
+    await async_queue.enqueue("later-type", {}, priority=1,
+                              scheduled_time=datetime.now() + timedelta(seconds=3))
+    await async_queue.start()
+    
+    # Enqueued while the loop waits on the scheduled message, so the put must wake it
+    await asyncio.sleep(0.05)
+    started = time.monotonic()
+    await async_queue.enqueue("ready-type", {}, priority=2)
+    await asyncio.wait_for(handled.wait(), timeout=2)
+    elapsed = time.monotonic() - started
+    
+    stats = await async_queue.get_stats()
+    await async_queue.stop()
+    
+    assert elapsed < 0.5
+    assert stats["processed"] == 1
+    assert stats["current_size"] == 1
 
 def test_process_loop_handlers():
     """Test the message processing loop with handlers."""
     queue = MessageQueue()
     
-    # Register handlers
-    success_handler = MagicMock()
-    failure_handler = MagicMock(side_effect=Exception("Test failure"))
+    # Plain counters keep mock bookkeeping out of the dispatch path
+    calls = {"success": 0, "failure": 0}
+    
+    def success_handler(message):
+        calls["success"] += 1
+    
+    def failure_handler(message):
+        calls["failure"] += 1
+        raise Exception("Test failure")
     
     queue.register_handler("success-type", success_handler)
     queue.register_handler("failure-type", failure_handler)
@@ -416,25 +669,61 @@ def test_process_loop_handlers():
     success_id = queue.enqueue("success-type", {"key": "success"})
     failure_id = queue.enqueue("failure-type", {"key": "failure"})
     
-    # Mock run the processing loop for a few iterations
-    with patch('time.sleep'):  # Avoid actual sleeps in tests
-        queue.running = True
-        
-        # Process messages for a limited number of iterations
-        iterations = 0
-        while queue.queue.qsize() > 0 and iterations < 10:
-            queue._process_loop()
-            iterations += 1
-            if iterations >= 10:  # Safety to avoid infinite loop
-                queue.running = False
+    # Dispatch what is ready; the failed message is rescheduled and stays queued
+    drained = queue.drain_ready(32)
+    assert [message.id for message in drained] == [success_id, failure_id]
+    for message in drained:
+        queue._dispatch(message, False)
+    
+    assert queue.drain_ready(32) == []
+    assert queue.queue.qsize() == 1
     
     # Verify handlers were called
-    success_handler.assert_called_once()
-    failure_handler.assert_called_once()
+    assert calls == {"success": 1, "failure": 1}
     
     # Verify stats
     assert queue.stats["processed"] >= 1  # Success message processed
     assert queue.stats["retried"] >= 1  # Failure message retried
     
     # Verify processed list
-    assert len(queue.processed) >= 1
\ No newline at end of file
+    assert len(queue.processed) >= 1
+
+def test_failures_dropped_without_retry():
+    """Test that a queue with retries disabled counts failures and drops them."""
+    queue = MessageQueue(retry_enabled=False)
+    
+    def failure_handler(message):
+        raise Exception("Test failure")
+    
+    queue.register_handler("failure-type", failure_handler)
+    queue.enqueue("failure-type", {"key": "failure"})
+    
+    for message in queue.drain_ready():
+        queue._dispatch(message, False)
+    
+    assert queue.stats["failed"] == 1
+    assert queue.stats["retried"] == 0
+    assert queue.queue.empty()
+    assert len(queue.processed) == 0
+
+def test_process_loop_throughput():
+    """Test that the running loop works through a large batch."""
+    queue = MessageQueue(max_workers=4)
+    
+    # next() on itertools.count is atomic, so worker threads can share it
+    counter = itertools.count(1)
+    handled = []
+    queue.register_handler("test-type", lambda message: handled.append(next(counter)))
+    queue.enqueue_batch([{"type": "test-type", "data": {"n": n}} for n in range(10000)])
+    
+    queue.start()
+    try:
+        deadline = time.time() + 30
+        while queue.stats["processed"] < 10000 and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        queue.stop()
+    
+    assert queue.stats["processed"] == 10000
+    assert len(handled) == 10000
+    assert queue.queue.empty()
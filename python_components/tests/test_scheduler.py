@@ -2,14 +2,47 @@
 Tests for the scheduler module.
 """
 import os
-import time
+import asyncio
+import threading
 import pytest
 from datetime import datetime, timedelta
+from types import SimpleNamespace
 from unittest.mock import patch, MagicMock, call
+from python_components.pipeline import scheduler as scheduler_module
 from python_components.pipeline.scheduler import (
     Schedule, ScheduleType, PipelineScheduler
 )
 
+_FROZEN_NOW = datetime(2024, 1, 15, 7, 30)
+
+class _FrozenDatetime(datetime):
+    """datetime whose now() always returns _FROZEN_NOW."""
+    
+    @classmethod
+    def now(cls, tz=None):
+        return _FROZEN_NOW
+
+@pytest.fixture(autouse=True)
+def _freeze_time(monkeypatch):
+    """Freeze the scheduler's clock so next-run times are exact."""
+    # The scheduler uses the datetime module, so swap in a stand-in for it
+    monkeypatch.setattr(scheduler_module, "datetime", SimpleNamespace(datetime=_FrozenDatetime, timedelta=timedelta))
+
+@pytest.fixture
+def make_schedule():
+    """Build an interval Schedule, overriding any of its default fields."""
+    def _make_schedule(**overrides):
+        fields = {
+            "id": "test-schedule",
+            "name": "Test Schedule",
+            "type": ScheduleType.INTERVAL,
+            "target": "test_target",
+            "interval_seconds": 60,
+        }
+        fields.update(overrides)
+        return Schedule(**fields)
+    return _make_schedule
+
 def test_schedule_init():
     """Test Schedule initialization."""
     # Test with minimal parameters
@@ -30,7 +63,7 @@ def test_schedule_init():
     assert schedule.next_run is not None
     
     # Test with all parameters
-    now = datetime.now()
+    now = _FROZEN_NOW
     schedule = Schedule(
         id="test-id",
         name="Test Schedule",
@@ -58,97 +91,60 @@ def test_schedule_init():
     assert schedule.failures == 2
     assert schedule.next_run is None  # None because enabled is False
 
-def test_update_next_run_interval():
-    """Test updating next run time for interval schedules."""
-    # Test interval schedule
+@pytest.mark.parametrize("schedule_type, kwargs, expected", [
+    # Interval schedules run interval_seconds after the last run
+    (ScheduleType.INTERVAL,
+     {"interval_seconds": 60, "last_run": _FROZEN_NOW},
+     {"day": 15, "hour": 7, "minute": 31, "second": 0}),
+    # Daily at 8:00 AM, later on the frozen day
+    (ScheduleType.DAILY,
+     {"daily_time": "08:00"},
+     {"day": 15, "hour": 8, "minute": 0, "second": 0}),
+    # Monday at 8:00 AM
+    (ScheduleType.WEEKLY,
+     {"weekly_day": 0, "weekly_time": "08:00"},
+     {"weekday": 0, "hour": 8, "minute": 0, "second": 0}),
+    # Wednesday at 7:00 AM, earlier in the day than the frozen time
+    (ScheduleType.WEEKLY,
+     {"weekly_day": 2, "weekly_time": "07:00"},
+     {"day": 17, "weekday": 2, "hour": 7, "minute": 0}),
+    # The 1st of the month at 8:00 AM
+    (ScheduleType.MONTHLY,
+     {"monthly_day": 1, "monthly_time": "08:00"},
+     {"day": 1, "hour": 8, "minute": 0, "second": 0}),
+], ids=["interval", "daily", "weekly", "weekly-later-day", "monthly"])
+def test_update_next_run(schedule_type, kwargs, expected):
+    """Test updating next run time for each schedule type."""
     schedule = Schedule(
-        id="test-interval",
-        name="Test Interval",
-        type=ScheduleType.INTERVAL,
+        id=f"test-{schedule_type.value}",
+        name="Test Schedule",
+        type=schedule_type,
         target="test_target",
-        interval_seconds=60
+        **kwargs
     )
     
-    now = datetime.now()
-    schedule.last_run = now
+    # Force update
     schedule.update_next_run()
     
-    assert schedule.next_run is not None
-    assert schedule.next_run > now
-    assert schedule.next_run - now < timedelta(seconds=61)  # Allow 1 second for test execution
+    next_run = schedule.next_run
+    assert next_run is not None
+    fields = {
+        "weekday": next_run.weekday(),
+        "day": next_run.day,
+        "hour": next_run.hour,
+        "minute": next_run.minute,
+        "second": next_run.second
+    }
+    assert {name: fields[name] for name in expected} == expected
     
     # Test disabled schedule
     schedule.enabled = False
     schedule.update_next_run()
     assert schedule.next_run is None
 
-def test_update_next_run_daily():
-    """Test updating next run time for daily schedules."""
-    # Create a daily schedule for 8:00 AM
-    schedule = Schedule(
-        id="test-daily",
-        name="Test Daily",
-        type=ScheduleType.DAILY,
-        target="test_target",
-        daily_time="08:00"
-    )
-    
-    # Force update
-    schedule.update_next_run()
-    
-    assert schedule.next_run is not None
-    # Should be scheduled for 8:00 AM
-    assert schedule.next_run.hour == 8
-    assert schedule.next_run.minute == 0
-    assert schedule.next_run.second == 0
-
-def test_update_next_run_weekly():
-    """Test updating next run time for weekly schedules."""
-    # Create a weekly schedule for Monday at 8:00 AM
-    schedule = Schedule(
-        id="test-weekly",
-        name="Test Weekly",
-        type=ScheduleType.WEEKLY,
-        target="test_target",
-        weekly_day=0,  # Monday
-        weekly_time="08:00"
-    )
-    
-    # Force update
-    schedule.update_next_run()
-    
-    assert schedule.next_run is not None
-    # Should be scheduled for Monday at 8:00 AM
-    assert schedule.next_run.weekday() == 0
-    assert schedule.next_run.hour == 8
-    assert schedule.next_run.minute == 0
-    assert schedule.next_run.second == 0
-
-def test_update_next_run_monthly():
-    """Test updating next run time for monthly schedules."""
-    # Create a monthly schedule for the 1st at 8:00 AM
-    schedule = Schedule(
-        id="test-monthly",
-        name="Test Monthly",
-        type=ScheduleType.MONTHLY,
-        target="test_target",
-        monthly_day=1,
-        monthly_time="08:00"
-    )
-    
-    # Force update
-    schedule.update_next_run()
-    
-    assert schedule.next_run is not None
-    # Should be scheduled for the 1st at 8:00 AM
-    assert schedule.next_run.day == 1
-    assert schedule.next_run.hour == 8
-    assert schedule.next_run.minute == 0
-    assert schedule.next_run.second == 0
-
 def test_schedule_to_dict():
     """Test converting schedule to dictionary."""
-    now = datetime.now()
+    now = _FROZEN_NOW
     next_run = now + timedelta(hours=1)
     
     schedule = Schedule(
@@ -168,12 +164,12 @@ def test_schedule_to_dict():
     assert schedule_dict["type"] == "interval"
     assert schedule_dict["target"] == "test_target"
     assert schedule_dict["interval_seconds"] == 60
-    assert schedule_dict["last_run"] == now.isoformat()
-    assert schedule_dict["next_run"] == next_run.isoformat()
+    assert schedule_dict["last_run"] == now.timestamp()
+    assert schedule_dict["next_run"] == next_run.timestamp()
 
 def test_schedule_from_dict():
     """Test creating schedule from dictionary."""
-    now = datetime.now()
+    now = _FROZEN_NOW
     next_run = now + timedelta(hours=1)
     
     schedule_dict = {
@@ -182,8 +178,8 @@ def test_schedule_from_dict():
         "type": "interval",
         "target": "test_target",
         "interval_seconds": 60,
-        "last_run": now.isoformat(),
-        "next_run": next_run.isoformat(),
+        "last_run": now.timestamp(),
+        "next_run": next_run.timestamp(),
         "runs": 5,
         "failures": 2
     }
@@ -195,28 +191,29 @@ def test_schedule_from_dict():
     assert schedule.type == ScheduleType.INTERVAL
     assert schedule.target == "test_target"
     assert schedule.interval_seconds == 60
-    assert schedule.last_run.isoformat() == now.isoformat()
-    assert schedule.next_run.isoformat() == next_run.isoformat()
+    assert schedule.last_run == now
+    assert schedule.next_run == next_run
     assert schedule.runs == 5
     assert schedule.failures == 2
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def mock_orchestrator():
     """Create a mock PipelineOrchestrator."""
-    with patch('python_components.pipeline.orchestrator.PipelineOrchestrator') as mock:
-        orchestrator_instance = MagicMock()
-        mock.return_value = orchestrator_instance
+    orchestrator_instance = MagicMock()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        # The scheduler imports the class by name, so replace it where it is looked up
+        monkeypatch.setattr(scheduler_module, "PipelineOrchestrator", lambda *args, **kwargs: orchestrator_instance)
         yield orchestrator_instance
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def mock_queue():
     """Create a mock MessageQueue."""
-    with patch('python_components.pipeline.queue.MessageQueue') as mock:
-        queue_instance = MagicMock()
-        mock.return_value = queue_instance
+    queue_instance = MagicMock()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(scheduler_module, "MessageQueue", lambda *args, **kwargs: queue_instance)
         yield queue_instance
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def scheduler(mock_orchestrator, mock_queue):
     """Create a PipelineScheduler instance with mocked dependencies."""
     # Patch the _load_default_schedules method to avoid adding default schedules
@@ -225,7 +222,18 @@ def scheduler(mock_orchestrator, mock_queue):
             orchestrator=mock_orchestrator,
             queue=mock_queue
         )
-        yield scheduler
+    yield scheduler
+
+@pytest.fixture(autouse=True)
+def reset_scheduler(scheduler, mock_orchestrator, mock_queue):
+    """Give each test a stopped scheduler with no schedules and clean mocks."""
+    mock_orchestrator.reset_mock(return_value=True, side_effect=True)
+    mock_queue.reset_mock(return_value=True, side_effect=True)
+    yield
+    if scheduler.running:
+        scheduler.stop()
+    scheduler.schedules = {}
+    scheduler.thread = None
 
 def test_scheduler_init(scheduler, mock_orchestrator, mock_queue):
     """Test PipelineScheduler initialization."""
@@ -235,53 +243,43 @@ def test_scheduler_init(scheduler, mock_orchestrator, mock_queue):
     assert scheduler.running is False
     assert scheduler.thread is None
 
-def test_load_default_schedules():
+def test_load_default_schedules(mock_orchestrator, mock_queue):
     """Test loading default schedules."""
     # Create scheduler without patching _load_default_schedules
-    with patch('python_components.pipeline.orchestrator.PipelineOrchestrator'):
-        with patch('python_components.pipeline.queue.MessageQueue'):
-            scheduler = PipelineScheduler()
-            
-            # Verify default schedules were loaded
-            assert "email-processing" in scheduler.schedules
-            assert "slack-processing" in scheduler.schedules
-            assert "daily-summary" in scheduler.schedules
-            
-            # Verify schedule properties
-            assert scheduler.schedules["email-processing"].type == ScheduleType.INTERVAL
-            assert scheduler.schedules["email-processing"].interval_seconds == 600  # 10 minutes
-            
-            assert scheduler.schedules["slack-processing"].type == ScheduleType.INTERVAL
-            assert scheduler.schedules["slack-processing"].interval_seconds == 300  # 5 minutes
-            
-            assert scheduler.schedules["daily-summary"].type == ScheduleType.DAILY
-            assert scheduler.schedules["daily-summary"].daily_time == "08:00"
-
-def test_add_schedule(scheduler):
+    scheduler = PipelineScheduler()
+    
+    # The defaults come from the patched classes
+    assert scheduler.orchestrator is mock_orchestrator
+    assert scheduler.queue is mock_queue
+    
+    # Verify default schedules were loaded
+    assert "email-processing" in scheduler.schedules
+    assert "slack-processing" in scheduler.schedules
+    assert "daily-summary" in scheduler.schedules
+    
+    # Verify schedule properties
+    assert scheduler.schedules["email-processing"].type == ScheduleType.INTERVAL
+    assert scheduler.schedules["email-processing"].interval_seconds == 600  # 10 minutes
+    
+    assert scheduler.schedules["slack-processing"].type == ScheduleType.INTERVAL
+    assert scheduler.schedules["slack-processing"].interval_seconds == 300  # 5 minutes
+    
+    assert scheduler.schedules["daily-summary"].type == ScheduleType.DAILY
+    assert scheduler.schedules["daily-summary"].daily_time == "08:00"
+
+def test_add_schedule(scheduler, make_schedule):
     """Test adding a schedule."""
-    schedule = Schedule(
-        id="test-schedule",
-        name="Test Schedule",
-        type=ScheduleType.INTERVAL,
-        target="test_target",
-        interval_seconds=60
-    )
+    schedule = make_schedule()
     
     scheduler.add_schedule(schedule)
     
     assert "test-schedule" in scheduler.schedules
     assert scheduler.schedules["test-schedule"] == schedule
 
-def test_remove_schedule(scheduler):
+def test_remove_schedule(scheduler, make_schedule):
     """Test removing a schedule."""
     # Add a schedule
-    schedule = Schedule(
-        id="test-schedule",
-        name="Test Schedule",
-        type=ScheduleType.INTERVAL,
-        target="test_target",
-        interval_seconds=60
-    )
+    schedule = make_schedule()
     scheduler.schedules["test-schedule"] = schedule
     
     # Remove the schedule
@@ -295,16 +293,10 @@ def test_remove_schedule(scheduler):
     
     assert result is False
 
-def test_get_schedule(scheduler):
+def test_get_schedule(scheduler, make_schedule):
     """Test getting a schedule by ID."""
     # Add a schedule
-    schedule = Schedule(
-        id="test-schedule",
-        name="Test Schedule",
-        type=ScheduleType.INTERVAL,
-        target="test_target",
-        interval_seconds=60
-    )
+    schedule = make_schedule()
     scheduler.schedules["test-schedule"] = schedule
     
     # Get the schedule
@@ -317,21 +309,16 @@ def test_get_schedule(scheduler):
     
     assert result is None
 
-def test_get_schedules(scheduler):
+def test_get_schedules(scheduler, make_schedule):
     """Test getting all schedules."""
     # Add some schedules
-    schedule1 = Schedule(
-        id="schedule1",
-        name="Schedule 1",
-        type=ScheduleType.INTERVAL,
-        target="target1",
-        interval_seconds=60
-    )
-    schedule2 = Schedule(
+    schedule1 = make_schedule(id="schedule1", name="Schedule 1", target="target1")
+    schedule2 = make_schedule(
         id="schedule2",
         name="Schedule 2",
         type=ScheduleType.DAILY,
         target="target2",
+        interval_seconds=None,
         daily_time="08:00"
     )
     
@@ -345,16 +332,10 @@ def test_get_schedules(scheduler):
     assert schedule1 in result
     assert schedule2 in result
 
-def test_update_schedule(scheduler):
+def test_update_schedule(scheduler, make_schedule):
     """Test updating a schedule."""
     # Add a schedule
-    schedule = Schedule(
-        id="test-schedule",
-        name="Test Schedule",
-        type=ScheduleType.INTERVAL,
-        target="test_target",
-        interval_seconds=60
-    )
+    schedule = make_schedule()
     scheduler.schedules["test-schedule"] = schedule
     
     # Update the schedule
@@ -372,17 +353,10 @@ def test_update_schedule(scheduler):
     
     assert result is False
 
-def test_enable_disable_schedule(scheduler):
+def test_enable_disable_schedule(scheduler, make_schedule):
     """Test enabling and disabling a schedule."""
     # Add a schedule
-    schedule = Schedule(
-        id="test-schedule",
-        name="Test Schedule",
-        type=ScheduleType.INTERVAL,
-        target="test_target",
-        interval_seconds=60,
-        enabled=False
-    )
+    schedule = make_schedule(enabled=False)
     scheduler.schedules["test-schedule"] = schedule
     
     # Enable the schedule
@@ -403,43 +377,38 @@ def test_enable_disable_schedule(scheduler):
     assert scheduler.enable_schedule("nonexistent") is False
     assert scheduler.disable_schedule("nonexistent") is False
 
-def test_start_and_stop(scheduler, mock_queue):
+def test_start_and_stop(scheduler, mock_orchestrator, mock_queue, monkeypatch):
     """Test starting and stopping the scheduler."""
-    with patch.object(scheduler, '_scheduler_loop') as mock_loop:
-        # Test non-blocking start
-        scheduler.start(blocking=False)
-        
-        assert scheduler.running is True
-        assert scheduler.thread is not None
-        assert scheduler.thread.daemon is True
-        
-        # Verify the queue was started
-        mock_queue.start.assert_called_once_with(blocking=False)
-        
-        # Verify handlers were registered
-        assert mock_queue.register_handler.call_count == 3  # 3 handlers
-        
-        # Test stop
-        scheduler.stop()
-        
-        assert scheduler.running is False
-        
-        # Verify the thread was joined
-        # Note: Can't easily verify thread.join was called without mocking threading
-        
-        # Verify _scheduler_loop wasn't called directly (since we're in non-blocking mode)
-        mock_loop.assert_not_called()
-
-def test_run_now(scheduler, mock_queue):
+    loop_threads = []
+    monkeypatch.setattr(scheduler, "_scheduler_loop", lambda: loop_threads.append(threading.current_thread()))
+    monkeypatch.setattr(mock_queue, "running", False)
+    
+    # Test non-blocking start
+    scheduler.start(blocking=False)
+    
+    assert scheduler.running is True
+    assert scheduler.thread is not None
+    assert scheduler.thread.daemon is True
+    
+    # Verify the orchestrator and queue were started
+    mock_orchestrator.start.assert_called_once_with()
+    mock_queue.start.assert_called_once_with(blocking=False)
+    
+    # Verify handlers were registered
+    assert mock_queue.register_handler.call_count == 3  # 3 handlers
+    
+    # Test stop
+    scheduler.stop()
+    
+    assert scheduler.running is False
+    
+    # Verify _scheduler_loop ran on the background thread, not the caller's
+    assert loop_threads == [scheduler.thread]
+
+def test_run_now(scheduler, make_schedule, mock_queue):
     """Test running a schedule immediately."""
     # Add a schedule
-    schedule = Schedule(
-        id="test-schedule",
-        name="Test Schedule",
-        type=ScheduleType.INTERVAL,
-        target="test_target",
-        interval_seconds=60
-    )
+    schedule = make_schedule()
     scheduler.schedules["test-schedule"] = schedule
     
     # Run the schedule
@@ -465,54 +434,65 @@ def test_run_now(scheduler, mock_queue):
     
     assert result is False
 
-def test_scheduler_loop(scheduler, mock_queue):
+def test_scheduler_loop(scheduler, make_schedule, mock_queue, monkeypatch):
     """Test the scheduler loop."""
     # Add a schedule that's due to run
-    now = datetime.now()
-    past_time = now - timedelta(minutes=5)
+    now = _FROZEN_NOW
     
-    schedule = Schedule(
-        id="test-schedule",
-        name="Test Schedule",
-        type=ScheduleType.INTERVAL,
-        target="test_target",
-        interval_seconds=60,
-        next_run=past_time  # In the past so it will run immediately
-    )
+    schedule = make_schedule()
+    # Set after construction, which computes next_run itself
+    schedule.next_run = now - timedelta(minutes=5)  # In the past so it will run immediately
+    scheduler.schedules["test-schedule"] = schedule
+    
+    # Set up the loop to run once then stop
+    scheduler.running = True
+    enqueued = []
+    
+    def stop_after_one_iteration(schedule):
+        enqueued.append(schedule)
+        scheduler.running = False
+        # Skip the poll wait at the end of the iteration
+        scheduler._wake.set()
+    
+    monkeypatch.setattr(scheduler, "_enqueue_task", stop_after_one_iteration)
+    
+    # Run the loop
+    scheduler._scheduler_loop()
+    
+    # Verify _enqueue_task was called for the schedule
+    assert enqueued == [schedule]
+    
+    # Verify schedule stats were updated
+    assert schedule.last_run is not None
+    assert schedule.runs == 1
+    assert schedule.last_run == now
+    assert schedule.next_run == now + timedelta(seconds=60)
+
+def test_scheduler_loop_enqueue_failure(scheduler, make_schedule, mock_queue, monkeypatch):
+    """Test that enqueue failures in the scheduler loop are counted."""
+    schedule = make_schedule()
+    schedule.next_run = _FROZEN_NOW - timedelta(minutes=5)
     scheduler.schedules["test-schedule"] = schedule
     
-    # Mock time.sleep to avoid delay
-    with patch('time.sleep'):
-        # Set up the loop to run once then stop
-        scheduler.running = True
-        
-        def stop_after_one_iteration(*args, **kwargs):
-            scheduler.running = False
-        
-        # Patch _enqueue_task to stop the loop after one iteration
-        with patch.object(scheduler, '_enqueue_task', side_effect=stop_after_one_iteration) as mock_enqueue:
-            # Run the loop
-            scheduler._scheduler_loop()
-            
-            # Verify _enqueue_task was called for the schedule
-            mock_enqueue.assert_called_once_with(schedule)
-            
-            # Verify schedule stats were updated
-            assert schedule.last_run is not None
-            assert schedule.runs == 1
-            assert schedule.next_run > now  # Next run should be in the future
-
-def test_enqueue_task(scheduler, mock_queue):
+    scheduler.running = True
+    
+    def fail_and_stop(schedule):
+        scheduler.running = False
+        scheduler._wake.set()
+        raise RuntimeError("Queue unavailable")
+    
+    monkeypatch.setattr(scheduler, "_enqueue_task", fail_and_stop)
+    scheduler._scheduler_loop()
+    
+    # The schedule was advanced before enqueueing and the failure recorded
+    assert schedule.runs == 1
+    assert schedule.failures == 1
+    assert schedule.next_run == _FROZEN_NOW + timedelta(seconds=60)
+
+def test_enqueue_task(scheduler, make_schedule, mock_queue):
     """Test enqueueing a scheduled task."""
     # Create a schedule
-    schedule = Schedule(
-        id="test-schedule",
-        name="Test Schedule",
-        type=ScheduleType.INTERVAL,
-        target="test_target",
-        interval_seconds=60,
-        parameters={"param1": "value1"}
-    )
+    schedule = make_schedule(parameters={"param1": "value1"})
     
     # Enqueue the task
     scheduler._enqueue_task(schedule)
@@ -531,7 +511,67 @@ def test_enqueue_task(scheduler, mock_queue):
     assert "schedule_id" in kwargs["data"]
     assert kwargs["data"]["schedule_id"] == "test-schedule"
 
-def test_handler_methods(scheduler, mock_orchestrator):
+def test_enqueue_task_after_parameter_update(scheduler, make_schedule, mock_queue):
+    """Test that updated parameters are used for subsequent tasks."""
+    schedule = make_schedule(parameters={"param1": "value1"})
+    scheduler.schedules["test-schedule"] = schedule
+
+    scheduler.update_schedule("test-schedule", {"parameters": {"param1": "value2"}})
+    scheduler._enqueue_task(schedule)
+
+    args, kwargs = mock_queue.enqueue.call_args
+    assert kwargs["data"]["param1"] == "value2"
+
+    # The task data must not leak back into the schedule parameters
+    assert schedule.parameters == {"param1": "value2"}
+
+def test_enqueue_task_via_outbox(scheduler, make_schedule, mock_queue, monkeypatch):
+    """Test that tasks are handed to the queue by the outbox drain thread."""
+    schedule = make_schedule()
+    
+    monkeypatch.setattr(scheduler, "_scheduler_loop", lambda: None)
+    scheduler.start(blocking=False)
+    scheduler._enqueue_task(schedule)
+    
+    # stop() flushes the outbox before the drain thread exits
+    scheduler.stop()
+    
+    mock_queue.enqueue.assert_called_once()
+    args, kwargs = mock_queue.enqueue.call_args
+    assert kwargs["message_type"] == "test_target"
+    assert kwargs["data"]["schedule_id"] == "test-schedule"
+
+def test_stop_enqueues_tasks_left_in_outbox(scheduler, make_schedule, mock_queue, monkeypatch):
+    """Test that stop() enqueues tasks the drain thread didn't take."""
+    schedule = make_schedule()
+    
+    # The drain thread exits without reading the outbox once released
+    release = threading.Event()
+    monkeypatch.setattr(scheduler, "_scheduler_loop", lambda: None)
+    monkeypatch.setattr(scheduler, "_drain_outbox", release.wait)
+    scheduler.start(blocking=False)
+    scheduler._enqueue_task(schedule)
+    mock_queue.enqueue.assert_not_called()
+    
+    release.set()
+    scheduler.stop()
+    
+    mock_queue.enqueue.assert_called_once()
+    assert mock_queue.enqueue.call_args[1]["data"]["schedule_id"] == "test-schedule"
+
+def test_start_twice(scheduler, mock_orchestrator, monkeypatch):
+    """Test that starting a running scheduler does not start a second drain thread."""
+    monkeypatch.setattr(scheduler, "_scheduler_loop", lambda: None)
+    scheduler.start(blocking=False)
+    outbox_thread = scheduler._outbox_thread
+    
+    scheduler.start(blocking=False)
+    
+    assert scheduler._outbox_thread is outbox_thread
+    mock_orchestrator.start.assert_called_once_with()
+    scheduler.stop()
+
+def test_handler_methods(scheduler, mock_orchestrator, monkeypatch):
     """Test the message handler methods."""
     # Create a test message
     class TestMessage:
@@ -554,15 +594,17 @@ def test_handler_methods(scheduler, mock_orchestrator):
     mock_loop.run_until_complete.return_value = mock_context
     mock_loop.close = MagicMock()
     
-    with patch('asyncio.new_event_loop', return_value=mock_loop):
-        # Call the handler
-        scheduler._handle_process_email(message)
-        
-        # Verify orchestrator.process_email was called with correct args
-        mock_orchestrator.process_email.assert_called_once_with({
-            "maxResults": 10,
-            "filter": "isRead eq false"
-        })
-        
-        # Verify the loop was closed
-        mock_loop.close.assert_called_once()
\ No newline at end of file
+    monkeypatch.setattr(asyncio, "new_event_loop", lambda: mock_loop)
+    monkeypatch.setattr(asyncio, "set_event_loop", lambda loop: None)
+    
+    # Call the handler
+    scheduler._handle_process_email(message)
+    
+    # Verify orchestrator.process_email was called with correct args
+    mock_orchestrator.process_email.assert_called_once_with({
+        "maxResults": 10,
+        "filter": "isRead eq false"
+    })
+    
+    # Verify the loop was closed
+    mock_loop.close.assert_called_once()
\ No newline at end of file
@@ -2,32 +2,51 @@
 Tests for the Secret Manager module.
 """
 import pytest
-import os
-from unittest.mock import patch, MagicMock
+import sys
+from types import SimpleNamespace
+from unittest.mock import call, MagicMock
 from python_components.utils.secrets_manager import SecretsManager
 
-@pytest.fixture
-def mock_client():
+@pytest.fixture(scope="module")
+def google_stubs():
+    """Stand in for the Google client libraries so they are never imported."""
+    secretmanager = MagicMock()
+    service_account = MagicMock()
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setitem(sys.modules, "google.cloud", MagicMock(secretmanager=secretmanager))
+        mp.setitem(sys.modules, "google.cloud.secretmanager", secretmanager)
+        mp.setitem(sys.modules, "google.oauth2", MagicMock(service_account=service_account))
+        mp.setitem(sys.modules, "google.oauth2.service_account", service_account)
+        yield SimpleNamespace(secretmanager=secretmanager, service_account=service_account)
+
+@pytest.fixture(scope="module")
+def mock_client(google_stubs):
     """Create a mock Secret Manager client."""
-    with patch('google.cloud.secretmanager.SecretManagerServiceClient') as mock:
-        client_instance = MagicMock()
-        mock.return_value = client_instance
-        yield mock
+    mock = google_stubs.secretmanager.SecretManagerServiceClient
+    mock.return_value = MagicMock()
+    return mock
+
+@pytest.fixture(autouse=True)
+def reset_client(mock_client):
+    """Clear calls and responses left on the shared client mock by earlier tests."""
+    mock_client.reset_mock()
+    # Keep the client instance itself, since secrets_manager already holds it
+    mock_client.return_value.reset_mock(return_value=True, side_effect=True)
 
 @pytest.fixture
-def mock_service_account():
+def mock_service_account(google_stubs):
     """Create a mock service account credentials."""
-    with patch('google.oauth2.service_account.Credentials.from_service_account_file') as mock:
-        credentials_instance = MagicMock()
-        mock.return_value = credentials_instance
-        yield mock
+    mock = google_stubs.service_account.Credentials.from_service_account_file
+    mock.reset_mock()
+    mock.return_value = MagicMock()
+    return mock
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def secrets_manager(mock_client):
     """Create a SecretsManager instance with mocked dependencies."""
-    with patch.dict(os.environ, {"GOOGLE_CLOUD_PROJECT": "test-project"}):
-        manager = SecretsManager()
-        return manager
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "test-project")
+        return SecretsManager()
 
 def test_init_with_project_id(mock_client):
     """Test SecretsManager initialization with project ID."""
@@ -35,11 +54,11 @@ def test_init_with_project_id(mock_client):
     assert manager.project_id == "my-project"
     mock_client.assert_called_once()
 
-def test_init_with_env_var(mock_client):
+def test_init_with_env_var(mock_client, monkeypatch):
     """Test SecretsManager initialization with environment variable."""
-    with patch.dict(os.environ, {"GOOGLE_CLOUD_PROJECT": "env-project"}):
-        manager = SecretsManager()
-        assert manager.project_id == "env-project"
+    monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "env-project")
+    manager = SecretsManager()
+    assert manager.project_id == "env-project"
     mock_client.assert_called_once()
 
 def test_init_with_credentials_path(mock_client, mock_service_account):
@@ -53,22 +72,52 @@ def test_init_with_credentials_path(mock_client, mock_service_account):
         "/path/to/credentials.json",
         scopes=["https://www.googleapis.com/auth/cloud-platform"]
     )
+    mock_client.assert_called_once_with(credentials=mock_service_account.return_value)
 
-def test_get_secret(secrets_manager):
-    """Test getting a secret."""
-    # Mock the response from Secret Manager
-    mock_response = MagicMock()
-    mock_response.payload.data.decode.return_value = "test-secret-value"
-    secrets_manager.client.access_secret_version.return_value = mock_response
+@pytest.mark.parametrize(
+    "method,args,client_method,response,expected_call,expected_result",
+    [
+        (
+            "get_secret", ("test-secret",), "access_secret_version",
+            SimpleNamespace(payload=SimpleNamespace(data=b"test-secret-value")),
+            call(name="projects/test-project/secrets/test-secret/versions/latest"),
+            "test-secret-value",
+        ),
+        (
+            "update_secret", ("test-secret", "new-value"), "add_secret_version", None,
+            call(request={
+                "parent": "projects/test-project/secrets/test-secret",
+                "payload": {"data": b"new-value"},
+            }),
+            None,
+        ),
+        (
+            "delete_secret", ("test-secret",), "delete_secret", None,
+            call(request={"name": "projects/test-project/secrets/test-secret"}),
+            None,
+        ),
+        (
+            "list_secrets", (), "list_secrets",
+            [
+                SimpleNamespace(name="projects/test-project/secrets/secret1"),
+                SimpleNamespace(name="projects/test-project/secrets/secret2"),
+            ],
+            call(request={"parent": "projects/test-project"}),
+            ["secret1", "secret2"],
+        ),
+    ],
+    ids=["get", "update", "delete", "list"],
+)
+def test_secret_operations(secrets_manager, method, args, client_method, response,
+                           expected_call, expected_result):
+    """Test that each operation makes a single client call and returns its result."""
+    client_call = getattr(secrets_manager.client, client_method)
+    client_call.return_value = response
     
-    # Call the method
-    result = secrets_manager.get_secret("test-secret")
+    result = getattr(secrets_manager, method)(*args)
     
-    # Verify the result
-    assert result == "test-secret-value"
-    secrets_manager.client.access_secret_version.assert_called_once_with(
-        name="projects/test-project/secrets/test-secret/versions/latest"
-    )
+    assert result == expected_result
+    assert client_call.call_args_list == [expected_call]
 
 def test_create_secret(secrets_manager):
     """Test creating a secret."""
@@ -85,43 +134,3 @@ def test_create_secret(secrets_manager):
     add_call_args = secrets_manager.client.add_secret_version.call_args[1]["request"]
     assert add_call_args["parent"] == "projects/test-project/secrets/test-secret"
     assert add_call_args["payload"]["data"] == b"test-value"
-
-def test_update_secret(secrets_manager):
-    """Test updating a secret."""
-    # Call the method
-    secrets_manager.update_secret("test-secret", "new-value")
-    
-    # Verify the call
-    secrets_manager.client.add_secret_version.assert_called_once()
-    add_call_args = secrets_manager.client.add_secret_version.call_args[1]["request"]
-    assert add_call_args["parent"] == "projects/test-project/secrets/test-secret"
-    assert add_call_args["payload"]["data"] == b"new-value"
-
-def test_delete_secret(secrets_manager):
-    """Test deleting a secret."""
-    # Call the method
-    secrets_manager.delete_secret("test-secret")
-    
-    # Verify the call
-    secrets_manager.client.delete_secret.assert_called_once_with(
-        request={"name": "projects/test-project/secrets/test-secret"}
-    )
-
-def test_list_secrets(secrets_manager):
-    """Test listing secrets."""
-    # Mock the response
-    mock_secret1 = MagicMock()
-    mock_secret1.name = "projects/test-project/secrets/secret1"
-    mock_secret2 = MagicMock()
-    mock_secret2.name = "projects/test-project/secrets/secret2"
-    
-    secrets_manager.client.list_secrets.return_value = [mock_secret1, mock_secret2]
-    
-    # Call the method
-    result = secrets_manager.list_secrets()
-    
-    # Verify the result
-    assert result == ["secret1", "secret2"]
-    secrets_manager.client.list_secrets.assert_called_once_with(
-        request={"parent": "projects/test-project"}
-    )
\ No newline at end of file
@@ -0,0 +1,14 @@
+"""
+Tests for the timestamp helpers.
+"""
+from datetime import datetime
+from python_components.utils.timestamps import parse_timestamp
+
+def test_parse_timestamp():
+    """Test parsing ISO strings, epoch seconds and datetimes."""
+    moment = datetime(2024, 1, 15, 7, 30, 15)
+    
+    assert parse_timestamp(moment.isoformat()) == moment
+    assert parse_timestamp(moment.timestamp()) == moment
+    assert parse_timestamp(int(moment.timestamp())) == moment
+    assert parse_timestamp(moment) is moment
@@ -4,7 +4,7 @@ Tests for the webhook handler.
 import os
 import json
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, AsyncMock, MagicMock
 from aiohttp.test_utils import AioHTTPTestCase, unittest_run_loop
 from aiohttp import web
 from python_components.pipeline.webhook import WebhookHandler
@@ -12,7 +12,8 @@ from python_components.pipeline.webhook import WebhookHandler
 @pytest.fixture
 def mock_orchestrator():
     """Create a mock PipelineOrchestrator."""
-    with patch('python_components.pipeline.orchestrator.PipelineOrchestrator') as mock:
+    # The webhook module imports the class by name, so patch it where it is looked up
+    with patch('python_components.pipeline.webhook.PipelineOrchestrator') as mock:
         orchestrator_instance = MagicMock()
         mock.return_value = orchestrator_instance
         yield orchestrator_instance
@@ -23,9 +24,14 @@ class TestWebhookHandler(AioHTTPTestCase):
     async def get_application(self):
         """Create and return an application for testing."""
         # Patch the orchestrator
-        self.mock_orchestrator_patcher = patch('python_components.pipeline.orchestrator.PipelineOrchestrator')
+        self.mock_orchestrator_patcher = patch('python_components.pipeline.webhook.PipelineOrchestrator')
         self.mock_orchestrator = self.mock_orchestrator_patcher.start()
         self.mock_orchestrator_instance = MagicMock()
+        
+        # The background pipelines await these
+        self.mock_orchestrator_instance.process_email = AsyncMock()
+        self.mock_orchestrator_instance.process_slack = AsyncMock()
+        self.mock_orchestrator_instance.generate_daily_summary = AsyncMock()
         self.mock_orchestrator.return_value = self.mock_orchestrator_instance
         
         # Patch webhook token validation
@@ -50,6 +56,7 @@ class TestWebhookHandler(AioHTTPTestCase):
         """Test the health check endpoint."""
         # Configure the mock
         self.mock_orchestrator_instance.pipeline_history = []
+        self.mock_orchestrator_instance.total_pipelines = 0
         
         # Make the request
         resp = await self.client.get('/health')
@@ -60,6 +67,24 @@ class TestWebhookHandler(AioHTTPTestCase):
         assert data['status'] == 'healthy'
         assert 'timestamp' in data
         assert data['pipeline_history_count'] == 0
+        assert data['total_pipelines'] == 0
+    
+    @unittest_run_loop
+    async def test_metrics(self):
+        """Test the metrics endpoint."""
+        # Configure the mock
+        self.mock_orchestrator_instance.pipeline_history = []
+        self.mock_orchestrator_instance.total_pipelines = 3
+        
+        # Make the request
+        resp = await self.client.get('/metrics')
+        
+        # Verify the response
+        assert resp.status == 200
+        data = await resp.json()
+        assert data['total_pipelines'] == 3
+        assert data['pipeline_history_count'] == 0
+        assert data['background_tasks'] == 0
     
     @unittest_run_loop
     async def test_email_webhook(self):
@@ -164,7 +189,7 @@ class TestWebhookHandler(AioHTTPTestCase):
         assert 'Invalid webhook token' in data['error']
 
 @patch.dict(os.environ, {"WEBHOOK_TOKEN": "test-token"})
-def test_validate_webhook_token():
+def test_validate_webhook_token(mock_orchestrator):
     """Test the webhook token validation."""
     webhook = WebhookHandler()
     
@@ -188,8 +213,17 @@ def test_validate_webhook_token():
     mock_request.query = {"token": "test-token"}
     assert webhook._validate_webhook_token(mock_request) is True
     
+    # Test that a present but non-matching header is not overridden by the query
+    mock_request.headers = {"Authorization": "Basic test-token"}
+    assert webhook._validate_webhook_token(mock_request) is False
+    mock_request.headers = {}
+    
     # Test with token in body
     mock_request.query = {}
-    mock_request.body_exists = True
-    mock_request.json.return_value = {"token": "test-token"}
-    assert webhook._validate_webhook_token(mock_request) is True
\ No newline at end of file
+    assert webhook._validate_webhook_token(mock_request, {"token": "test-token"}) is True
+    assert webhook._validate_webhook_token(mock_request, {"token": "wrong-token"}) is False
+    assert webhook._validate_webhook_token(mock_request, {"token": 123}) is False
+    assert webhook._validate_webhook_token(mock_request, {"token": ["test-token"]}) is False
+    
+    # The body is never parsed by the validator itself
+    mock_request.json.assert_not_called()
\ No newline at end of file
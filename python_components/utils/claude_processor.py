@@ -2,16 +2,81 @@
 Claude API integration for ICAP.
 """
 import os
-import json
+import hashlib
 import logging
 import re
+import threading
+import time
 from datetime import datetime
 from typing import Dict, Any, List, Optional, Tuple
 import anthropic
+import httpx
+import orjson
+from cachetools import TTLCache
 from dateutil import parser as date_parser
 
 logger = logging.getLogger("icap.claude")
 
+# Seconds to wait between status checks of a submitted message batch
+BATCH_POLL_INTERVAL = 10.0
+
+# Seconds to wait for a message batch to end before cancelling it
+BATCH_TIMEOUT = 3600.0
+
+# Keep-alive pool of the HTTP client shared by all Claude processors
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 32
+HTTP_KEEPALIVE_EXPIRY = 60.0
+
+_http_client: Optional[httpx.Client] = None
+_http_client_lock = threading.Lock()
+
+# Size and lifetime (seconds) of the cache of extraction results
+EXTRACTION_CACHE_SIZE = 10000
+EXTRACTION_CACHE_TTL = 24 * 3600
+
+def _extraction_key(content: str, content_type: str) -> str:
+    """
+    Build the cache key for extracting action items from content.
+    
+    Content is compared case- and whitespace-insensitively. The key includes
+    today's date because relative due dates are resolved against it.
+    
+    Args:
+        content: The email or message content
+        content_type: Type of content ('email' or 'slack')
+        
+    Returns:
+        Cache key for the extraction
+    """
+    normalized = " ".join(content.split()).lower()
+    digest = hashlib.blake2b(normalized.encode(), digest_size=16).hexdigest()
+    return f"{digest}:{content_type}:{datetime.now().strftime('%Y-%m-%d')}"
+
+def _shared_http_client() -> httpx.Client:
+    """
+    Get the HTTP client shared by all Claude processors in this process.
+    
+    Connections are kept alive and multiplexed over HTTP/2 when the h2 package
+    is installed, so concurrent extractions reuse one TLS session.
+    
+    Returns:
+        The shared HTTP client
+    """
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            limits = httpx.Limits(
+                max_connections=None,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            )
+            try:
+                _http_client = anthropic.DefaultHttpxClient(http2=True, limits=limits)
+            except ImportError:
+                logger.warning("h2 package not installed, using HTTP/1.1 for the Claude API")
+                _http_client = anthropic.DefaultHttpxClient(limits=limits)
+        return _http_client
+
 class ClaudeProcessor:
     """Processor for Claude API integration."""
     
@@ -26,7 +91,7 @@ class ClaudeProcessor:
         if not self.api_key:
             raise ValueError("CLAUDE_API_KEY environment variable not set")
         
-        self.client = anthropic.Anthropic(api_key=self.api_key)
+        self.client = anthropic.Anthropic(api_key=self.api_key, http_client=_shared_http_client())
         self.model = model or "claude-3-sonnet-20240229"  # Can be configured based on needs
         logger.info(f"Claude API client initialized with model: {self.model}")
         
@@ -42,6 +107,10 @@ class ClaudeProcessor:
             "low": "low",
             "whenever": "low"
         }
+        
+        # Extraction results by content, so identical messages are only sent once
+        self._extraction_cache = TTLCache(maxsize=EXTRACTION_CACHE_SIZE, ttl=EXTRACTION_CACHE_TTL)
+        self._extraction_cache_lock = threading.Lock()
     
     def extract_action_items(self, content: str, content_type: str) -> List[Dict[str, Any]]:
         """
@@ -56,32 +125,24 @@ class ClaudeProcessor:
         """
         logger.info(f"Extracting action items from {content_type} content")
         
-        # Build context-specific system prompt
-        system_prompt = self._build_system_prompt(content_type)
-        
-        # Build user prompt with context-specific instructions
-        user_prompt = self._build_user_prompt(content, content_type)
+        cache_key = _extraction_key(content, content_type)
+        cached_items = self._get_cached_extraction(cache_key)
+        if cached_items is not None:
+            logger.info(f"Reusing {len(cached_items)} action items extracted from identical content")
+            return cached_items
         
         try:
             # Call Claude API with appropriate settings
-            response = self.client.messages.create(
-                model=self.model,
-                system=system_prompt,
-                messages=[{"role": "user", "content": user_prompt}],
-                temperature=0.0,  # Use exact 0 temperature for deterministic results
-                max_tokens=4000
-            )
+            response = self.client.messages.create(**self._extraction_params(content, content_type))
             
             # Extract text content from response
             response_text = response.content[0].text
             
-            # Parse the JSON from the response
-            action_items = self._parse_claude_response(response_text)
-            
-            # Post-process extracted items
-            processed_items = self._post_process_items(action_items, content_type)
+            # Parse and post-process the extracted items
+            processed_items = self._items_from_response(response_text, content_type)
             
             logger.info(f"Successfully extracted {len(processed_items)} action items")
+            self._cache_extraction(cache_key, processed_items)
             return processed_items
             
         except anthropic.APIError as e:
@@ -97,6 +158,120 @@ class ClaudeProcessor:
             logger.error(f"Failed to extract action items: {str(e)}")
             return []
     
+    def extract_action_items_batch(self, contents: Dict[str, Tuple[str, str]],
+                                   poll_interval: float = BATCH_POLL_INTERVAL,
+                                   timeout: float = BATCH_TIMEOUT) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Extract action items from many messages with a single Message Batches request.
+        
+        Args:
+            contents: Mapping of custom ID to (content, content_type); custom IDs may
+                only contain letters, digits, underscores and hyphens
+            poll_interval: Seconds to wait between batch status checks
+            timeout: Seconds to wait for the batch to end before cancelling it
+            
+        Returns:
+            Mapping of custom ID to extracted action items; messages whose request
+            failed are left out so callers can fall back to extract_action_items
+        """
+        # Only submit content that was not extracted already
+        results = {}
+        pending = {}
+        for custom_id, (content, content_type) in contents.items():
+            cached_items = self._get_cached_extraction(_extraction_key(content, content_type))
+            if cached_items is not None:
+                results[custom_id] = cached_items
+            else:
+                pending[custom_id] = (content, content_type)
+        
+        if not pending:
+            return results
+        
+        logger.info(f"Submitting batch to extract action items from {len(pending)} messages")
+        
+        # The pinned SDK only exposes Message Batches under the beta namespace
+        batches = self.client.beta.messages.batches
+        
+        try:
+            batch = batches.create(requests=[
+                {"custom_id": custom_id, "params": self._extraction_params(content, content_type)}
+                for custom_id, (content, content_type) in pending.items()
+            ])
+            
+            # Batches are processed asynchronously, so wait for the batch to end
+            deadline = time.monotonic() + timeout
+            while batch.processing_status != "ended":
+                if time.monotonic() >= deadline:
+                    logger.warning(f"Batch {batch.id} did not end within {timeout} seconds, cancelling it")
+                    batches.cancel(batch.id)
+                    return results
+                time.sleep(poll_interval)
+                batch = batches.retrieve(batch.id)
+            
+            for entry in batches.results(batch.id):
+                if entry.result.type != "succeeded":
+                    logger.warning(f"Batch request {entry.custom_id} did not succeed: {entry.result.type}")
+                    continue
+                
+                content, content_type = pending[entry.custom_id]
+                response_text = entry.result.message.content[0].text
+                results[entry.custom_id] = self._items_from_response(response_text, content_type)
+                self._cache_extraction(_extraction_key(content, content_type), results[entry.custom_id])
+            
+            logger.info(f"Batch {batch.id} extracted action items for {len(results)} of {len(contents)} messages")
+            return results
+            
+        except anthropic.APIError as e:
+            logger.error(f"Claude API error in batch extraction: {str(e)}")
+            return results
+    
+    def _get_cached_extraction(self, cache_key: str) -> Optional[List[Dict[str, Any]]]:
+        """Return a copy of the action items cached for an extraction, if any."""
+        with self._extraction_cache_lock:
+            items = self._extraction_cache.get(cache_key)
+        return [dict(item) for item in items] if items is not None else None
+    
+    def _cache_extraction(self, cache_key: str, items: List[Dict[str, Any]]) -> None:
+        """Cache the action items of a successful extraction."""
+        try:
+            with self._extraction_cache_lock:
+                self._extraction_cache[cache_key] = [dict(item) for item in items]
+        except Exception as e:
+            logger.warning(f"Failed to cache extracted action items: {str(e)}")
+    
+    def _extraction_params(self, content: str, content_type: str) -> Dict[str, Any]:
+        """
+        Build the Messages API parameters used to extract action items.
+        
+        Args:
+            content: The email or message content
+            content_type: Type of content ('email' or 'slack')
+            
+        Returns:
+            Keyword arguments for messages.create
+        """
+        return {
+            "model": self.model,
+            "system": self._build_system_prompt(content_type),
+            "messages": [{"role": "user", "content": self._build_user_prompt(content, content_type)}],
+            "temperature": 0.0,  # Use exact 0 temperature for deterministic results
+            "max_tokens": 4000
+        }
+    
+    def _items_from_response(self, response_text: str, content_type: str) -> List[Dict[str, Any]]:
+        """
+        Parse and post-process the action items in a Claude response.
+        
+        Args:
+            response_text: Claude's text response
+            content_type: Type of content the response was generated for
+            
+        Returns:
+            List of processed action items
+        """
+        action_items = self._parse_claude_response(response_text)
+        return self._post_process_items(action_items, content_type)
+    
     def _build_system_prompt(self, content_type: str) -> str:
         """
         Build system prompt for Claude based on content type.
@@ -202,7 +377,7 @@ class ClaudeProcessor:
             try:
                 # Parse the matched JSON content
                 json_text = json_match.group(0)
-                action_items = json.loads(json_text)
+                action_items = orjson.loads(json_text)
                 
                 if isinstance(action_items, list):
                     return action_items
@@ -210,19 +385,19 @@ class ClaudeProcessor:
                     logger.warning(f"Expected JSON array, got: {type(action_items)}")
                     return []
                     
-            except json.JSONDecodeError as e:
+            except orjson.JSONDecodeError as e:
                 logger.error(f"Failed to parse JSON from Claude response: {str(e)}")
         else:
             try:
                 # Try to parse the entire response as JSON (sometimes Claude returns clean JSON)
-                action_items = json.loads(response_text.strip())
+                action_items = orjson.loads(response_text.strip())
                 
                 if isinstance(action_items, list):
                     return action_items
                 else:
                     logger.warning(f"Expected JSON array, got: {type(action_items)}")
                     return []
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 logger.error("Could not extract JSON array from Claude response")
         
         # Fallback - search for anything that looks like JSON items
@@ -235,7 +410,7 @@ class ClaudeProcessor:
                 action_items = []
                 for item_text in items:
                     try:
-                        item = json.loads(item_text)
+                        item = orjson.loads(item_text)
                         action_items.append(item)
                     except:
                         pass
@@ -414,7 +589,7 @@ class ClaudeProcessor:
             try:
                 json_match = re.search(r'{.*}', response_text, re.DOTALL)
                 if json_match:
-                    analysis = json.loads(json_match.group(0))
+                    analysis = orjson.loads(json_match.group(0))
                     
                     # Update action item with additional context
                     enhanced_item = action_item.copy()
@@ -441,7 +616,7 @@ class ClaudeProcessor:
                         enhanced_item['dependencies'] = analysis['key_dependencies']
                     
                     return enhanced_item
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 logger.warning("Could not parse context analysis response as JSON")
             
             # Return original item if parsing fails
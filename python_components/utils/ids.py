@@ -0,0 +1,44 @@
+"""
+Time-sortable identifiers for ICAP.
+"""
+import os
+import time
+import uuid
+from typing import List
+
+def new_ids(count: int) -> List[str]:
+    """
+    Generate UUIDv7 identifiers that sort in creation order.
+    
+    The IDs share one millisecond timestamp and use a sequence number as the
+    12 bit rand_a field, so IDs from the same batch also sort in order. Random
+    bits for the whole batch come from a single os.urandom call.
+    
+    Args:
+        count: Number of IDs to generate
+    
+    Returns:
+        List of UUID strings
+    """
+    timestamp_ms = time.time_ns() // 1_000_000
+    random_bytes = os.urandom(8 * count)
+    
+    ids = []
+    for index in range(count):
+        # Roll over into the next millisecond after 4096 IDs
+        unix_ts_ms = (timestamp_ms + (index >> 12)) & 0xFFFFFFFFFFFF
+        rand_a = index & 0xFFF
+        rand_b = int.from_bytes(random_bytes[8 * index:8 * index + 8], "big") & 0x3FFFFFFFFFFFFFFF
+        
+        value = (unix_ts_ms << 80) | (0x7 << 76) | (rand_a << 64) | (0b10 << 62) | rand_b
+        ids.append(str(uuid.UUID(int=value)))
+    return ids
+
+def new_id() -> str:
+    """
+    Generate a single UUIDv7 identifier.
+    
+    Returns:
+        UUID string
+    """
+    return new_ids(1)[0]
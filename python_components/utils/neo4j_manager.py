@@ -2,16 +2,26 @@
 Neo4j database manager for ICAP.
 """
 import os
-import json
 import logging
-from typing import Dict, Any, List, Optional, Union
+import threading
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Set, Tuple, Union
 from neo4j import GraphDatabase, Driver, Session
 
 logger = logging.getLogger("icap.neo4j")
 
+# Number of parallel transactions and minimum batch size for sharded writes
+WRITE_SHARDS = int(os.getenv("NEO4J_WRITE_SHARDS", "4"))
+SHARDED_WRITE_MIN_ROWS = 1000
+
 class Neo4jManager:
     """Manager class for Neo4j database operations."""
     
+    # Database URIs whose constraints were already ensured by this process
+    _constraints_ensured: Set[str] = set()
+    _constraints_lock = threading.Lock()
+    
     def __init__(self):
         """Initialize the Neo4j connection."""
         self.uri = os.getenv("NEO4J_URI", "bolt://localhost:7687")
@@ -66,6 +76,19 @@ class Neo4jManager:
             
             logger.info("Database constraints created")
     
+    def ensure_constraints(self) -> None:
+        """
+        Create the database constraints once per process and database.
+        
+        The uniqueness constraints back the id, email and name lookups that
+        MERGE relies on, so each lookup is an index seek rather than a scan.
+        """
+        with Neo4jManager._constraints_lock:
+            if self.uri in Neo4jManager._constraints_ensured:
+                return
+            self.create_constraints()
+            Neo4jManager._constraints_ensured.add(self.uri)
+    
     def create_action_item(self, action_item: Dict[str, Any]) -> str:
         """
         Create a new action item in the database.
@@ -90,7 +113,7 @@ class Neo4jManager:
         # Convert any list/dict properties to JSON strings
         for key, value in params.items():
             if isinstance(value, (list, dict)):
-                params[key] = json.dumps(value)
+                params[key] = orjson.dumps(value).decode()
         
         # Build dynamic query to handle variable properties
         query_parts = [
@@ -106,6 +129,221 @@ class Neo4jManager:
             record = result.single()
             return record["id"]
     
+    def create_action_items_bulk(self, items: List[Dict[str, Any]]) -> List[str]:
+        """
+        Create action items and their relationships in a single query.
+        
+        Items are merged on their ID, so writing the same rows again is a no-op.
+        
+        Args:
+            items: List of dictionaries, one per action item
+                - action_item: Action item properties (see create_action_item)
+                - people: List of (person_identifier, relationship_type) tuples
+                - projects: List of project names
+        
+        Returns:
+            The IDs of the created action items
+        """
+        if not items:
+            return []
+        
+        rows, link_keys = self._bulk_rows(items)
+        query_parts = [
+            "UNWIND $rows AS row",
+            "MERGE (a:ActionItem {id: row.props.id})",
+            "SET a = row.props"
+        ]
+        query_parts.extend(self._link_clauses(link_keys))
+        query_parts.append("RETURN a.id as id")
+        query = "\n".join(query_parts)
+        
+        with self.get_session() as session:
+            result = session.run(query, {"rows": rows})
+            ids = [record["id"] for record in result]
+        
+        logger.debug(f"Created {len(ids)} action items in bulk")
+        return ids
+    
+    def create_action_items_sharded(self, items: List[Dict[str, Any]],
+                                    shards: int = WRITE_SHARDS) -> List[str]:
+        """
+        Create many action items using parallel transactions.
+        
+        Items are partitioned so that shards share no source message, person or
+        project, and each shard writes its action items and their relationships
+        in one transaction without conflicting with the others. If any shard
+        fails, the action items written by the others are deleted again before
+        the error is raised, so the batch can be retried without duplicates.
+        Small batches are written with create_action_items_bulk.
+        
+        Args:
+            items: List of dictionaries, one per action item (see create_action_items_bulk)
+            shards: Number of parallel transactions
+            
+        Returns:
+            The IDs of the created action items, grouped by shard
+        """
+        if shards <= 1 or len(items) < SHARDED_WRITE_MIN_ROWS:
+            return self.create_action_items_bulk(items)
+        
+        rows, link_keys = self._bulk_rows(items)
+        query_parts = [
+            "UNWIND $rows AS row",
+            "MERGE (a:ActionItem {id: row.props.id})",
+            "SET a = row.props"
+        ]
+        query_parts.extend(self._link_clauses(link_keys))
+        query_parts.append("RETURN a.id as id")
+        query = "\n".join(query_parts)
+        
+        def write_shard(bucket: List[Dict[str, Any]]) -> List[str]:
+            with self.get_session() as session:
+                return session.execute_write(self._write_rows, query, bucket)
+        
+        buckets = self._shard_rows(rows, link_keys, shards)
+        with ThreadPoolExecutor(max_workers=shards, thread_name_prefix="icap-neo4j") as executor:
+            futures = [executor.submit(write_shard, bucket) for bucket in buckets]
+        
+        outcomes = [future.exception() for future in futures]
+        errors = [error for error in outcomes if error is not None]
+        shard_ids = [future.result() for future, error in zip(futures, outcomes) if error is None]
+        ids = [item_id for bucket_ids in shard_ids for item_id in bucket_ids]
+        if errors:
+            if ids:
+                self._delete_action_items(ids)
+            raise errors[0]
+        
+        logger.debug(f"Created {len(ids)} action items in {len(buckets)} shards")
+        return ids
+    
+    @staticmethod
+    def _write_rows(tx, query: str, rows: List[Dict[str, Any]]) -> List[str]:
+        """Run a bulk write query in a transaction and return the written IDs."""
+        return [record["id"] for record in tx.run(query, {"rows": rows})]
+    
+    def _delete_action_items(self, ids: List[str]) -> None:
+        """
+        Delete action items written by a sharded write that failed part way.
+        
+        Args:
+            ids: IDs of the action items to delete
+        """
+        try:
+            with self.get_session() as session:
+                session.execute_write(lambda tx: tx.run("""
+                    UNWIND $ids AS id
+                    MATCH (a:ActionItem {id: id})
+                    DETACH DELETE a
+                """, {"ids": ids}).consume())
+        except Exception as e:
+            logger.error(f"Failed to delete {len(ids)} action items of a failed sharded write: {str(e)}")
+        else:
+            logger.warning(f"Deleted {len(ids)} action items of a failed sharded write")
+    
+    def _shard_rows(self, rows: List[Dict[str, Any]], link_keys: Set[Tuple[str, str]],
+                    shards: int) -> List[List[Dict[str, Any]]]:
+        """
+        Partition bulk write rows into shards that share no nodes.
+        
+        Rows from the same source message, or linked to the same person or
+        project, are kept in the same shard, so concurrent transactions never
+        MERGE the same node.
+        
+        Args:
+            rows: Rows built by _bulk_rows
+            link_keys: The (relationship type, person property) pairs in use
+            shards: Maximum number of shards
+            
+        Returns:
+            The non-empty shards, each a list of rows
+        """
+        # Union-find over row indexes, joining rows through the nodes they touch
+        parents = list(range(len(rows)))
+        
+        def find(index: int) -> int:
+            while parents[index] != index:
+                parents[index] = parents[parents[index]]
+                index = parents[index]
+            return index
+        
+        owners: Dict[Tuple[str, str], int] = {}
+        for index, row in enumerate(rows):
+            keys = [("source_id", str(row["props"].get("source_id", "")))]
+            keys.extend(("project", name) for name in row["projects"])
+            for relationship_type, person_property in link_keys:
+                keys.extend(
+                    (person_property, identifier)
+                    for identifier in row.get(f"{relationship_type}_{person_property}", ())
+                )
+            for key in keys:
+                root, other = find(owners.setdefault(key, index)), find(index)
+                if root != other:
+                    parents[other] = root
+        
+        groups: Dict[int, List[Dict[str, Any]]] = {}
+        for index, row in enumerate(rows):
+            groups.setdefault(find(index), []).append(row)
+        
+        # Place the largest groups first, each on the emptiest shard
+        buckets: List[List[Dict[str, Any]]] = [[] for _ in range(shards)]
+        for group in sorted(groups.values(), key=len, reverse=True):
+            min(buckets, key=len).extend(group)
+        return [bucket for bucket in buckets if bucket]
+    
+    def _bulk_rows(self, items: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Set[Tuple[str, str]]]:
+        """
+        Build the UNWIND rows for a bulk write of action items.
+        
+        Args:
+            items: List of dictionaries, one per action item (see create_action_items_bulk)
+            
+        Returns:
+            Tuple of the rows and the (relationship type, person property) pairs in use
+        """
+        rows = []
+        link_keys = set()
+        for item in items:
+            # Convert any list/dict properties to JSON strings
+            props = {
+                key: orjson.dumps(value).decode() if isinstance(value, (list, dict)) else value
+                for key, value in item["action_item"].items()
+            }
+            row: Dict[str, Any] = {"props": props, "projects": list(item.get("projects", []))}
+            
+            # Group people by relationship type and identifying property
+            for person_identifier, relationship_type in item.get("people", []):
+                is_email = '@' in person_identifier and '.' in person_identifier
+                key = (relationship_type, "email" if is_email else "name")
+                link_keys.add(key)
+                row.setdefault(f"{key[0]}_{key[1]}", []).append(person_identifier)
+            
+            rows.append(row)
+        
+        return rows, link_keys
+    
+    def _link_clauses(self, link_keys: Set[Tuple[str, str]]) -> List[str]:
+        """
+        Build the clauses linking each row's action item to its people and projects.
+        
+        Args:
+            link_keys: The (relationship type, person property) pairs in use
+            
+        Returns:
+            List of FOREACH clauses, one per relationship type / person property
+        """
+        clauses = [
+            f"FOREACH (key IN coalesce(row.{relationship_type}_{person_property}, []) | "
+            f"MERGE (p:Person {{{person_property}: key}}) "
+            f"MERGE (a)-[:{relationship_type}]->(p))"
+            for relationship_type, person_property in sorted(link_keys)
+        ]
+        clauses.append(
+            "FOREACH (name IN row.projects | "
+            "MERGE (p:Project {name: name}) "
+            "MERGE (a)-[:BELONGS_TO]->(p))"
+        )
+        return clauses
+    
     def link_action_to_person(self, action_id: str, person_identifier: str, 
                              relationship_type: str = "ASSIGNED_TO") -> None:
         """
@@ -177,14 +415,55 @@ class Neo4jManager:
                 for key, value in item.items():
                     if isinstance(value, str) and (value.startswith('[') or value.startswith('{')):
                         try:
-                            item[key] = json.loads(value)
-                        except json.JSONDecodeError:
+                            item[key] = orjson.loads(value)
+                        except orjson.JSONDecodeError:
                             pass  # Keep as string if it's not valid JSON
                 
                 action_items.append(item)
                 
             return action_items
     
+    def get_pending_summary(self) -> List[Dict[str, Any]]:
+        """
+        Get all pending action items with their projects and assignees in one query.
+        
+        Returns:
+            List of dictionaries, one per action item
+                - item: The action item properties
+                - projects: Names of the projects the item belongs to
+                - assignees: Assigned people (email preferred, name as fallback)
+        """
+        # Collect projects before matching people so the two do not multiply
+        with self.get_session() as session:
+            result = session.run("""
+                MATCH (a:ActionItem {status: $status})
+                OPTIONAL MATCH (a)-[:BELONGS_TO]->(p:Project)
+                WITH a, collect(DISTINCT p.name) AS projects
+                OPTIONAL MATCH (a)-[:ASSIGNED_TO]->(person:Person)
+                RETURN a, projects, collect(DISTINCT coalesce(person.email, person.name)) AS assignees
+                ORDER BY a.priority, a.created_at
+            """, {"status": "pending"})
+            
+            rows = []
+            for record in result:
+                item = dict(record["a"])
+                
+                # Deserialize any JSON strings back to Python objects
+                for key, value in item.items():
+                    if isinstance(value, str) and (value.startswith('[') or value.startswith('{')):
+                        try:
+                            item[key] = orjson.loads(value)
+                        except orjson.JSONDecodeError:
+                            pass  # Keep as string if it's not valid JSON
+                
+                rows.append({
+                    "item": item,
+                    "projects": list(record["projects"]),
+                    "assignees": list(record["assignees"])
+                })
+            
+            return rows
+    
     def get_projects_for_action_item(self, action_id: str) -> List[str]:
         """
         Get all projects related to an action item.
@@ -334,8 +613,8 @@ class Neo4jManager:
                 for key, value in item.items():
                     if isinstance(value, str) and (value.startswith('[') or value.startswith('{')):
                         try:
-                            item[key] = json.loads(value)
-                        except json.JSONDecodeError:
+                            item[key] = orjson.loads(value)
+                        except orjson.JSONDecodeError:
                             pass
                 
                 action_items.append(item)
@@ -4,8 +4,6 @@ Google Secret Manager interface for ICAP.
 import os
 import logging
 from typing import Optional, Dict, Any
-from google.cloud import secretmanager
-from google.oauth2 import service_account
 
 logger = logging.getLogger("icap.secrets")
 
@@ -28,8 +26,14 @@ class SecretsManager:
                 "Project ID not provided and GOOGLE_CLOUD_PROJECT environment variable not set"
             )
         
+        # Imported here so that importing this module (e.g. through env_loader)
+        # does not load the gRPC and protobuf stack until a client is needed
+        from google.cloud import secretmanager
+        
         # Set up client with credentials if provided
         if credentials_path:
+            from google.oauth2 import service_account
+            
             credentials = service_account.Credentials.from_service_account_file(
                 credentials_path,
                 scopes=["https://www.googleapis.com/auth/cloud-platform"]
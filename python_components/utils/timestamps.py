@@ -0,0 +1,22 @@
+"""
+Timestamp serialization helpers for ICAP.
+"""
+from datetime import datetime
+from typing import Union
+
+def parse_timestamp(value: Union[str, int, float, datetime]) -> datetime:
+    """
+    Convert a serialized timestamp to a naive local datetime.
+    
+    Args:
+        value: ISO 8601 string, epoch seconds, or an existing datetime
+    
+    Returns:
+        The timestamp as a datetime
+    """
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    if isinstance(value, (int, float)):
+        # Epoch seconds skip string parsing altogether
+        return datetime.fromtimestamp(value)
+    return value
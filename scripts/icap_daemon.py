@@ -178,6 +178,13 @@ def main():
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
     
+    # Use uvloop's event loop implementation when it is installed
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    
     # Start the event loop
     global loop
     loop = asyncio.new_event_loop()